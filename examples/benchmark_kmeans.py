@@ -0,0 +1,43 @@
+from rum.density import OnlineKMeansEstimator
+from rum.geometry import EuclideanGeometry
+import argparse
+import torch
+import time
+
+# BENCHMARK
+KS = [100, 1000, 5000, 20000]
+N_STATES = 1000
+DIM = 3
+SEED = 0
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ks', '-k', type=int, nargs='+', default=KS)
+    parser.add_argument('--n-states', '-n', type=int, default=N_STATES)
+    parser.add_argument('--dim', '-d', type=int, default=DIM)
+    return parser.parse_args()
+
+
+def learn_throughput(k: int, states: torch.Tensor, **kwargs) -> float:
+    torch.manual_seed(SEED)
+    kmeans = OnlineKMeansEstimator(k, states.shape[1], geometry=EuclideanGeometry(states.shape[1]), **kwargs)
+    time_start = time.time()
+    kmeans.learn(states)
+    return states.shape[0] / (time.time() - time_start) # states per second
+
+
+if __name__ == '__main__':
+    args = get_args()
+    print(args)
+    torch.manual_seed(SEED)
+    states = 2 * torch.rand((args.n_states, args.dim)) - 1
+
+    print(f'{"k":>8} {"dense (states/s)":>17} {"scan (states/s)":>16} {"index (states/s)":>17}')
+    for k in args.ks:
+        # The (k, k) matrix of dense diameters is only kept for small k.
+        dense = learn_throughput(k, states, use_index=False, dense_diameters=True) \
+            if k <= OnlineKMeansEstimator.DENSE_MAX_K else float('nan')
+        scan = learn_throughput(k, states, use_index=False, dense_diameters=False)
+        index = learn_throughput(k, states, use_index=True)
+        print(f'{k:>8} {dense:>17.1f} {scan:>16.1f} {index:>17.1f}')
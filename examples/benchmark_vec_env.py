@@ -0,0 +1,53 @@
+from rum.environment import load, GymnasiumWrapper, SharedMemoryVecEnv
+import gymnasium
+import functools
+import argparse
+import numpy as np
+import time
+
+# BENCHMARK
+DOMAIN_NAME = 'humanoid'
+TASK_NAME = 'run'
+N_ENVS = 16
+N_WORKERS = [1, 2, 4, 8, 16]
+N_STEPS = 500
+SEED = 0
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--domain-name', '-d', type=str, default=DOMAIN_NAME)
+    parser.add_argument('--task-name', '-t', type=str, default=TASK_NAME)
+    parser.add_argument('--n-envs', '-e', type=int, default=N_ENVS)
+    parser.add_argument('--n-workers', '-w', type=int, nargs='+', default=N_WORKERS)
+    parser.add_argument('--n-steps', '-n', type=int, default=N_STEPS)
+    return parser.parse_args()
+
+
+def make_env(domain_name: str, task_name: str, seed: int) -> GymnasiumWrapper:
+    return GymnasiumWrapper(load(domain_name, task_name, task_kwargs={'random': seed}))
+
+
+def step_throughput(env: gymnasium.vector.VectorEnv, n_steps: int) -> float:
+    np.random.seed(SEED)
+    actions = np.random.uniform(-1.0, 1.0, (n_steps,) + env.action_space.shape)
+    env.reset(seed=SEED)
+    time_start = time.time()
+    for action in actions:
+        env.step(action)
+    steps_per_second = n_steps * env.num_envs / (time.time() - time_start)
+    env.close()
+    return steps_per_second
+
+
+if __name__ == '__main__':
+    args = get_args()
+    print(args)
+    env_fns = [functools.partial(make_env, args.domain_name, args.task_name, SEED + i) for i in range(args.n_envs)]
+
+    # Baseline with one process per environment, observations and actions pickled through pipes.
+    pipes = step_throughput(gymnasium.vector.AsyncVectorEnv(env_fns), args.n_steps)
+    print(f'{"workers":>8} {"shared memory (steps/s)":>24} {"pipes (steps/s)":>16}')
+    for n_workers in args.n_workers:
+        shared = step_throughput(SharedMemoryVecEnv(env_fns, n_workers), args.n_steps)
+        print(f'{n_workers:>8} {shared:>24.1f} {pipes:>16.1f}')
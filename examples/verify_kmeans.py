@@ -0,0 +1,99 @@
+from rum.density import OnlineKMeansEstimator
+from rum.geometry import EuclideanGeometry
+import argparse
+import torch
+import sys
+
+# VERIFICATION
+# Diameters maintained by sequential and minibatch learning, and simulated by simulate_step,
+# against an exact recomputation by _diameters_pairwise, with and without the dense distance matrix.
+# Batched entropy changes of simulate_entropy_delta against the entropy of simulate_step's diameters.
+KS = [50, 500]
+DIMS = [3, 8]
+PATHS = ['sequential', 'minibatch', 'simulate', 'entropy_delta']
+N_STATES = 2000
+N_SIMULATIONS = 50
+N_CHECKS = 4
+SEED = 0
+TOLERANCE = 1e-5
+DELTA_TOLERANCE = 1e-4
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ks', '-k', type=int, nargs='+', default=KS)
+    parser.add_argument('--n-states', '-n', type=int, default=N_STATES)
+    return parser.parse_args()
+
+
+def exact(kmeans: OnlineKMeansEstimator) -> OnlineKMeansEstimator:
+    # Copy of the k-means state with its neighbours recomputed from scratch.
+    other = kmeans._copy_state()
+    other._diameters_pairwise()
+    return other
+
+
+def n_differences(diameters: torch.Tensor, expected: torch.Tensor) -> int:
+    return int(((diameters - expected).abs() > TOLERANCE * expected.abs().clamp(min=1)).sum())
+
+
+def n_mismatches(kmeans: OnlineKMeansEstimator) -> int:
+    # Diameters, and second closest distances where flagged exact, that differ from the recomputation.
+    reference = exact(kmeans)
+    second = torch.where(kmeans.second_exact, kmeans.second, reference.second)
+    return n_differences(kmeans.diameters, reference.diameters) + n_differences(second, reference.second)
+
+
+def simulated_mismatches(kmeans: OnlineKMeansEstimator, states: torch.Tensor) -> int:
+    # Simulated diameters against the diameters of a copy actually stepped on each state.
+    mismatches = 0
+    for state in states:
+        other = kmeans._copy_state()
+        _, closest_idx = other._find_closest_cluster(state.unsqueeze(0))
+        other.centroids[closest_idx] = other._compute_centroid_pos(state, closest_idx)
+        mismatches += n_differences(kmeans.simulate_step(state), exact(other).diameters)
+    return mismatches
+
+
+def entropy_delta_mismatches(kmeans: OnlineKMeansEstimator, states: torch.Tensor) -> int:
+    # Batched entropy changes against the entropy of each simulated step, in double precision.
+    deltas = kmeans.simulate_entropy_delta(states).double()
+    current = kmeans.entropy_lb(kmeans.diameters.double())
+    expected = torch.stack([kmeans.entropy_lb(kmeans.simulate_step(state).double()) - current for state in states])
+    return int(((deltas - expected).abs() > DELTA_TOLERANCE * expected.abs().clamp(min=1)).sum())
+
+
+def verify(k: int, dim: int, path: str, dense: bool, homeostasis: bool, n_states: int) -> int:
+    torch.manual_seed(SEED)
+    mode = 'minibatch' if path == 'minibatch' else 'sequential'
+    kmeans = OnlineKMeansEstimator(k, dim, geometry=EuclideanGeometry(dim), mode=mode, homeostasis=homeostasis,
+                                   dense_diameters=dense)
+    states = torch.cumsum(0.05 * torch.randn((n_states, dim)), dim=0)
+    mismatches = 0
+    for batch in states.split(n_states // N_CHECKS):
+        kmeans.learn(batch)
+        queries = batch[torch.randint(0, batch.shape[0], (N_SIMULATIONS,))] + 0.01 * torch.randn((N_SIMULATIONS, dim))
+        if path == 'simulate':
+            mismatches += simulated_mismatches(kmeans, queries)
+        elif path == 'entropy_delta':
+            mismatches += entropy_delta_mismatches(kmeans, queries)
+        else:
+            mismatches += n_mismatches(kmeans)
+    return mismatches
+
+
+if __name__ == '__main__':
+    args = get_args()
+    print(args)
+    failed = False
+    for k in args.ks:
+        for dim in DIMS:
+            for path in PATHS:
+                for dense in [True, False]:
+                    for homeostasis in [True, False]:
+                        mismatches = verify(k, dim, path, dense, homeostasis, args.n_states)
+                        print(f'{k:>6} dim {dim:>2} {path:<13} {"dense" if dense else "sparse":<6} '
+                              f'{"homeostasis" if homeostasis else "plain":<11} '
+                              f'{"exact" if mismatches == 0 else f"MISMATCH ({mismatches})"}')
+                        failed = failed or mismatches > 0
+    sys.exit(1 if failed else 0)
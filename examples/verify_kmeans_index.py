@@ -0,0 +1,96 @@
+from rum.density import OnlineKMeansEstimator
+from rum.geometry import EuclideanGeometry, MetricGeometry
+from rum.manifold import SphereManifold
+import argparse
+import torch
+import sys
+
+# VERIFICATION
+# Closest centroid lookups and diameters maintained through the centroid index against the linear scan,
+# under each geometry the index supports.
+KS = [50, 500, 3000]
+DIMS = [3, 8]
+GEOMETRIES = ['euclidean', 'metric', 'sphere']
+BALANCING_STRENGTHS = [0.1, 1.0]
+N_STATES = 2000
+N_QUERIES = 200
+N_CHECKS = 4
+SEED = 0
+TOLERANCE = 1e-5
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ks', '-k', type=int, nargs='+', default=KS)
+    parser.add_argument('--n-states', '-n', type=int, default=N_STATES)
+    return parser.parse_args()
+
+
+def make_geometry(name: str, dim: int):
+    if name == 'euclidean':
+        return EuclideanGeometry(dim)
+    if name == 'metric': # A skewed, low rank Mahalanobis metric rather than the Euclidean initialization.
+        geometry = MetricGeometry(dim, rank=dim - 1)
+        with torch.no_grad():
+            geometry.network.weight.copy_(torch.eye(dim - 1, dim) + 0.5 * torch.randn((dim - 1, dim)))
+        geometry.version += 1
+        return geometry
+    return SphereManifold(dim, {'name': 'uniform'})
+
+
+def distances(kmeans: OnlineKMeansEstimator, x: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+    # Exact distances of the geometry, in double precision where it computes them, shape: (B1, B2)
+    return kmeans.geometry.distance_matrix(x.double(), y.double()).double()
+
+
+def linear_scan(kmeans: OnlineKMeansEstimator, queries: torch.Tensor) -> torch.Tensor:
+    # Exact weighted distances to all centroids, shape: (B, k)
+    d = distances(kmeans, queries, kmeans.centroids)
+    bias = kmeans._homeostasis_bias()
+    return d if bias is None else d + bias.double()
+
+
+def verify(k: int, dim: int, bs: float, geometry: str, n_states: int) -> int:
+    # Number of queries and neighbour lists that differ from the linear scan.
+    torch.manual_seed(SEED)
+    kmeans = OnlineKMeansEstimator(k, dim, geometry=make_geometry(geometry, dim), balancing_strength=bs,
+                                   use_index=True)
+    states = torch.cumsum(0.05 * torch.randn((n_states, dim)), dim=0)
+    if geometry == 'sphere': # Random walk projected on the sphere.
+        states = states / torch.norm(states, dim=1, keepdim=True)
+    n_mismatches = 0
+    for batch in states.split(n_states // N_CHECKS):
+        kmeans.learn(batch)
+
+        # Lookups: same weighted distance as the best of the scan, thus same centroid up to ties
+        queries = batch[torch.randint(0, batch.shape[0], (N_QUERIES,))] + 0.01 * torch.randn((N_QUERIES, dim))
+        if geometry == 'sphere':
+            queries = queries / torch.norm(queries, dim=1, keepdim=True)
+        expected = linear_scan(kmeans, queries).min(dim=1).values
+        for query, best in zip(queries, expected):
+            distance, _ = kmeans._find_closest_cluster(query.unsqueeze(0))
+            n_mismatches += int(abs(distance.item() - best.item()) > TOLERANCE * max(1., abs(best.item())))
+
+        # Diameters and closest centroids, second closest ones where flagged exact
+        d = distances(kmeans, kmeans.centroids, kmeans.centroids)
+        d.fill_diagonal_(float('inf'))
+        top = torch.topk(d, 2, dim=1, largest=False).values
+        diameters_ok = (kmeans.diameters.double() - top[:, 0]).abs() <= TOLERANCE * top[:, 0].clamp(min=1)
+        second_ok = ~kmeans.second_exact | ((kmeans.second.double() - top[:, 1]).abs() <= TOLERANCE * top[:, 1].clamp(min=1))
+        n_mismatches += int((~diameters_ok | ~second_ok).sum())
+    return n_mismatches
+
+
+if __name__ == '__main__':
+    args = get_args()
+    print(args)
+    failed = False
+    for k in args.ks:
+        for dim in DIMS:
+            for bs in BALANCING_STRENGTHS:
+                for geometry in GEOMETRIES:
+                    n_mismatches = verify(k, dim, bs, geometry, args.n_states)
+                    print(f'{k:>6} dim {dim:>2} bs {bs:<4} {geometry:<9} '
+                          f'{"exact" if n_mismatches == 0 else f"MISMATCH ({n_mismatches})"}')
+                    failed = failed or n_mismatches > 0
+    sys.exit(1 if failed else 0)
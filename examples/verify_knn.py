@@ -0,0 +1,85 @@
+from rum.density import KNNDensityEstimator
+import argparse
+import torch
+import sys
+
+# VERIFICATION
+# The maintained entropy and simulated entropy changes of the kNN estimator against brute force,
+# while its buffer fills up from empty, i.e. with fewer points than neighbours.
+K = 8
+CAPACITY = 12
+DIM = 3
+N_QUERIES = 16
+POLICIES = ['random', 'ring', 'reservoir']
+SEED = 0
+TOLERANCE = 1e-4
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--k', '-k', type=int, default=K)
+    parser.add_argument('--capacity', '-c', type=int, default=CAPACITY)
+    parser.add_argument('--dim', '-d', type=int, default=DIM)
+    return parser.parse_args()
+
+
+def brute_entropy(knn: KNNDensityEstimator, buffer: torch.Tensor) -> torch.Tensor:
+    # Each point is its own first neighbour, the buffer may hold fewer than k points.
+    if buffer.size(0) == 0:
+        return torch.tensor(0.)
+    d = torch.cdist(buffer.double(), buffer.double()).pow(2) # shape: (bsize, bsize)
+    n = min(knn.k, buffer.size(0))
+    sums = torch.topk(d, n, dim=1, largest=False).values.sum(dim=1)
+    return torch.sum(knn.entropic_func((1.0 / knn.k) * sums)).float()
+
+
+def brute_deltas(knn: KNNDensityEstimator, states: torch.Tensor, lost: torch.Tensor,
+                 stored: torch.Tensor) -> torch.Tensor:
+    # Entropy change of inserting each state alone, replacing the slot the buffer policy would lose.
+    buffer = knn.buffer
+    current = brute_entropy(knn, buffer)
+    deltas = torch.zeros(states.size(0))
+    for b in range(states.size(0)):
+        if not stored[b]:
+            continue
+        keep = torch.arange(buffer.size(0)) != lost[b]
+        deltas[b] = brute_entropy(knn, torch.cat((buffer[keep], states[b:b+1]))) - current
+    return deltas
+
+
+def verify(policy: str, k: int, capacity: int, dim: int) -> int:
+    # Number of buffer sizes at which the estimator is not finite or differs from brute force.
+    torch.manual_seed(SEED)
+    knn = KNNDensityEstimator(k, dim, capacity, policy=policy)
+    failures = 0
+    for size in range(capacity + 2):
+        queries = torch.rand(N_QUERIES, dim)
+        state = torch.random.get_rng_state()
+        deltas = knn.simulate_entropy_delta(queries)
+        torch.random.set_rng_state(state)
+        lost, stored = knn.store.simulate_insert(N_QUERIES)
+        expected = brute_deltas(knn, queries, lost, stored)
+        entropy, expected_entropy = knn.entropy(), brute_entropy(knn, knn.buffer)
+        pdf = knn.pdf_approx(queries)
+        errors = [
+            not torch.isfinite(entropy) or abs(entropy - expected_entropy) > TOLERANCE * max(1, abs(expected_entropy)),
+            not torch.isfinite(deltas).all() or (deltas - expected).abs().max() > TOLERANCE,
+            not torch.isfinite(pdf).all(),
+        ]
+        if any(errors):
+            print(f'  size {knn.buffer_size}: entropy {entropy.item():.6f} vs {expected_entropy.item():.6f}, '
+                  f'max delta error {(deltas - expected).abs().max().item():.2e}, finite pdf {torch.isfinite(pdf).all().item()}')
+            failures += 1
+        knn.learn(torch.rand(1, dim))
+    return failures
+
+
+if __name__ == '__main__':
+    args = get_args()
+    print(args)
+    failed = False
+    for policy in POLICIES:
+        n_failures = verify(policy, args.k, args.capacity, args.dim)
+        print(f'{policy:>10} {"exact" if n_failures == 0 else "MISMATCH"}')
+        failed = failed or n_failures > 0
+    sys.exit(1 if failed else 0)
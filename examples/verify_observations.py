@@ -0,0 +1,138 @@
+from rum.environment import load
+from dm_control.mujoco.wrapper.mjbindings import enums
+import argparse
+import numpy as np
+import sys
+
+# VERIFICATION
+# The index-based physics features of the custom domains against the named field lookups they replace.
+TASKS = [('humanoid', 'run'), ('walker', 'run'), ('quadruped', 'run'), ('quadruped', 'fetch'), ('quadruped', 'escape')]
+N_STEPS = 200
+SEED = 0
+TOES = ['toe_front_left', 'toe_back_left', 'toe_back_right', 'toe_front_right']
+BALL_FEATURES = ['ball_state', 'target_position', 'ball_to_target_distance', 'self_to_ball_distance']
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-steps', '-n', type=int, default=N_STEPS)
+    return parser.parse_args()
+
+
+def sensor_names(physics, *sensor_types):
+    [sensor_ids] = np.where(np.in1d(physics.model.sensor_type, sensor_types))
+    return [physics.model.id2name(s_id, 'sensor') for s_id in sensor_ids]
+
+
+def torso_frame(data):
+    return data.xmat['torso'].reshape(3, 3)
+
+
+def humanoid_features(physics) -> dict:
+    data = physics.named.data
+    extremities = [(data.xpos[side + limb] - data.xpos['torso']).dot(torso_frame(data))
+                   for side in ('left_', 'right_') for limb in ('hand', 'foot')]
+    return {
+        'torso_upright': data.xmat['torso', 'zz'],
+        'head_height': data.xpos['head', 'z'],
+        'center_of_mass_position': data.subtree_com['torso'].copy(),
+        'center_of_mass_velocity': data.sensordata['torso_subtreelinvel'].copy(),
+        'torso_vertical_orientation': data.xmat['torso', ['zx', 'zy', 'zz']],
+        'extremities': np.hstack(extremities),
+    }
+
+
+def walker_features(physics) -> dict:
+    data = physics.named.data
+    return {
+        'torso_upright': data.xmat['torso', 'zz'],
+        'torso_height': data.xpos['torso', 'z'],
+        'horizontal_velocity': data.sensordata['torso_subtreelinvel'][0],
+        'orientations': data.xmat[1:, ['xx', 'xz']].ravel(),
+    }
+
+
+def quadruped_features(physics, task_name: str) -> dict:
+    data = physics.named.data
+    [hinge_ids] = np.nonzero(physics.model.jnt_type == enums.mjtJoint.mjJNT_HINGE)
+    hinges = [physics.model.id2name(j_id, 'joint') for j_id in hinge_ids]
+    features = {
+        'torso_upright': np.asarray(data.xmat['torso', 'zz']),
+        'torso_velocity': data.sensordata['velocimeter'].copy(),
+        'egocentric_state': np.hstack((data.qpos[hinges], data.qvel[hinges], physics.data.act)),
+        'toe_positions': (data.xpos[TOES] - data.xpos['torso']).dot(torso_frame(data)),
+        'force_torque': np.arcsinh(data.sensordata[sensor_names(
+            physics, enums.mjtSensor.mjSENS_FORCE, enums.mjtSensor.mjSENS_TORQUE)]),
+        'imu': data.sensordata[sensor_names(
+            physics, enums.mjtSensor.mjSENS_GYRO, enums.mjtSensor.mjSENS_ACCELEROMETER)],
+        'origin_distance': np.asarray(np.linalg.norm(data.site_xpos['workspace'])),
+        'origin': -data.xpos['torso'].dot(torso_frame(data)),
+    }
+    if task_name == 'escape': # The only model with rangefinders.
+        rf_readings = data.sensordata[sensor_names(physics, enums.mjtSensor.mjSENS_RANGEFINDER)]
+        features['rangefinder'] = np.where(rf_readings == -1.0, 1.0, np.tanh(rf_readings))
+    if task_name == 'fetch':
+        ball_state = np.vstack((data.xpos['ball'] - data.xpos['torso'],
+                                data.qvel['ball_root'][:3] - data.qvel['root'][:3],
+                                data.qvel['ball_root'][3:]))
+        features['ball_state'] = ball_state.dot(torso_frame(data)).ravel()
+        features['target_position'] = (data.site_xpos['target'] - data.xpos['torso']).dot(torso_frame(data))
+        features['ball_to_target_distance'] = np.linalg.norm((data.site_xpos['target'] - data.xpos['ball'])[:2])
+        features['self_to_ball_distance'] = np.linalg.norm((data.site_xpos['workspace'] - data.xpos['ball'])[:2])
+    return features
+
+
+def named_features(physics, domain_name: str, task_name: str) -> dict:
+    if domain_name == 'humanoid':
+        return humanoid_features(physics)
+    if domain_name == 'walker':
+        return walker_features(physics)
+    return quadruped_features(physics, task_name)
+
+
+def missing_raises(physics, domain_name: str, task_name: str) -> list:
+    # Features of elements missing from the model that do not raise, as the named lookups did.
+    if domain_name != 'quadruped' or task_name == 'fetch':
+        return []
+    silent = []
+    for name in BALL_FEATURES:
+        try:
+            getattr(physics, name)()
+            silent.append(name)
+        except KeyError:
+            pass
+    return silent
+
+
+def verify(domain_name: str, task_name: str, n_steps: int) -> int:
+    # Number of features differing from the named version in any bit over a random rollout,
+    # or reading a missing element without raising.
+    env = load(domain_name, task_name, task_kwargs={'random': SEED})
+    random = np.random.RandomState(SEED)
+    spec = env.action_spec()
+    env.reset()
+    mismatches = set()
+    for _ in range(n_steps):
+        time_step = env.step(random.uniform(spec.minimum, spec.maximum))
+        for name, expected in named_features(env.physics, domain_name, task_name).items():
+            value = getattr(env.physics, name)()
+            if np.shape(value) != np.shape(expected) or \
+               np.asarray(value).tobytes() != np.asarray(expected).tobytes():
+                mismatches.add(name)
+        if time_step.last():
+            env.reset()
+    mismatches.update(missing_raises(env.physics, domain_name, task_name))
+    for name in sorted(mismatches):
+        print(f'  {name} differs')
+    return len(mismatches)
+
+
+if __name__ == '__main__':
+    args = get_args()
+    print(args)
+    failed = False
+    for domain_name, task_name in TASKS:
+        n_mismatches = verify(domain_name, task_name, args.n_steps)
+        print(f'{domain_name + " " + task_name:>16} {"bit-identical" if n_mismatches == 0 else "MISMATCH"}')
+        failed = failed or n_mismatches > 0
+    sys.exit(1 if failed else 0)
@@ -6,6 +6,8 @@ from omegaconf import OmegaConf
 from util.logger import Logger
 from util.make import make, make_environment
 from util.resolver import init_resolver
+from util.vec_env import SB3VecEnv
+from rum.manifold import ManifoldVecEnv
 import stable_baselines3 as sb3
 import numpy as np
 
@@ -13,6 +15,10 @@ init_resolver()
 
 @hydra.main(config_path='config', config_name='run', version_base='1.3')
 def main(cfg):
+  # Chains split the samples of an iteration evenly, none are dropped.
+  if cfg.sampling_method == 'random_walk' and cfg.samples_per_iter % cfg.n_chains != 0:
+    raise ValueError('samples_per_iter ({}) must be a multiple of n_chains ({}).'.format(cfg.samples_per_iter, cfg.n_chains))
+
   # Init config and logging.
   wandb_cfg = OmegaConf.to_container(cfg, resolve=True)
   wandb.init(project='test', config=wandb_cfg, dir=os.getcwd(), id=cfg.name, name=cfg.name)
@@ -38,7 +44,10 @@ def main(cfg):
     rewarder = None # Default is not using intrinsic rewards. 
   if cfg.sampling_method == 'reinforcement_learning':
     # assert agent is None or cfg.n_envs % cfg.samples_per_iter == 0
-    vec_env = sb3.common.vec_env.SubprocVecEnv([lambda: environment for _ in range(cfg.n_envs)])
+    if environment is manifold: # Manifold steps are a few numpy ops, batched in process.
+      vec_env = SB3VecEnv(ManifoldVecEnv(manifold, cfg.n_envs))
+    else:
+      vec_env = SB3VecEnv(make_environment(cfg, n_envs=cfg.n_envs, n_workers=cfg.n_workers))
     agent = sb3.PPO('MlpPolicy', vec_env, n_steps=cfg.samples_per_iter // cfg.n_envs, rewarder=rewarder) 
   else:
     agent = None
@@ -56,8 +65,14 @@ def main(cfg):
   else:
     n_iter = 0
     while n_iter * cfg.samples_per_iter < cfg.max_samples:
+      dones = None
       if cfg.sampling_method == 'random_walk':
-        samples = manifold.random_walk(cfg.samples_per_iter)
+        walks = manifold.random_walks(cfg.samples_per_iter // cfg.n_chains, cfg.n_chains) # (n_chains, n, dim)
+        samples = walks.reshape(-1, manifold.dim)
+        # Chains are stored back to back, each ends its trajectory.
+        dones = np.zeros(walks.shape[:2], dtype=bool)
+        dones[:, -1] = True
+        dones = torch.from_numpy(dones.reshape(-1))
       elif cfg.sampling_method == 'sample':
         samples = manifold.sample(cfg.samples_per_iter)
       else:
@@ -68,7 +83,7 @@ def main(cfg):
         rewarder.learn(samples_tensor)
       else:
         if geometry is not None:
-          geometry.learn(samples_tensor)
+          geometry.learn(samples_tensor, dones)
         if density is not None:
           density.learn(samples_tensor)
 
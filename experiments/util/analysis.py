@@ -34,20 +34,30 @@ def kmeans_loss(density, manifold, n=1e4, **kwargs):
   distances, _ = density._find_closest_cluster(samples)
   return density.kmeans_objective(distances).item()
 
+def minibatch_gap(density, rollouts, **kwargs):
+  return density.minibatch_gap(rollouts['states']).item()
+
+def knn_recall(density, **kwargs):
+  return density.recall()
+
+def buffer_stats(density, geometry, **kwargs):
+  stats = {}
+  if hasattr(density, 'store'):
+    stats['density'] = density.store.stats()
+  if hasattr(geometry, 'positive_sampler'):
+    stats['geometry'] = geometry.positive_sampler.samples.stats()
+  return stats
+
 def kmeans_count_variance(density, **kwargs):
   cluster_sizes = density.cluster_sizes
   return torch.var(cluster_sizes).item()
 
 def pdf_loss(manifold, density, n_points=1000, **kwargs):
   samples = manifold.sample(n_points)
-  pdf_est = np.zeros(n_points)
-  pdf_true = np.zeros(n_points)
-  for i, sample in enumerate(samples):
-    sample = torch.tensor(sample)
-    pdf_true[i] = manifold.pdf(samples)
-    pdf_est[i] = density.pdf(sample)
-    if isinstance(pdf_est[i], torch.Tensor):
-      pdf_est[i] = pdf_est[i].item()
+  pdf_true = np.asarray(manifold.pdf(samples), dtype=np.float64)
+  pdf_est = density.pdf(torch.tensor(samples, dtype=torch.float32))
+  if isinstance(pdf_est, torch.Tensor):
+    pdf_est = pdf_est.detach().cpu().numpy().astype(np.float64)
   return scale_independent_loss(pdf_true, pdf_est)
 
 def distance_loss(manifold, geometry, n_points=1000, **kwargs):
@@ -1,4 +1,5 @@
 import rum
+import functools
 from omegaconf import OmegaConf
 
 def make(cfg, _type, **kwargs):
@@ -12,15 +13,28 @@ def make(cfg, _type, **kwargs):
   cls = getattr(module, name)
   return cls(**cfg)
 
-def make_environment(cfg, **kwargs):
+def make_environment(cfg, n_envs=None, n_workers=None, index=0, **kwargs):
+  # A single environment, or a pool of n_envs copies stepped in n_workers processes.
+  # The index-th environment of a pool is seeded with the base seed + index, the task's
+  # random keyword argument if set, the run seed otherwise. Cached resets are generated with the
+  # base seed, so that environments of a pool share them.
   if 'domain_name' not in cfg['environment'] and 'task_name' not in cfg['environment']:
     print('No environment created.')
     return None
+  if n_envs is not None:
+    return rum.environment.SharedMemoryVecEnv(
+      [functools.partial(make_environment, cfg, index=i, **kwargs) for i in range(n_envs)], n_workers)
+  seed = cfg.get('seed')
   cfg = OmegaConf.to_container(cfg['environment'], resolve=True)
   cfg.update(kwargs)
   domain_name = cfg.pop('domain_name')
   task_name = cfg.pop('task_name')
-  env = rum.environment.load(domain_name, task_name, **cfg)
+  task_kwargs = dict(cfg.pop('task_kwargs', None) or {})
+  seed = task_kwargs.get('random', seed)
+  if isinstance(seed, int):
+    task_kwargs['random'] = seed + index
+    cfg.setdefault('reset_cache_seed', seed)
+  env = rum.environment.load(domain_name, task_name, task_kwargs=task_kwargs, **cfg)
   env = rum.environment.GymnasiumWrapper(env)
   return env
 
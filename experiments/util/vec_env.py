@@ -0,0 +1,49 @@
+import numpy as np
+from stable_baselines3.common.vec_env import VecEnv
+
+class SB3VecEnv(VecEnv):
+  # Exposes a gymnasium VectorEnv to stable-baselines3, which expects its own VecEnv interface.
+  def __init__(self, env):
+    self.env = env
+    self._seed = None
+    super(SB3VecEnv, self).__init__(env.num_envs, env.single_observation_space, env.single_action_space)
+
+  def reset(self):
+    obs, _ = self.env.reset(seed=self._seed)
+    self._seed = None
+    return obs
+
+  def step_async(self, actions):
+    self.env.step_async(actions)
+
+  def step_wait(self):
+    obs, rewards, terminated, truncated, info = self.env.step_wait()
+    dones = terminated | truncated
+    infos = [{} for _ in range(self.num_envs)]
+    final_obs = info.get('final_observation', obs) # Environments reset automatically return it apart.
+    for i in np.flatnonzero(dones): # sb3 expects the last observation before the reset
+      infos[i]['terminal_observation'] = final_obs[i]
+      infos[i]['TimeLimit.truncated'] = bool(truncated[i] and not terminated[i])
+    return obs, rewards.astype(np.float32), dones, infos
+
+  def seed(self, seed=None):
+    self._seed = seed
+    return [seed] * self.num_envs
+
+  def close(self):
+    self.env.close()
+
+  def get_attr(self, attr_name, indices=None):
+    return [self.env.get_attr(attr_name)[i] for i in self._get_indices(indices)]
+
+  def set_attr(self, attr_name, value, indices=None):
+    # Environments of a ManifoldVecEnv share one manifold, a subset of indices sets the attribute for all.
+    indices = list(self._get_indices(indices))
+    self.env.set_attr(attr_name, [value] * len(indices), indices=indices)
+
+  def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+    # Dispatched to the environments themselves, in their workers for a SharedMemoryVecEnv.
+    return list(self.env.call(method_name, *method_args, indices=list(self._get_indices(indices)), **method_kwargs))
+
+  def env_is_wrapped(self, wrapper_class, indices=None):
+    return [False for _ in self._get_indices(indices)]
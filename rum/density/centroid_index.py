@@ -0,0 +1,204 @@
+from rum.geometry import Geometry
+from torch import Tensor, LongTensor
+from typing import List, Optional, Tuple
+import math
+import torch
+
+
+class CentroidIndex():
+    """
+    Coarse cell list over the k-means centroids for sublinear closest centroid lookups and sparse diameter updates.
+    Centroids are grouped in cells around coarse centers, themselves centroids, each cell keeping a covering radius,
+    a lower bound on the cluster sizes of its members and an upper bound on their second closest centroid distance.
+    Cells whose triangle-inequality lower bound cannot beat the best candidate are skipped,
+    so results are exact for any geometry whose distance is a metric, see
+    OnlineKMeansEstimator.INDEXABLE_GEOMETRIES. Coarse centers are placed with ambient Euclidean
+    distances, which only affects how tight the cells are, bounds use the geometry's distances.
+    Moving a centroid only grows the bounds of its cell; cells are rebuilt periodically.
+    """
+
+    SLACK = 1e-5 # relative slack on bounds against float rounding of distances
+
+    def __init__(
+        self,
+        geometry: Geometry,
+        centroids: Tensor,
+        cluster_sizes: Tensor,
+        second: Tensor,
+        n_cells: Optional[int] = None,
+        rebuild_every: Optional[int] = None,
+        n_iter: int = 2,
+    ) -> None:
+        k = centroids.shape[0]
+        self.geometry = geometry
+        self.n_cells: int = n_cells if n_cells is not None else max(1, int(math.sqrt(k)))
+        self.rebuild_every: int = rebuild_every if rebuild_every is not None else k
+        self.n_iter: int = n_iter
+        if not 0 < self.n_cells <= k:
+            raise ValueError("Number of cells must be in the range (0, k]")
+        if self.rebuild_every <= 0:
+            raise ValueError("Rebuild frequency must be greater than 0")
+
+        # Logging for experiments
+        self.n_visited = 0
+        self.n_rebuilds = 0
+
+        self.build(centroids, cluster_sizes, second)
+
+
+    @property
+    def stale(self) -> bool:
+        return self.n_updates >= self.rebuild_every
+
+
+    def build(self, centroids: Tensor, cluster_sizes: Tensor, second: Tensor) -> None:
+        """
+        WARNING: Updates internal state of current object.
+        (Re)builds the cells from scratch given current centroids
+        Params: centroids: (k, dim) cluster_sizes: (k,) second: (k,) second closest centroid distances
+        Time-complexity: O(n_iter * k * n_cells * dim)
+        """
+        k = centroids.shape[0]
+        coarse = centroids[torch.randperm(k, device=centroids.device)[:self.n_cells]] # (n_cells, dim)
+        for _ in range(self.n_iter):
+            # Lloyd refinement of coarse centers tightens the cell radii,
+            # centers are then snapped to a centroid to remain valid points of the geometry.
+            cell = torch.argmin(torch.cdist(centroids, coarse), dim=1) # (k,)
+            counts = torch.bincount(cell, minlength=self.n_cells).unsqueeze(1) # (n_cells, 1)
+            sums = torch.zeros_like(coarse).index_add_(0, cell, centroids) # (n_cells, dim)
+            coarse = torch.where(counts > 0, sums / counts.clamp(min=1), coarse)
+            coarse = centroids[torch.argmin(torch.cdist(coarse, centroids), dim=1)]
+        self.coarse: Tensor = coarse.clone() # (n_cells, dim)
+
+        d = self.geometry.distance_matrix(centroids, self.coarse) # (k, n_cells)
+        dist, cell = torch.min(d, dim=1) # (k,)
+        self.cell_of: LongTensor = cell # (k,)
+        # Empty cells are never visited: -inf radius and second closest distance, no size bias.
+        self.radii: Tensor = torch.full((self.n_cells,), -float('inf'), dtype=dist.dtype, device=dist.device)
+        self.radii.scatter_reduce_(0, cell, dist * (1 + self.SLACK), reduce='amax') # (n_cells,)
+        self.max_second: Tensor = torch.full_like(self.radii, -float('inf'))
+        self.max_second.scatter_reduce_(0, cell, second.to(dist.dtype), reduce='amax') # (n_cells,)
+        self.min_sizes: Tensor = torch.zeros(self.n_cells, dtype=cluster_sizes.dtype, device=cluster_sizes.device)
+        self.min_sizes.scatter_reduce_(0, cell, cluster_sizes, reduce='amin', include_self=False) # (n_cells,)
+
+        order = torch.argsort(cell)
+        counts = torch.bincount(cell, minlength=self.n_cells).tolist()
+        self.members: List[LongTensor] = list(torch.split(order, counts))
+
+        self.n_updates = 0
+        self.n_rebuilds += 1
+
+
+    def clone(self) -> 'CentroidIndex':
+        """
+        Copies the cells, sharing the geometry
+        Returns: (CentroidIndex) copy
+        Time-complexity: O(k)
+        """
+        other = CentroidIndex.__new__(CentroidIndex)
+        other.__dict__.update(self.__dict__)
+        for name in ['coarse', 'cell_of', 'radii', 'max_second', 'min_sizes']:
+            setattr(other, name, getattr(self, name).clone())
+        return other
+
+
+    def moved(self, idx: LongTensor, centroids: Tensor, cluster_sizes: Tensor) -> None:
+        """
+        WARNING: Updates internal state of current object.
+        Accounts for centroids that moved and grew, keeping the bounds of their cells valid
+        Params: idx: (U,) indices of moved centroids centroids: (k, dim) cluster_sizes: (k,) current ones
+        Time-complexity: O(U * dim), O(sqrt(k)) to tighten the size bound of a single moved centroid
+        """
+        self.n_updates += idx.numel()
+        cells = self.cell_of[idx] # (U,)
+        d = self.geometry.distance_function(centroids[idx], self.coarse[cells]).view(-1) # (U,)
+        self.radii.scatter_reduce_(0, cells, d * (1 + self.SLACK), reduce='amax')
+        if idx.numel() == 1:
+            # Cluster sizes only grow, so the bound stays valid otherwise.
+            self.min_sizes[cells] = cluster_sizes[self.members[int(cells)]].min()
+
+
+    def grow(self, idx: LongTensor, second: Tensor) -> None:
+        """
+        WARNING: Updates internal state of current object.
+        Accounts for changed second closest centroid distances
+        Params: idx: (U,) indices of centroids second: (U,) their second closest centroid distances
+        Time-complexity: O(U)
+        """
+        self.max_second.scatter_reduce_(0, self.cell_of[idx], second.to(self.max_second.dtype), reduce='amax')
+
+
+    def lower_bounds(self, point: Tensor) -> Tensor:
+        """
+        Computes a lower bound of the distance from a point to the members of each cell
+        Params: point: (dim,)
+        Returns: (n_cells,) lower bounds, inf for empty cells
+        Time-complexity: O(n_cells * dim)
+        """
+        dq = self.geometry.distance_matrix(point.unsqueeze(0), self.coarse).view(-1) # (n_cells,)
+        return torch.clamp(dq * (1 - self.SLACK) - self.radii, min=0)
+
+
+    def members_of(self, cells: Tensor) -> LongTensor:
+        """
+        Gathers the members of some cells
+        Params: cells: (n_cells,) mask of cells
+        Returns: (M,) indices of centroids
+        Time-complexity: O(M)
+        """
+        members = [self.members[cell] for cell in torch.nonzero(cells).view(-1).tolist()]
+        if len(members) == 0:
+            return torch.zeros(0, dtype=torch.long, device=self.cell_of.device)
+        return torch.cat(members)
+
+
+    def search(
+            self, state: Tensor, centroids: Tensor, cluster_sizes: Optional[Tensor] = None,
+            strength: float = 0., mean: float = 0.
+    ) -> Tuple[Tensor, Tensor]:
+        """
+        Finds the centroid minimizing distance plus homeostasis bias strength * (size - mean) to a state
+        First scans the most promising cell, then all cells whose lower bound beats it at once
+        Params: state: (dim,) centroids: (k, dim) cluster_sizes: (k,) sizes, None without homeostasis
+                strength: balancing strength mean: mean cluster size
+        Returns: distance: (1,) closest_idx: (1,)
+        Time-complexity: O(n_cells * dim + Visited * dim)
+        """
+        lower = self.lower_bounds(state) # (n_cells,)
+        if cluster_sizes is not None:
+            lower = lower + strength * (self.min_sizes - mean)
+
+        # 1) Scan the cell with the lowest lower bound
+        first = int(torch.argmin(lower))
+        best_distance, best_idx = self._scan(state, centroids, self.members[first], cluster_sizes, strength, mean)
+
+        # 2) Scan every other cell that could still hold a closer centroid in one go
+        candidates = lower < best_distance
+        candidates[first] = False
+        if candidates.any():
+            distance, idx = self._scan(state, centroids, self.members_of(candidates), cluster_sizes, strength, mean)
+            if distance < best_distance:
+                best_distance, best_idx = distance, idx
+
+        distance = torch.tensor([best_distance], dtype=centroids.dtype, device=centroids.device)
+        closest_idx = torch.tensor([best_idx], dtype=torch.long, device=centroids.device)
+        return distance, closest_idx # (1,)
+
+
+    def _scan(
+            self, state: Tensor, centroids: Tensor, members: LongTensor, cluster_sizes: Optional[Tensor],
+            strength: float, mean: float
+    ) -> Tuple[float, int]:
+        """
+        Exhaustively scans a subset of centroids
+        Params: state: (dim,) centroids: (k, dim) members: (M,) indices to scan
+                cluster_sizes: (k,) strength: balancing strength mean: mean cluster size
+        Returns: distance: (float) closest_idx: (int)
+        Time-complexity: O(M * dim)
+        """
+        d = self.geometry.distance_matrix(state.unsqueeze(0), centroids[members]).view(-1) # (M,)
+        if cluster_sizes is not None:
+            d = d + strength * (cluster_sizes[members] - mean)
+        self.n_visited += members.numel()
+        min_val, min_pos = torch.min(d, dim=0)
+        return min_val.item(), int(members[min_pos])
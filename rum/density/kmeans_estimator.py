@@ -1,12 +1,16 @@
 from rum.density.density import Density
 from rum.density.entropic_functions import EntropicFunction
+from rum.density.centroid_index import CentroidIndex
 from rum.learner.learner import Learner
-from rum.geometry import Geometry, EuclideanGeometry
+from rum.geometry import Geometry, EuclideanGeometry, MetricGeometry, NeuralGeometry
+from rum.geometry.neural_utils import EmbeddingCache
 from rum.manifold import Manifold # Needed for initialization under natural geometry.
+from rum.manifold import EuclideanManifold, SphereManifold
 from torch import Tensor, LongTensor, FloatTensor
 from typing import Union, Optional, Tuple
 import numpy as np
 import torch
+import copy
 import os
 
 class OnlineKMeansEstimator(Density, Learner):
@@ -16,6 +20,12 @@ class OnlineKMeansEstimator(Density, Learner):
     DEFAULT_INIT = 'uniform'
     DEFAULT_DEVICE = torch.device('cpu')
     DEFAULT_DTYPE = torch.float32
+    DEFAULT_CHUNK_SIZE = 1024
+    DEFAULT_MODE = 'sequential'
+    RESYNC_EVERY = 1000 # incremental statistics updates between exact re-syncs
+    DENSE_MAX_K = 2048 # largest k keeping the (k, k) centroid distance matrix by default
+    # Geometries whose distance is a metric, as the pruning of the centroid index requires
+    INDEXABLE_GEOMETRIES = (EuclideanGeometry, MetricGeometry, EuclideanManifold, SphereManifold)
 
     def __init__(
         self,
@@ -24,18 +34,26 @@ class OnlineKMeansEstimator(Density, Learner):
         # learning hyperparameters
         homeostasis: bool = True,
         force_sparse: bool = True,
+        mode: str = DEFAULT_MODE,
         init_method: str = DEFAULT_INIT,
         learning_rate: float = DEFAULT_LR,
         balancing_strength: float = DEFAULT_BS,
         origin: Union[Tensor, np.ndarray] = None,
         entropic_func: EntropicFunction = None,
         # manifold geometry functions
-        geometry: Geometry = EuclideanGeometry,
+        geometry: Geometry = None,
         # torch device and dtype
         device: torch.device = torch.device('cpu'),
         dtype: torch.dtype = torch.float32,
         # learner buffer
         buffer_size: int = 1000,
+        # batched assignment
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        # spatial index over centroids
+        use_index: bool = False,
+        index_cells: Optional[int] = None,
+        # (k, k) centroid distance matrix, by default for k <= DENSE_MAX_K without index
+        dense_diameters: Optional[bool] = None,
     ):
         Density.__init__(self, dim)
         Learner.__init__(self, dim, buffer_size)
@@ -48,8 +66,15 @@ class OnlineKMeansEstimator(Density, Learner):
             raise ValueError("Balancing strength must be non-negative")
         if init_method not in ['uniform', 'zeros', 'gaussian']:
             raise ValueError("Initialization method is not supported")
+        if mode not in ['sequential', 'minibatch']:
+            raise ValueError("Learning mode must be either 'sequential' or 'minibatch'")
         if origin is not None and (not isinstance(origin, Tensor) or origin.shape != (dim,)):
             raise ValueError("Origin centroid must be Tensor of shape (dim,)")
+        if not isinstance(chunk_size, int) or chunk_size <= 0:
+            raise ValueError("Chunk size must be greater than 0")
+        if use_index and geometry is not None and not isinstance(geometry, self.INDEXABLE_GEOMETRIES):
+            raise ValueError("Centroid index requires a metric geometry, one of: {}".format(
+                ", ".join(cls.__name__ for cls in self.INDEXABLE_GEOMETRIES)))
 
         self.k: int = k
         self.dim: int = dim
@@ -73,20 +98,44 @@ class OnlineKMeansEstimator(Density, Learner):
         self.bs: float = balancing_strength
         self.homeostasis: bool = homeostasis
         self.force_sparse: bool = force_sparse
+        self.mode: str = mode
+        self.chunk_size: int = chunk_size # rows of the (B, k) assignment matrix per chunk
+        self.dense: bool = dense_diameters if dense_diameters is not None \
+            else (k <= self.DENSE_MAX_K and not use_index)
         self.entropic_func = entropic_func if entropic_func is not None \
             else EntropicFunction("log", eps=1e-9)
 
         # Underlying manifold geometry functions
-        self.geometry = geometry
+        self.geometry = geometry if geometry is not None \
+            else EuclideanGeometry(self.dim)
+
+        # Centroid embeddings under a neural geometry, re-embedded only when they move
+        self.embedding_cache: Optional[EmbeddingCache] = EmbeddingCache(self.geometry, self.k) \
+            if isinstance(self.geometry, NeuralGeometry) else None
 
         # Internal k-Means state
         self.centroids: Tensor = self._init_centroids() # (k, dim)
         self.cluster_sizes: Tensor = torch.zeros((self.k,), device=self.device) # (k,)
 
-        m = self._pairwise_distance() # (k,k)
-        # Diameters of each cluster and closest cluster idx
-        self.diameters = torch.min(m, dim=1).values # (k,)
-        self.closest_idx = torch.argmin(m, dim=1) # (k,)
+        # Two closest centroids of each centroid, maintained incrementally on updates, from the (k, k)
+        # centroid distance matrix under dense diameters. Diameters of each cluster and closest cluster idx
+        # are exact. The second closest distance is that of an actual centroid, so an upper bound,
+        # exact where second_exact holds, always under dense diameters.
+        self.diameters: Tensor = None # (k,)
+        self.closest_idx: LongTensor = None # (k,)
+        self.second: Tensor = None # (k,)
+        self.second_idx: LongTensor = None # (k,) -1 if unknown
+        self.second_exact: Tensor = None # (k,)
+        # Centroid distance matrix, maintained incrementally under dense diameters, None otherwise
+        self.distances: Optional[Tensor] = None # (k, k)
+        # Version of a learned geometry the neighbours were computed with
+        self.geometry_version: Optional[int] = None
+        # Optional spatial index for single state lookups and sparse diameter updates, built below
+        self.index: Optional[CentroidIndex] = None
+        # Neighbours and running statistics: sum of entropic terms of diameters and sum of cluster sizes
+        self._diameters_pairwise()
+        if use_index:
+            self.index = CentroidIndex(self.geometry, self.centroids, self.cluster_sizes, self.second, index_cells)
 
         # Logging for experiments
         self.n_pathological = 0
@@ -98,8 +147,9 @@ class OnlineKMeansEstimator(Density, Learner):
         """
         WARNING: Updates internal state of current object.
         Updates the k-means state given a batch of states
+        In 'minibatch' mode, all states of a pass are assigned at once and centroids move in one shot
         Params: states: (B, dim) batch of states
-        Time-complexity: O(B * k * Pathological * dim)
+        Time-complexity: O(B * k * Pathological * dim), O((B + U * Pathological) * k * dim) in 'minibatch' mode
         """
         if not isinstance(states, Tensor) or states.dim() != 2:
             raise ValueError("States must be tensor of shape (B, dim)")
@@ -115,24 +165,47 @@ class OnlineKMeansEstimator(Density, Learner):
             states = states[shuffle] # (B, dim)
         
         n_pathological = 0
+        self._sync_geometry()
 
         for pass_idx in range(num_passes):
-            if B <= k or self.force_sparse:
-                # Centroids sequential. Diameters sparse.
+            if self.mode == 'minibatch':
+                # Centroids batched. Diameters sparse on moved centroids at once.
+                updated_idx = self._update_batch(states)
+                _, _, n_patho = self._diameters_sparse(updated_idx, inplace=True)
+                n_pathological += n_patho
+            elif B <= k or self.force_sparse:
+                # Centroids sequential. Diameters sparse.
                 for s in states:
                     # Cannot be parallelized.
                     closest_idx = self._update_single(s)
                     _, _, n_patho = self._diameters_sparse(closest_idx, inplace=True)
                     n_pathological += n_patho
             else:
-                # Centroids sequential. Diameters pairwise.
-                for s in states: _ = self._update_single(s)
-                self._diameters_pairwise()
+                # Centroids sequential. Diameters sparse on moved centroids at once.
+                updated_idx = torch.cat([self._update_single(s) for s in states])
+                _, _, n_patho = self._diameters_sparse(torch.unique(updated_idx), inplace=True)
+                n_pathological += n_patho
 
         # Logging for experiments
         self.n_pathological = n_pathological
 
 
+    def minibatch_gap(self, states: Tensor) -> Tensor:
+        """
+        Measures the approximation gap of 'minibatch' against 'sequential' learning
+        Learns the same states both ways from copies of the current k-means state
+        Params: states: (B, dim) batch of states
+        Returns: (1,) mean distance between centroids learned both ways
+        Time-complexity: O(B * k * Pathological * dim)
+        """
+        self._sync_geometry() # once, rather than in each copy
+        sequential, minibatch = self._copy_state(), self._copy_state()
+        sequential.mode, minibatch.mode = 'sequential', 'minibatch'
+        sequential.learn(states, shuffling=False)
+        minibatch.learn(states, shuffling=False)
+        return torch.mean(self.geometry.distance_function(sequential.centroids, minibatch.centroids))
+
+
     def simulate_step(self, state: Tensor) -> Tensor:
         """
         Simulates a step of the k-means algorithm on given state
@@ -142,8 +215,9 @@ class OnlineKMeansEstimator(Density, Learner):
         """
         if not isinstance(state, Tensor) or state.dim() != 1:
             raise ValueError("State must be of shape (dim,)")
-        _, closest_idx = self._find_closest_cluster(state.unsqueeze(0)) # (1,)
-        # Simulate centroids update
+        self._sync_geometry()
+        _, closest_idx = self._find_closest_cluster(state.unsqueeze(0)) # (1,)
+        # Simulate centroids update
         centroids = self.centroids.clone()
         centroids[closest_idx] = self._compute_centroid_pos(state, closest_idx)
         # Simulate sparse diameters update
@@ -151,6 +225,60 @@ class OnlineKMeansEstimator(Density, Learner):
         return diameters
     
 
+    def simulate_entropy_delta(self, states: Tensor) -> Tensor:
+        """
+        WARNING: Can update internal state of current object.
+        Simulates independent steps of the k-means algorithm on each given state
+        and returns the resulting change of the entropy lower bound, without copying centroids.
+        Only the diameter terms changed by each step enter the sum. Centroids, diameters and
+        statistics are left untouched, but inexact second closest centroids of centroids
+        pointing at an updated one are refreshed exactly in place.
+        Params: states: (B, dim) states to simulate steps on
+        Returns: (B,) entropy lower bound after each step minus current one
+        Time-complexity: O(B * k * dim)
+        Memory-complexity: O(chunk_size * k)
+        """
+        if not isinstance(states, Tensor) or states.dim() != 2:
+            raise ValueError("States must be of shape (B, dim)")
+        self._sync_geometry()
+        states = states.to(device=self.centroids.device, dtype=self.centroids.dtype)
+        _, closest_idx = self._find_closest_cluster(states) # (B,)
+
+        # Second closest distance of centroids pointing at an updated centroid,
+        # i.e. their diameter once they are not allowed to point at it anymore.
+        referencing_mask = torch.isin(self.closest_idx, torch.unique(closest_idx)) # (k,)
+        self._refresh_neighbours(torch.nonzero(referencing_mask & ~self.second_exact).view(-1))
+        second = torch.where(referencing_mask, self.second, float('inf')) # (k,)
+
+        deltas = torch.zeros(states.shape[0], dtype=self.diameters.dtype, device=self.diameters.device)
+        for start in range(0, states.shape[0], self.chunk_size):
+            end = min(start + self.chunk_size, states.shape[0])
+            j = closest_idx[start:end] # (C,)
+            alphas = torch.full(j.shape, self.lr, dtype=states.dtype, device=states.device)
+            moved = self.geometry.interpolate_batch(self.centroids[j], states[start:end], alphas) # (C, dim)
+
+            # 1) Distances from each simulated centroid to all others
+            new_rows = self._distances_to_centroids(moved) # (C, k)
+            rows_idx = torch.arange(j.shape[0], device=j.device)
+            new_rows[rows_idx, j] = float('inf') # exclude updated centroid itself
+
+            # 2) Diameters of the others: referrers fall back on their second closest
+            referrers = self.closest_idx.unsqueeze(0) == j.unsqueeze(1) # (C, k)
+            base = torch.where(referrers, second.unsqueeze(0), self.diameters.unsqueeze(0))
+            new_diameters = torch.minimum(base, new_rows) # (C, k)
+
+            # 3) Diameter of the updated centroid
+            new_diameters[rows_idx, j] = torch.min(new_rows, dim=1).values
+
+            # 4) Sum entropic terms of changed diameters only
+            changed_rows, changed_cols = torch.nonzero(new_diameters != self.diameters.unsqueeze(0), as_tuple=True)
+            terms = self.entropic_func(new_diameters[changed_rows, changed_cols]) \
+                - self.entropic_func(self.diameters[changed_cols])
+            deltas[start:end] = torch.zeros_like(deltas[start:end]).index_add_(0, changed_rows, terms.to(deltas.dtype))
+
+        return deltas # (B,)
+
+
     # --- k-Means density estimators methods ---
 
     def kmeans_objective(self, distances: Tensor) -> Tensor:
@@ -166,18 +294,20 @@ class OnlineKMeansEstimator(Density, Learner):
         return km_objective # (1,)
 
     def pdf(self, x: Tensor) -> float:
+        self._sync_geometry()
         return self.pdf_approx(x, self.diameters)
 
     def pdf_approx(self, x: Tensor, diameters: Optional[Tensor] = None) -> Tensor:
         """
         Computes the upper bound of the pdf of the k-means state
-        Params: x: (dim,) point at which to compute pdf
-        Returns: (1,) upper bound of the pdf
-        Time-complexity: O(k)
+        Params: x: (dim,) or (B, dim) points at which to compute pdf
+        Returns: (1,) or (B,) upper bound of the pdf
+        Time-complexity: O(B * k)
         """
-        _, closest_idx = self._find_closest_cluster(x.unsqueeze(0))
+        _, closest_idx = self._find_closest_cluster(x.view(-1, self.dim))
         ds = self.diameters if diameters is None else diameters
-        return 1 / (ds[closest_idx[0]] + 1e-6)
+        pdf = 1 / (ds[closest_idx] + 1e-6)
+        return pdf[0] if x.dim() == 1 else pdf
     
     def information(self, x: Tensor, diameters: Optional[Tensor] = None) -> Tensor:
         """
@@ -191,7 +321,8 @@ class OnlineKMeansEstimator(Density, Learner):
         return self.entropic_func(pdf_approx)
 
     def entropy(self) -> Tensor:
-        return self.entropy_lb(self.diameters)
+        self._sync_geometry()
+        return self.entropy_sum.clone() # O(1), maintained incrementally
 
     def entropy_lb(self, diameters: Optional[Tensor] = None) -> Tensor:
         """
@@ -228,6 +359,28 @@ class OnlineKMeansEstimator(Density, Learner):
             return torch.distributions.MultivariateNormal(self.origin, cov).sample((self.k,)).clamp(-1, 1)
 
 
+    def _copy_state(self) -> 'OnlineKMeansEstimator':
+        """
+        Copies the k-means state only, the copy shares the geometry and learner buffer
+        Returns: estimator learning independently of the current one
+        Time-complexity: O(k * dim)
+        """
+        other = copy.copy(self)
+        for name in ['centroids', 'cluster_sizes', 'diameters', 'closest_idx',
+                     'second', 'second_idx', 'second_exact', 'entropy_sum']:
+            setattr(other, name, getattr(self, name).clone())
+        if self.distances is not None:
+            other.distances = self.distances.clone()
+        if self.index is not None:
+            other.index = self.index.clone()
+        if self.embedding_cache is not None:
+            other.embedding_cache = copy.copy(self.embedding_cache)
+            other.embedding_cache.stale = self.embedding_cache.stale.clone()
+            if self.embedding_cache.embeddings is not None:
+                other.embedding_cache.embeddings = self.embedding_cache.embeddings.clone()
+        return other
+
+
     def _update_single(self, state: Tensor) -> None:
         """
         WARNING: Updates internal state of current object.
@@ -240,52 +393,168 @@ class OnlineKMeansEstimator(Density, Learner):
         _, closest_idx = self._find_closest_cluster(state.unsqueeze(0)) # ci(1,)
         self.centroids[closest_idx] = self._compute_centroid_pos(state, closest_idx)
         self.cluster_sizes[closest_idx] += 1
-        return closest_idx # (1,)
+        self.size_sum += 1
+        if self.embedding_cache is not None:
+            self.embedding_cache.invalidate(closest_idx)
+        if self.index is not None:
+            self.index.moved(closest_idx, self.centroids, self.cluster_sizes)
+        return closest_idx # (1,)
+
+
+    def _update_batch(self, states: Tensor) -> LongTensor:
+        """
+        WARNING: Updates internal state of current object.
+        Updates the k-means state given a batch of states assigned at once
+        Each cluster moves towards the mean of its states with effective rate 1 - (1 - lr)^n,
+        matching n sequential updates when its states coincide
+        Params: states: (B, dim) states to update on
+        Returns: (U,) indices of updated centroids
+        Time-complexity: O(Distance) + O(B * k) + O(Interpolate)
+        """
+        if not isinstance(states, Tensor) or states.dim() != 2:
+            raise ValueError("States must be of shape (B, dim)")
+        states = states.to(device=self.centroids.device, dtype=self.centroids.dtype)
+        _, closest_idx = self._find_closest_cluster(states) # (B,)
+
+        counts = torch.bincount(closest_idx, minlength=self.k) # (k,)
+        sums = torch.zeros_like(self.centroids).index_add_(0, closest_idx, states) # (k, dim)
+        updated_idx = torch.nonzero(counts).view(-1) # (U,)
+        n = counts[updated_idx].to(self.centroids.dtype) # (U,)
+
+        means = sums[updated_idx] / n.unsqueeze(1) # (U, dim)
+        alphas = 1 - (1 - self.lr) ** n # (U,)
+        self.centroids[updated_idx] = self.geometry.interpolate_batch(self.centroids[updated_idx], means, alphas)
+        self.cluster_sizes += counts.to(self.cluster_sizes.dtype)
+        self.size_sum += states.shape[0]
+
+        if self.embedding_cache is not None:
+            self.embedding_cache.invalidate(updated_idx)
+        if self.index is not None:
+            self.index.moved(updated_idx, self.centroids, self.cluster_sizes)
+        return updated_idx # (U,)
 
 
     def _find_closest_cluster(self, states: Tensor) -> Tuple[Tensor, Tensor]:
         """
         Find closest cluster assignment and distance for each states in batch
+        Processes the batch in chunks of `chunk_size` rows to bound memory
         Params: states: (B, dim)
-        Returns: distances: (B,) closest_idx: (B,)
+        Returns: distances: (B,) weighted assignment distances closest_idx: (B,)
         Time-complexity: O(Distance) + O(B * k)
+        Memory-complexity: O(chunk_size * k)
         """
         if not isinstance(states, Tensor) or states.dim() != 2:
             raise ValueError("States must be of shape (B, dim)")
         
         batch_size = states.shape[0]
-        distances, closest_idx = torch.zeros((batch_size)), torch.zeros((batch_size), dtype=torch.long)
+        if self.index is not None and batch_size == 1:
+            s = states[0].to(device=self.centroids.device, dtype=self.centroids.dtype)
+            sizes = self.cluster_sizes if self.homeostasis else None
+            return self.index.search(s, self.centroids, sizes, self.bs, self.size_sum / self.k)
 
-        for i, s in enumerate(states):
-            ds = self._weighted_distance(s) # (k,)
-            d, ci = torch.min(ds, dim=0) # (1,)
-            distances[i] = d
-            closest_idx[i] = ci
+        distances = torch.zeros((batch_size,), dtype=self.dtype, device=self.device)
+        closest_idx = torch.zeros((batch_size,), dtype=torch.long, device=self.device)
 
-        return distances, closest_idx # (B,)
+        for start in range(0, batch_size, self.chunk_size):
+            end = min(start + self.chunk_size, batch_size)
+            ds = self._weighted_distances(states[start:end]) # (chunk, k)
+            distances[start:end], closest_idx[start:end] = torch.min(ds, dim=1)
+            if self.embedding_cache is None:
+                # Assignment distances only select centroids, exact distances to the selected ones
+                distances[start:end] = self._weighted_distances_to(states[start:end], closest_idx[start:end])
+
+        return distances, closest_idx # (B,)
 
 
     def _weighted_distance(self, state: Tensor) -> FloatTensor:
         """
         Computes the weighted distance of a state to the centroids
-        Params: state: (1, dim) state to compute distance to
-        Returns: (1,) weighted distance
+        Params: state: (dim,) state to compute distance to
+        Returns: (k,) weighted distance
         Time-complexity: O(Distance) + O(k)
         """
         if not isinstance(state, Tensor) or state.dim() != 1:
             raise ValueError("State must be of shape (dim,)")
+        return self._weighted_distances(state.unsqueeze(0)).view(-1) # (k,)
+
 
-        s, cs = state.unsqueeze(0), self.centroids  # s(1, dim) cs(k, dim) 
-        distances: Tensor = self.geometry.distance_function(s, cs).view(-1) # distances(k,)
+    def _weighted_distances(self, states: Tensor) -> FloatTensor:
+        """
+        Computes the weighted distance of a batch of states to the centroids, for assignment only
+        Params: states: (B, dim) states to compute distance to
+        Returns: (B, k) weighted distance matrix
+        Time-complexity: O(Distance) + O(B * k)
+        """
+        if not isinstance(states, Tensor) or states.dim() != 2:
+            raise ValueError("States must be of shape (B, dim)")
+
+        cs = self.centroids # (k, dim)
+        states = states.to(device=cs.device, dtype=cs.dtype) # (B, dim)
+        distances: Tensor = self._distances_to_centroids(states, assignment=True) # (B, k)
 
-        if self.homeostasis:
-            mean = torch.mean(self.cluster_sizes)
-            adj = self.bs * (self.cluster_sizes - mean)
-            distances += adj # TODO. Clip to 0?
+        adj = self._homeostasis_bias() # (k,)
+        if adj is not None:
+            distances = distances + adj.unsqueeze(0) # TODO. Clip to 0?
 
         return distances
 
 
+    def _weighted_distances_to(self, states: Tensor, idx: LongTensor) -> FloatTensor:
+        """
+        Computes the exact weighted distance of each state to a given centroid
+        Params: states: (B, dim) idx: (B,) index of the centroid of each state
+        Returns: (B,) weighted distances
+        Time-complexity: O(Distance)
+        """
+        states = states.to(device=self.centroids.device, dtype=self.centroids.dtype) # (B, dim)
+        distances = self.geometry.distance_function(states, self.centroids[idx]).reshape(-1) # (B,)
+        adj = self._homeostasis_bias() # (k,)
+        return distances if adj is None else distances + adj[idx]
+
+
+    def _distances_to_centroids(self, states: Tensor, assignment: bool = False) -> FloatTensor:
+        """
+        Computes the distance of a batch of states to the centroids, embedding only
+        the states under a neural geometry as centroid embeddings are cached
+        Params: states: (B, dim)
+                assignment: (bool) whether the distances only select closest centroids
+        Returns: (B, k) distance matrix
+        Time-complexity: O(Distance)
+        """
+        if self.embedding_cache is None:
+            if assignment:
+                return self.geometry.assignment_distance_matrix(states, self.centroids) # (B, k)
+            return self.geometry.distance_matrix(states, self.centroids) # (B, k)
+        embedded = self.embedding_cache.get(self.centroids) # (k, embedding_dim)
+        return self.geometry.embedded_distance_matrix(self.geometry.embed(states), embedded) # (B, k)
+
+
+    def _centroid_distances(self, idx: LongTensor) -> FloatTensor:
+        """
+        Computes the distance of some centroids to all centroids, from cached embeddings
+        only under a neural geometry
+        Params: idx: (U,) indices of centroids
+        Returns: (U, k) distance matrix
+        Time-complexity: O(Distance)
+        """
+        if self.embedding_cache is None:
+            return self.geometry.distance_matrix(self.centroids[idx], self.centroids) # (U, k)
+        embedded = self.embedding_cache.get(self.centroids) # (k, embedding_dim)
+        return self.geometry.embedded_distance_matrix(embedded[idx], embedded) # (U, k)
+
+
+    def _homeostasis_bias(self) -> Optional[Tensor]:
+        """
+        Computes the homeostasis adjustment added to distances to the centroids
+        Returns: (k,) additive bias, None if homeostasis is disabled
+        Time-complexity: O(k)
+        """
+        if not self.homeostasis:
+            return None
+        mean = self.size_sum / self.k
+        return self.bs * (self.cluster_sizes - mean) # (k,)
+
+
     def _compute_centroid_pos(self, state: Tensor, closest_idx: Tensor) -> Tensor:
         """
         Computes the centroid position after a single update
@@ -308,88 +577,393 @@ class OnlineKMeansEstimator(Density, Learner):
     ) -> Tuple[Tensor, Tensor, int]:
         """
         WARNING: Can update internal state of current object.
-        Updates the diameters of k-means in sparse fashion
-        Params: updated_idx: (1,) index of updated centroid
+        Updates the diameters of k-means in sparse fashion from the two closest centroids of each centroid
+        Params: updated_idx: (U,) indices of updated centroids, U = 1 if not inplace
                 inplace: (bool) whether to update internal state
                 centroids: (k, dim) centroids to use for update
         Returns: diameters: (k,) closest_idx: (k,) n_pathological: (int)
-        Time-complexity: (k * Pathological * dim)
+        Time-complexity: O(U * k * dim + k * Pathological * dim)
+        Memory-complexity: O(chunk_size * k)
         """
-
-        # 0) Setup variables to be updated
+        inf = float('inf')
         centroids = self.centroids if centroids is None else centroids
-        diameters = self.diameters if inplace else self.diameters.clone()
-        closest_idx = self.closest_idx if inplace else self.closest_idx.clone()
-
-        # 1) Compute distances from the updated centroid to all others
-        centroid = centroids[updated_idx]  # (1, dim)
-        new_diameters = self.geometry.distance_function(centroid, centroids)  # (k,)
-        new_diameters[updated_idx] = float('inf')  # exclude updated centroid itself
-
-        # 2) Update closest distances and idx of updated centroid
-        min_val, min_idx = torch.min(new_diameters, dim=0)
-        diameters[updated_idx] = min_val.item()
-        closest_idx[updated_idx] = min_idx.item()
-
-        # 3) Check if the update affected any other centroids
-        closer_mask = new_diameters < diameters
-        diameters[closer_mask] = new_diameters[closer_mask]
-        closest_idx[closer_mask] = updated_idx
-
-        # 4) Identify pathological cases and count them
-        referencing_mask = closest_idx == updated_idx
-        pathological_mask = referencing_mask & ~closer_mask
-        pathological_idx = torch.nonzero(pathological_mask).squeeze(0)
-        n_pathological = pathological_mask.sum().item()
-
-        # 5) Recompute distances for pathological cases
-
-        if n_pathological > 0:
-            if n_pathological == 1:
-                pathological_idx = pathological_idx.unsqueeze(0)
-
-            patho_diameters = torch.zeros(n_pathological, dtype=self.dtype, device=self.device)
-            patho_closest_idx = torch.zeros(n_pathological, dtype=torch.long, device=self.device)
-
-            for i, idx in enumerate(pathological_idx):
-                # Avoiding parallelization here due to the overhead from spawning threads
-                # n_pathological is about 1-2% of k, making parallelism less beneficial
-                c = self.centroids[idx]  # (1, dim)
-                d = self.geometry.distance_function(c, centroids)  # (k,)
-                d[idx] = float('inf')  # exclude centroid itself
-                min_val, min_idx = torch.min(d, dim=0)
-                patho_diameters[i] = min_val
-                patho_closest_idx[i] = min_idx
-            
-            diameters[pathological_mask] = patho_diameters
-            closest_idx[pathological_mask] = patho_closest_idx
+        moved = torch.unique(updated_idx.view(-1)) # (U,)
+        if self.distances is not None:
+            return self._diameters_dense(moved, inplace, centroids)
+        if inplace and self.index is not None and moved.shape[0] == 1:
+            return self._diameters_indexed(moved)
+        is_moved = torch.zeros(self.k, dtype=torch.bool, device=self.device)
+        is_moved[moved] = True
+
+        # 1) Exact distances from the moved centroids to all others, reduced to
+        # the two closest of each moved centroid (row-wise) and of each centroid among moved ones (column-wise)
+        moved_top, new_row = [], None
+        b, b_idx = None, None # (2, k)
+        for start in range(0, moved.shape[0], self.chunk_size):
+            chunk = moved[start:start + self.chunk_size] # (C,)
+            if inplace:
+                rows = self._centroid_distances(chunk) # (C, k)
+            else:
+                # Centroids only differ from the current ones at the moved centroid
+                rows = self._distances_to_centroids(centroids[chunk]) # (C, k)
+                new_row = rows[0]
+            rows[torch.arange(chunk.shape[0], device=self.device), chunk] = inf # exclude themselves
+            moved_top.append(self._top_two(rows))
+            if moved.shape[0] == 1: # single moved centroid, by symmetry its row is the column
+                b = torch.cat((rows, torch.full_like(rows, inf))) # (2, k)
+                b_idx = torch.full((2, self.k), -1, dtype=torch.long, device=self.device)
+                b_idx[0] = chunk
+            else:
+                candidates = rows if b is None else torch.cat((b, rows))
+                candidates_idx = chunk.unsqueeze(1).expand(-1, self.k) if b is None \
+                    else torch.cat((b_idx, chunk.unsqueeze(1).expand(-1, self.k)))
+                d, i = self._top_two(candidates.T) # (k, 2)
+                b = d.T
+                b_idx = candidates_idx.gather(0, i.T.clamp(min=0))
+                b_idx[b == inf] = -1
+
+        # 2) Only centroids whose two closest moved, or that a moved centroid got closer to, can change
+        neighbours = self._neighbours() if inplace else tuple(t.clone() for t in self._neighbours())
+        diameters, closest_idx, second, second_idx, _ = neighbours
+        near_moved = is_moved[closest_idx]
+        sec_moved = (second_idx >= 0) & is_moved[second_idx.clamp(min=0)] # -1: none or unknown
+        affected = torch.nonzero(~is_moved & (near_moved | sec_moved | (b[0] < second))).view(-1) # (A,)
+        previous = torch.cat((diameters[moved], diameters[affected]))
+        pathological_idx = self._merge_neighbours(
+            neighbours, affected, near_moved[affected], sec_moved[affected],
+            b[0, affected], b_idx[0, affected], b[1, affected], b_idx[1, affected])
+
+        # 3) Moved centroids take their own exact two closest
+        for start, (d, i) in zip(range(0, moved.shape[0], self.chunk_size), moved_top):
+            self._set_neighbours(neighbours, moved[start:start + self.chunk_size], d, i)
+
+        # 4) Recompute pathological cases exactly
+        if new_row is not None:
+            self._set_neighbours(neighbours, pathological_idx, *self._exact_top_two(pathological_idx, new_row, moved))
+        else:
+            self._set_neighbours(neighbours, pathological_idx, *self._exact_top_two(pathological_idx))
+
+        if inplace:
+            # 5) Maintain running entropy and index bounds with the changed neighbours only
+            changed = torch.cat((moved, affected))
+            self._update_entropy_sum(previous, diameters[changed])
+            self._maintain_index(changed)
+
+        return diameters, closest_idx, pathological_idx.numel()
+
+
+    def _diameters_dense(self, moved: LongTensor, inplace: bool, centroids: Tensor) -> Tuple[Tensor, Tensor, int]:
+        """
+        WARNING: Can update internal state of current object.
+        Updates the diameters from the centroid distance matrix, reducing only the rows of moved
+        centroids and of centroids whose two closest may have changed
+        Params: moved: (U,) indices of updated centroids, U = 1 if not inplace
+                inplace: (bool) whether to update internal state
+                centroids: (k, dim) centroids to use for update
+        Returns: diameters: (k,) closest_idx: (k,) n_pathological: (int)
+        Time-complexity: O(U * k * dim + A * k)
+        Memory-complexity: O(k^2)
+        """
+        is_moved = torch.zeros(self.k, dtype=torch.bool, device=self.device)
+        is_moved[moved] = True
+
+        # 1) Exact distances from the moved centroids to all others, and closest moved centroid of each centroid
+        if inplace:
+            rows = self._centroid_distances(moved) # (U, k)
+        else:
+            # Centroids only differ from the current ones at the moved centroid
+            rows = self._distances_to_centroids(centroids[moved]) # (U, k)
+        rows[torch.arange(moved.shape[0], device=self.device), moved] = float('inf') # exclude themselves
+        moved_min = rows.min(dim=0).values # (k,)
+
+        # 2) Only centroids whose two closest moved, or that a moved centroid got closer to, can change
+        neighbours = self._neighbours() if inplace else tuple(t.clone() for t in self._neighbours())
+        diameters, closest_idx, second, second_idx, _ = neighbours
+        near_moved = (closest_idx >= 0) & is_moved[closest_idx.clamp(min=0)]
+        sec_moved = (second_idx >= 0) & is_moved[second_idx.clamp(min=0)]
+        affected = torch.nonzero(~is_moved & (near_moved | sec_moved | (moved_min < second))).view(-1) # (A,)
+        n_pathological = int((near_moved & (moved_min > diameters))[affected].sum())
+        previous = torch.cat((diameters[moved], diameters[affected]))
+        if inplace:
+            self.distances[moved] = rows
+            self.distances[:, moved] = rows.T
+            affected_rows = self.distances[affected] # (A, k)
+        else:
+            affected_rows = self.distances[affected] # (A, k)
+            affected_rows[:, moved] = rows.T[affected]
+
+        # 3) Exact two closest of the moved and affected centroids from their rows
+        self._set_neighbours(neighbours, moved, *self._top_two(rows))
+        self._set_neighbours(neighbours, affected, *self._top_two(affected_rows))
+
+        if inplace:
+            # 4) Maintain running entropy and index bounds with the changed neighbours only
+            changed = torch.cat((moved, affected))
+            self._update_entropy_sum(previous, diameters[changed])
+            self._maintain_index(changed)
 
         return diameters, closest_idx, n_pathological
-    
 
-    def _diameters_pairwise(self, diag: float = float('inf')) -> None:
+
+    def _diameters_indexed(self, moved: LongTensor) -> Tuple[Tensor, Tensor, int]:
+        """
+        WARNING: Updates internal state of current object.
+        Updates the diameters after a single centroid moved, only visiting the cells of the index
+        that may hold its two closest, or centroids it got closer to than their second closest
+        Params: moved: (1,) index of moved centroid
+        Returns: diameters: (k,) closest_idx: (k,) n_pathological: (int)
+        Time-complexity: O(Visited * dim + k + k * Pathological * dim)
+        """
+        inf = float('inf')
+        j = int(moved)
+        neighbours = self._neighbours()
+        diameters, closest_idx, second, second_idx, _ = neighbours
+        centroid = self.centroids[j]
+
+        def distances(idx: LongTensor) -> Tensor:
+            d = self.geometry.distance_matrix(centroid.unsqueeze(0), self.centroids[idx]).view(-1) # (M,)
+            return torch.where(idx == j, inf, d)
+
+        # 1) Cells that may hold a centroid closer to the moved one than its second closest
+        lower = self.index.lower_bounds(centroid) # (n_cells,)
+        visited = lower <= self.index.max_second
+        rows = self.index.members_of(visited)
+        d = distances(rows)
+        # Cells that may hold one of the two closest of the moved centroid
+        top, top_pos = self._top_two(d.unsqueeze(0)) # (1, 2)
+        missing = ~visited & (lower < top[0, 1])
+        if missing.any():
+            visited |= missing
+            extra = self.index.members_of(missing)
+            rows, d = torch.cat((rows, extra)), torch.cat((d, distances(extra)))
+            top, top_pos = self._top_two(d.unsqueeze(0))
+        # Centroids pointing at the moved one before it moved, wherever they are, none of its two closest
+        referrers = torch.nonzero((closest_idx == j) | (second_idx == j)).view(-1)
+        referrers = referrers[~visited[self.index.cell_of[referrers]]]
+        rows, d = torch.cat((rows, referrers)), torch.cat((d, distances(referrers)))
+        self.index.n_visited += rows.numel()
+
+        # 2) Merge the moved centroid in neighbours of others
+        near_moved, sec_moved = closest_idx[rows] == j, second_idx[rows] == j
+        mask = (rows != j) & (near_moved | sec_moved | (d < second[rows]))
+        affected = rows[mask] # (A,)
+        previous = torch.cat((diameters[moved], diameters[affected]))
+        no_second = torch.full_like(d[mask], inf)
+        pathological_idx = self._merge_neighbours(
+            neighbours, affected, near_moved[mask], sec_moved[mask],
+            d[mask], moved.expand(affected.shape[0]), no_second, torch.full_like(affected, -1))
+
+        # 3) Moved centroid takes its own exact two closest
+        self._set_neighbours(neighbours, moved, top, torch.where(top_pos >= 0, rows[top_pos.clamp(min=0)], -1))
+
+        # 4) Recompute pathological cases exactly
+        if pathological_idx.numel() > 0:
+            self._set_neighbours(neighbours, pathological_idx, *self._exact_top_two(pathological_idx))
+
+        # 5) Maintain running entropy and index bounds with the changed neighbours only
+        changed = torch.cat((moved, affected))
+        self._update_entropy_sum(previous, diameters[changed])
+        self._maintain_index(changed)
+        return diameters, closest_idx, pathological_idx.numel()
+
+
+    def _merge_neighbours(
+            self, neighbours: Tuple[Tensor, ...], rows: LongTensor, near_moved: Tensor, sec_moved: Tensor,
+            b1: Tensor, b1_idx: LongTensor, b2: Tensor, b2_idx: LongTensor
+    ) -> LongTensor:
+        """
+        WARNING: Updates the given neighbours.
+        Merges the previous two closest centroids that did not move with the two closest moved ones
+        Params: neighbours: (diameters, closest_idx, second, second_idx, second_exact) each (k,)
+                rows: (A,) indices of centroids that did not move
+                near_moved: (A,) whether their closest moved sec_moved: (A,) whether their second closest moved
+                b1, b1_idx, b2, b2_idx: (A,) their two closest moved centroids, (inf, -1) if missing
+        Returns: (P,) pathological rows, whose closest moved away and need an exact recomputation
+        Time-complexity: O(A)
+        """
+        inf = float('inf')
+        diameters, closest_idx, second, second_idx, second_exact = neighbours
+        d1, c1, d2, c2, e2 = diameters[rows], closest_idx[rows], second[rows], second_idx[rows], second_exact[rows]
+        # Closest distance among centroids that did not move, if known
+        a1_known = ~near_moved | (~sec_moved & e2)
+        a1 = torch.where(near_moved, d2, d1)
+        a1_idx = torch.where(near_moved, c2, c1)
+        # Second closest distance among centroids that did not move, if known
+        a2_keep = ~near_moved & ~sec_moved
+        a2 = torch.where(a2_keep, d2, inf)
+        a2_idx = torch.where(a2_keep, c2, -1)
+        # Distance to an actual centroid that did not move, an upper bound
+        c_keep = ~sec_moved & (d2 < b2)
+        c2_d, c2_idx = torch.where(c_keep, d2, b2), torch.where(c_keep, c2, b2_idx)
+
+        # a) Closest among non-moved known, a moved centroid got closer
+        case_a = a1_known & (b1 < a1)
+        a_first = a1 < b2
+        # b) Closest among non-moved known and still the closest: exact if nothing closer can hide
+        # among non-moved centroids beyond the previous second closest
+        case_b = a1_known & ~case_a
+        b_first = a2 <= b1
+        # c) Closest among non-moved unknown, bounded below by the previous diameter
+        case_c = ~a1_known & (b1 <= d1)
+        # d) Pathological: closest centroid moved away
+
+        diameters[rows] = torch.where(case_b, a1, b1)
+        closest_idx[rows] = torch.where(case_b, a1_idx, b1_idx)
+        second[rows] = torch.where(case_a, torch.where(a_first, a1, b2),
+                                   torch.where(case_b, torch.where(b_first, a2, b1), c2_d))
+        second_idx[rows] = torch.where(case_a, torch.where(a_first, a1_idx, b2_idx),
+                                       torch.where(case_b, torch.where(b_first, a2_idx, b1_idx), c2_idx))
+        second_exact[rows] = case_a | (case_b & e2 & (a2_keep | (b1 <= d2))) | (case_c & (c2_d <= d1))
+        return rows[~a1_known & ~case_c] # (P,)
+
+
+    def _diameters_pairwise(self) -> None:
         """
         WARNING: Updates internal state of current object.
-        Updates the diameters of k-means in pairwise fashion
-        Params: diag: (float) value to fill diagonal with
+        Recomputes the diameters and two closest centroids of each centroid exactly,
+        and the centroid distance matrix under dense diameters
         Time-complexity: O(k^2 * dim)
+        Memory-complexity: O(chunk_size * k), O(k^2) under dense diameters
         """
-        m = self._pairwise_distance(diag) # (k, k)
-        min_val, min_idx = torch.min(m, dim=1)
-        self.diameters = min_val # (k,)
-        self.closest_idx = min_idx # (k,)
+        self.diameters = torch.full((self.k,), float('inf'), dtype=self.dtype, device=self.device)
+        self.closest_idx = torch.full((self.k,), -1, dtype=torch.long, device=self.device)
+        self.second = self.diameters.clone()
+        self.second_idx = self.closest_idx.clone()
+        self.second_exact = torch.zeros(self.k, dtype=torch.bool, device=self.device)
+        all_idx = torch.arange(self.k, device=self.device)
+        if self.dense:
+            self.distances = torch.cat([self._centroid_distances(chunk) for chunk in torch.split(all_idx, self.chunk_size)])
+            self.distances.fill_diagonal_(float('inf'))
+            self._set_neighbours(self._neighbours(), all_idx, *self._top_two(self.distances))
+        else:
+            self._set_neighbours(self._neighbours(), all_idx, *self._exact_top_two(all_idx))
+        self.geometry_version = getattr(self.geometry, 'version', None)
+        if self.index is not None:
+            self.index.build(self.centroids, self.cluster_sizes, self.second)
+        self._resync_statistics()
 
 
-    def _pairwise_distance(self, diag: float = float('inf')) -> Tensor:
+    def _refresh_neighbours(self, idx: LongTensor) -> None:
         """
-        Computes the pairwise distance between centroids
-        Params: diag: (float) value to fill diagonal with
-        Returns: (k, k) pairwise distance matrix
-        Time-complexity: O(k^2 * dim)
+        WARNING: Updates internal state of current object.
+        Recomputes exactly the second closest centroid of some centroids, it can only get closer
+        Diameters are left untouched, as running statistics depend on them
+        Params: idx: (U,) indices of centroids
+        Time-complexity: O(U * k * dim)
+        Memory-complexity: O(chunk_size * k)
+        """
+        d, i = self._exact_top_two(idx)
+        self.second[idx], self.second_idx[idx], self.second_exact[idx] = d[:, 1], i[:, 1], True
+
+
+    def _exact_top_two(
+            self, idx: LongTensor, new_row: Optional[Tensor] = None, moved: Optional[LongTensor] = None
+    ) -> Tuple[Tensor, LongTensor]:
+        """
+        Computes exactly the two closest centroids of some centroids
+        Params: idx: (U,) indices of centroids
+                new_row: (k,) distances of a simulated moved centroid to all others, if any
+                moved: (1,) index of the simulated moved centroid
+        Returns: values: (U, 2) indices: (U, 2)
+        Time-complexity: O(U * k * dim)
+        Memory-complexity: O(chunk_size * k)
+        """
+        values = [torch.zeros((0, 2), dtype=self.dtype, device=self.device)]
+        indices = [torch.zeros((0, 2), dtype=torch.long, device=self.device)]
+        for chunk in torch.split(idx, self.chunk_size):
+            rows = self._centroid_distances(chunk) # (C, k)
+            if new_row is not None:
+                rows[:, moved] = new_row[chunk].unsqueeze(1) # column of the moved centroid
+            rows[torch.arange(chunk.shape[0], device=self.device), chunk] = float('inf')
+            d, i = self._top_two(rows)
+            values.append(d)
+            indices.append(i)
+        return torch.cat(values), torch.cat(indices)
+
+
+    def _neighbours(self) -> Tuple[Tensor, ...]:
+        # Two closest centroids of each centroid: diameters, closest_idx, second, second_idx, second_exact
+        return self.diameters, self.closest_idx, self.second, self.second_idx, self.second_exact
+
+
+    @staticmethod
+    def _set_neighbours(neighbours: Tuple[Tensor, ...], idx: LongTensor, values: Tensor, indices: LongTensor) -> None:
+        """
+        WARNING: Updates the given neighbours.
+        Sets the exact two closest centroids of some centroids
+        Params: neighbours: (diameters, closest_idx, second, second_idx, second_exact) each (k,)
+                idx: (U,) indices of centroids values: (U, 2) indices: (U, 2)
+        Time-complexity: O(U)
+        """
+        diameters, closest_idx, second, second_idx, second_exact = neighbours
+        diameters[idx], closest_idx[idx] = values[:, 0], indices[:, 0]
+        second[idx], second_idx[idx], second_exact[idx] = values[:, 1], indices[:, 1], True
+
+
+    def _top_two(self, rows: Tensor) -> Tuple[Tensor, LongTensor]:
+        """
+        Finds the two smallest entries of each row, padded with (inf, -1) if there is no second
+        Params: rows: (R, n) distances, inf where excluded
+        Returns: values: (R, 2) indices: (R, 2)
+        Time-complexity: O(R * n)
+        """
+        values = torch.full((rows.shape[0], 2), float('inf'), dtype=rows.dtype, device=rows.device)
+        indices = torch.full((rows.shape[0], 2), -1, dtype=torch.long, device=rows.device)
+        n = min(2, rows.shape[1])
+        if n > 0:
+            values[:, :n], indices[:, :n] = torch.topk(rows, n, dim=1, largest=False)
+        indices[:, 1][values[:, 1] == float('inf')] = -1
+        return values, indices
+
+
+    def _maintain_index(self, changed: LongTensor) -> None:
+        """
+        WARNING: Updates internal state of current object.
+        Keeps the bounds of the index valid after neighbours changed, rebuilding it when it asks for it
+        Params: changed: (U,) indices of centroids whose neighbours changed
+        Time-complexity: O(U), amortized O(sqrt(k) * dim) for rebuilds
+        """
+        if self.index is None:
+            return
+        if self.index.stale:
+            self.index.build(self.centroids, self.cluster_sizes, self.second)
+        else:
+            self.index.grow(changed, self.second[changed])
+
+
+    def _sync_geometry(self) -> None:
+        """
+        WARNING: Updates internal state of current object.
+        Rebuilds the diameters if the geometry changed since they were computed,
+        e.g. after a learned geometry was trained
+        Time-complexity: O(1), O(k^2 * dim) on rebuilds
+        """
+        if getattr(self.geometry, 'version', None) != self.geometry_version:
+            self._diameters_pairwise()
+
+
+    def _update_entropy_sum(self, previous: Tensor, current: Tensor) -> None:
+        """
+        WARNING: Updates internal state of current object.
+        Updates the running entropy lower bound given changed diameters,
+        re-syncing it exactly every RESYNC_EVERY updates to bound float drift
+        Params: previous: (C,) diameters before change current: (C,) diameters after change
+        Time-complexity: O(C), amortized O(k / RESYNC_EVERY) for re-syncs
+        """
+        changed = current != previous
+        previous, current = previous[changed], current[changed]
+        self.entropy_sum += torch.sum(self.entropic_func(current)) - torch.sum(self.entropic_func(previous))
+        self.n_incremental += 1
+        if self.n_incremental >= self.RESYNC_EVERY:
+            self._resync_statistics()
+
+
+    def _resync_statistics(self) -> None:
+        """
+        WARNING: Updates internal state of current object.
+        Recomputes the running entropy lower bound and sum of cluster sizes exactly
+        Time-complexity: O(k)
         """
-        m = torch.zeros(self.k, self.k, device=self.device)
-        x = self.centroids.unsqueeze(0)
-        y = self.centroids.unsqueeze(1)
-        m = torch.norm(x - y, dim=2, p=2)
-        m.fill_diagonal_(diag)
-        return m
+        self.entropy_sum: Tensor = self.entropy_lb(self.diameters) # (1,)
+        self.size_sum: float = self.cluster_sizes.sum().item()
+        self.n_incremental: int = 0
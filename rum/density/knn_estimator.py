@@ -1,94 +1,267 @@
-import faiss
+import numpy as np
 import torch
 
 from rum.density import Density
 from rum.density.entropic_functions import EntropicFunction
+from rum.density.knn_index import KNN_INDEXES
+from rum.geometry import EuclideanGeometry
+from rum.learner.state_store import STATE_STORES, StateStore
 
-from torch import Tensor
-from typing import Optional
+from torch import Tensor, LongTensor
+from typing import Optional, Tuple
 
 
 class KNNDensityEstimator(Density):
 
-    def __init__(self, k, dim, buffer_max_size, entropic_func: EntropicFunction = None, **kwargs):
+    DEFAULT_CHUNK_SIZE = 1024
+
+    def __init__(self, k, dim, buffer_max_size, entropic_func: EntropicFunction = None,
+                 backend: str = 'flat', backend_kwargs: Optional[dict] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, policy: str = 'random',
+                 policy_kwargs: Optional[dict] = None, storage_dtype: str = 'float32', **kwargs):
         self.k: int = k
         self.dim = dim
-        self.buffer = torch.zeros((buffer_max_size, dim))
-        self.buffer_size = 0
+        if policy not in STATE_STORES:
+            raise ValueError(f"'{policy}' is not a supported buffer policy.")
+        self.store: StateStore = STATE_STORES[policy](buffer_max_size, dim, dtype=getattr(torch, storage_dtype),
+                                                      **(policy_kwargs or {}))
         self.entropic_func = entropic_func if entropic_func is not None \
             else EntropicFunction("log", eps=1)
+        if backend not in KNN_INDEXES:
+            raise ValueError(f"'{backend}' is not a supported backend.")
+        # Long-lived search backend over the buffer, ids are buffer slots.
+        self.index = KNN_INDEXES[backend](dim, **(backend_kwargs or {}))
+        self._simulated_id = buffer_max_size # never a buffer slot
+        self.chunk_size = chunk_size
+        self._euclidean = EuclideanGeometry(dim) # squared L2 matrices, as faiss measures them
+
+        # Maintained k+1 nearest neighbours of each buffered point, the point itself included.
+        # The first k give its pdf estimate, the spare one its estimate once a neighbour is evicted.
+        # Squared L2 distances sorted ascending, missing neighbours are padded like faiss does
+        # and left out of the sums, the buffer holding fewer points than neighbours asked for.
+        self._missing = float(np.finfo(np.float32).max)
+        self.knn_distances = torch.full((buffer_max_size, k + 1), self._missing) # shape: (bmax, k+1)
+        self.knn_ids = torch.full((buffer_max_size, k + 1), -1, dtype=torch.long) # shape: (bmax, k+1)
+        self.entropy_terms = torch.zeros(buffer_max_size) # shape: (bmax,)
+
+    @property
+    def buffer(self) -> Tensor:
+        return self.store.states # shape: (bsize, dim)
+
+    @property
+    def buffer_size(self) -> int:
+        return self.store.size
 
     # --- Public interface methods ---
-        
+
     def learn(self, states: Tensor) -> None:
-        # Update the buffer state with incoming states.
-        self.compute_buffer(states, inplace=True)
+        # Update the buffer state with incoming states and the affected neighbour lists.
+        slots, evicted = self.compute_buffer(states)
+        self._update_neighbours(slots, evicted)
 
     def simulate_step(self, state: Tensor) -> Tensor:
-        b, bsize = self.compute_buffer(state, inplace=False)
-        return self.compute_distances(b[:bsize], b, bsize) # shape: (bsize, bsize)
+        # Temporarily insert the state in the index, evicting the slot the buffer policy would.
+        state = state.view(-1, self.dim) # shape: (1, dim)
+        buffer = self.buffer
+        lost, stored = self.store.simulate_insert(1)
+        slot = int(lost)
+        if not stored:
+            return self.compute_distances(buffer) # shape: (bsize, k)
+        if slot >= 0:
+            self.index.remove(np.array([slot], dtype=np.int64))
+        self._add(state, torch.tensor([self._simulated_id]))
+
+        keep = torch.arange(self.buffer_size) != slot
+        queries = torch.cat((buffer[keep], state)) # shape: (bsize, dim)
+        distances = self.compute_distances(queries) # shape: (bsize, k)
+
+        self.index.remove(np.array([self._simulated_id], dtype=np.int64))
+        if slot >= 0:
+            self._add(buffer[slot:slot+1], torch.tensor([slot]))
+        self._maintain_index()
+        return distances
 
     # --- knn density estimators methods ---
 
     def pdf(self, x: Tensor) -> float:
-        self.pdf_approx(x)
-    
+        return self.pdf_approx(x)
+
     def pdf_approx(self, x: Tensor) -> float:
-        x = x.view(-1, self.dim) # shape: (1, dim)
-        b, bsize = self.compute_buffer(x, inplace=False)
-        distances = self.compute_distances(x, b, bsize).view(-1) # shape: (bsize,)
-        return (1.0 / self.k) * torch.sum(distances)
-    
+        points = x.view(-1, self.dim) # shape: (B, dim)
+        # x is its own first neighbour at distance 0, search the k-1 others.
+        distances = self.compute_distances(points, self.k - 1) if self.k > 1 \
+            else torch.zeros(points.size(0), 1) # shape: (B, k-1)
+        pdf = (1.0 / self.k) * torch.sum(self._present(distances), dim=1) # shape: (B,)
+        return pdf[0] if x.dim() == 1 else pdf
+
     def information(self, x: Tensor) -> float:
         pdx_approx = self.pdf_approx(x)
         return self.entropic_func(pdx_approx)
 
     def entropy(self) -> Tensor:
-        self.entropy_approx()
+        return self.entropy_approx()
 
     def entropy_approx(self, distances: Optional[Tensor] = None) -> Tensor:
-        # TODO This function still has a bug with dimensions.
-        assert distances is None or distances.shape == (self.buffer_size, self.buffer_size)
-        distances = distances or self.compute_distances(self.buffer[:self.buffer_size], self.buffer, self.buffer_size)
-        pdf_approxs = (1.0 / self.k) * torch.sum(distances, dim=1)
-        return torch.sum(self.entropic_func(pdf_approxs))
-    
+        assert distances is None or (distances.dim() == 2 and distances.shape[1] == self.k)
+        if distances is None:
+            # Entropic terms are kept up to date with the neighbour lists.
+            return torch.sum(self.entropy_terms[:self.buffer_size])
+        return torch.sum(self._entropy_terms(distances))
+
+    def simulate_entropy_delta(self, states: Tensor) -> Tensor:
+        # Entropy change of independently inserting each state as simulate_step does,
+        # evicting the slot the buffer policy would, without searching the buffer.
+        # Only neighbour lists gaining the state or losing the evicted point are evaluated.
+        if not isinstance(states, Tensor) or states.dim() != 2:
+            raise ValueError("States must be of shape (B, dim)")
+        size, k, buffer = self.buffer_size, self.k, self.buffer
+        states = states.to(buffer.dtype)
+        lost, stored = self.store.simulate_insert(states.size(0)) # shape: (B,)
+        evicting = lost >= 0
+        deltas = torch.zeros(states.size(0)) # shape: (B,)
+        if size == 0:
+            return deltas
+
+        distances, ids = self.knn_distances[:size], self.knn_ids[:size] # shape: (bsize, k+1)
+        sums = torch.sum(self._present(distances[:, :k]), dim=1) # shape: (bsize,)
+        kth, spare, terms = distances[:, k-1], distances[:, k], self.entropy_terms[:size]
+
+        if evicting.any():
+            # Losing a neighbour among the first k shifts the spare one in.
+            rows = torch.arange(size).unsqueeze(1).expand(-1, k)
+            neighbours = (ids[:, :k] >= 0) & (ids[:, :k] != rows) # shape: (bsize, k)
+            rows, owners, lost_distances = rows[neighbours], ids[:, :k][neighbours], distances[:, :k][neighbours]
+            sums_evicted = sums[rows] - lost_distances + self._present(spare[rows])
+            changes = self._entropy_terms(sums_evicted, summed=True) - terms[rows]
+            deltas_evicted = torch.zeros(size).index_add_(0, owners, changes) - terms # shape: (bsize,)
+            # Referrers of each slot, grouped by slot.
+            order = torch.argsort(owners)
+            rows, owners, sums_evicted = rows[order], owners[order], sums_evicted[order]
+            starts = torch.searchsorted(owners, torch.arange(size + 1))
+
+        for start in range(0, states.size(0), self.chunk_size):
+            end = min(start + self.chunk_size, states.size(0))
+            chunk = torch.arange(end - start)
+            # The GEMM matrix selects neighbours, distances entering the sums are recomputed exactly.
+            d = self._euclidean.assignment_squared_distance_matrix(states[start:end], buffer) # shape: (C, bsize)
+            chunk_sums, chunk_kth = sums.expand(end - start, -1).clone(), kth.expand(end - start, -1).clone()
+            s, ev = lost[start:end].clamp(min=0), evicting[start:end]
+            if ev.any():
+                # Referrers of the evicted slot compare against their spare neighbour.
+                counts = torch.where(ev, starts[s + 1] - starts[s], 0)
+                b = torch.repeat_interleave(chunk, counts)
+                offsets = torch.arange(b.size(0)) - (torch.cumsum(counts, 0) - counts)[b]
+                pairs = starts[s][b] + offsets # positions of (state, referrer) pairs
+                chunk_sums[b, rows[pairs]] = sums_evicted[pairs]
+                chunk_kth[b, rows[pairs]] = spare[rows[pairs]]
+                d[chunk[ev], s[ev]] = self._missing # the evicted point is no neighbour
+
+            # Lists the state enters replace their k-th neighbour.
+            b, i = torch.nonzero(d < chunk_kth, as_tuple=True)
+            exact = self._squared_distances(states[start:end][b], buffer[i]) # shape: (E,)
+            entering = exact < chunk_kth[b, i]
+            b, i, exact = b[entering], i[entering], exact[entering]
+            gains = self._entropy_terms(chunk_sums[b, i] - self._present(chunk_kth[b, i]) + exact, summed=True) \
+                - self._entropy_terms(chunk_sums[b, i], summed=True)
+            deltas[start:end] = torch.zeros(end - start).index_add_(0, b, gains)
+            if ev.any():
+                deltas[start:end] += torch.where(ev, deltas_evicted[s], 0)
+
+            # The state itself is its first neighbour at distance 0.
+            n = min(k - 1, d.size(1))
+            nearest, nearest_idx = torch.topk(d, n, dim=1, largest=False) # shape: (C, n)
+            exact = self._squared_distances(states[start:end].unsqueeze(1), buffer[nearest_idx])
+            own = torch.sum(torch.where(nearest == self._missing, 0, exact), dim=1)
+            deltas[start:end] += self._entropy_terms(own, summed=True)
+        return torch.where(stored, deltas, 0) # shape: (B,)
+
     # --- knn private computation methods ---
 
-    def compute_buffer(self, states: Tensor, inplace=True) -> Tensor:
-        if states.size(0) > self.buffer.size(0):
-            raise ValueError("States size must be less than buffer size.")
-        
-        if inplace:
-            # Use the buffer from current state.
-            b = self.buffer
-        else:
-            # Create a fresh copy of the buffer.
-            b = torch.zeros(self.buffer.shape)
-            b = self.buffer[0:self.buffer_size]
-
-        # Compute the number of slots available in the buffer.
-        num_new_states = states.size(0)
-        num_free_slots = self.buffer.size(0) - self.buffer_size
-        size_overflow = num_new_states - num_free_slots
-
-        if size_overflow > 0:
-            # First pad the buffer with free slots.
-            b[self.buffer_size:self.buffer_size+num_free_slots] = states[:num_free_slots]
-            # Then flush some states to make room for the new ones.
-            # Note: We might drop some incoming states in early stages. (This is okay)
-            drop_idx = torch.randint(low=0, high=self.buffer.size(0), size=(size_overflow,))
-            b[drop_idx] = states[num_free_slots:]
-            return b, self.buffer_size
-        
-        # If there is enough space in the buffer, just append.
-        b[self.buffer_size:self.buffer_size+num_new_states] = states
-        return b, self.buffer_size + num_new_states
-    
-    def compute_distances(self, states: Tensor, buffer: Tensor, bsize: int) -> Tensor:
-        # Create a faiss index (L2 distance)
-        index = faiss.IndexFlatL2(self.dim)
-        index.add(buffer[:bsize].numpy())
-        # Search for the k nearest neighbors.
-        distances, _ = index.search(states.numpy(), self.k) # shape: (states.size(0), k)
-        return torch.tensor(distances)
+    def compute_buffer(self, states: Tensor) -> Tuple[LongTensor, LongTensor]:
+        # Insert states in the buffer following its policy and in its index,
+        # returns written and evicted slots.
+        slots, evicted = self.store.insert(states)
+        if evicted.numel() > 0:
+            self.index.remove(evicted.numpy().astype(np.int64))
+        self._add(self.buffer[slots], slots)
+        self._maintain_index()
+        return slots, evicted
+
+    def compute_distances(self, states: Tensor, k: Optional[int] = None) -> Tensor:
+        distances, _ = self.compute_neighbours(states, k)
+        return distances # shape: (states.size(0), k)
+
+    def compute_neighbours(self, states: Tensor, k: Optional[int] = None) -> Tuple[Tensor, LongTensor]:
+        # Search the k nearest neighbors in the index, no rebuild.
+        k = self.k if k is None else k
+        distances, ids = self.index.search(self._to_faiss(states), k) # shape: (states.size(0), k)
+        return torch.tensor(distances), torch.tensor(ids)
+
+    def recall(self, queries: Optional[Tensor] = None, n_queries: int = 100) -> float:
+        # Recall@k of the search backend against exact brute-force search.
+        buffer = self.buffer
+        if queries is None:
+            queries = buffer[torch.randint(0, max(self.buffer_size, 1), (n_queries,))]
+        k = min(self.k, self.buffer_size)
+        if k == 0:
+            return 1.0
+        _, approx_ids = self.compute_neighbours(queries, k) # shape: (n_queries, k)
+        exact = self._euclidean.squared_distance_matrix(queries.to(buffer.dtype), buffer) # shape: (n_queries, bsize)
+        exact_ids = torch.topk(exact, k, dim=1, largest=False).indices
+        hits = (approx_ids.unsqueeze(2) == exact_ids.unsqueeze(1)).any(dim=2) # shape: (n_queries, k)
+        return hits.float().mean().item()
+
+    def _update_neighbours(self, slots: LongTensor, evicted: LongTensor) -> None:
+        # Update neighbour lists after writing slots, only lists that change are touched:
+        # new points and lists that lost a neighbour are searched again, and others
+        # gaining a new point among their k+1 nearest merge it.
+        size, k, buffer = self.buffer_size, self.k, self.buffer
+        ids = self.knn_ids[:size]
+        stale = torch.isin(ids, evicted).any(dim=1) # shape: (bsize,)
+        stale[slots] = True
+        searched = torch.nonzero(stale).view(-1)
+        if searched.numel() > 0:
+            distances, neighbours = self.compute_neighbours(buffer[searched], k + 1)
+            self.knn_distances[searched], self.knn_ids[searched] = distances, neighbours
+
+        merged = []
+        points = buffer[slots]
+        for rows in torch.nonzero(~stale).view(-1).split(self.chunk_size):
+            d = self._euclidean.assignment_squared_distance_matrix(buffer[rows], points) # shape: (C, slots)
+            rows = rows[(d < self.knn_distances[rows, k:]).any(dim=1)]
+            d = self._euclidean.squared_distance_matrix(buffer[rows], points) # exact for the merged lists
+            distances = torch.cat((self.knn_distances[rows], d), dim=1)
+            neighbours = torch.cat((self.knn_ids[rows], slots.expand(rows.size(0), -1)), dim=1)
+            distances, order = torch.topk(distances, k + 1, dim=1, largest=False)
+            self.knn_distances[rows], self.knn_ids[rows] = distances, torch.gather(neighbours, 1, order)
+            merged.append(rows)
+
+        changed = torch.cat([searched] + merged)
+        self.entropy_terms[changed] = self._entropy_terms(self.knn_distances[changed, :k])
+
+    def _entropy_terms(self, distances: Tensor, summed: bool = False) -> Tensor:
+        # Entropic function of the pdf estimate, given k distances or their sum.
+        sums = distances if summed else torch.sum(self._present(distances), dim=1)
+        return self.entropic_func((1.0 / self.k) * sums)
+
+    def _present(self, distances: Tensor) -> Tensor:
+        # Distances with missing neighbours zeroed out of sums.
+        return torch.where(distances == self._missing, 0, distances)
+
+    @staticmethod
+    def _squared_distances(x: Tensor, y: Tensor) -> Tensor:
+        # Squared L2 distances of matching rows, from their differences.
+        return torch.sum((x - y) ** 2, dim=-1)
+
+    def _add(self, states: Tensor, ids: LongTensor) -> None:
+        self.index.add(self._to_faiss(states), ids.numpy().astype(np.int64))
+
+    def _maintain_index(self) -> None:
+        # Rebuild the search backend from the live buffer when it asks for it.
+        if self.index.stale:
+            points = self._to_faiss(self.buffer)
+            self.index.rebuild(points, np.arange(self.buffer_size, dtype=np.int64))
+
+    @staticmethod
+    def _to_faiss(states: Tensor) -> np.ndarray:
+        return np.ascontiguousarray(states.detach().cpu().numpy(), dtype=np.float32)
@@ -0,0 +1,190 @@
+import faiss
+import numpy as np
+
+from typing import Tuple
+
+
+class KNNIndex():
+    """
+    A base class for the nearest neighbours search backends of the kNN density estimator.
+    Points are identified by integer ids (buffer slots); backends may become stale as points are
+    added and removed, in which case the estimator rebuilds them from the live points.
+    """
+
+    def __init__(self, dim: int) -> None:
+        self.dim = dim
+
+    def add(self, points: np.ndarray, ids: np.ndarray) -> None:
+        """
+        Add points under the given ids.
+        Args: points (np.ndarray): (N, dim) float32 points. ids (np.ndarray): (N,) int64 ids.
+        """
+        raise NotImplementedError()
+
+    def remove(self, ids: np.ndarray) -> None:
+        """
+        Remove points by id.
+        Args: ids (np.ndarray): (N,) int64 ids.
+        """
+        raise NotImplementedError()
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search the k nearest neighbours of queries.
+        Args: queries (np.ndarray): (B, dim) float32 queries. k (int): number of neighbours.
+        Returns: Tuple[np.ndarray, np.ndarray]: (B, k) squared L2 distances and (B, k) ids (-1 if missing).
+        """
+        raise NotImplementedError()
+
+    def rebuild(self, points: np.ndarray, ids: np.ndarray) -> None:
+        """
+        Rebuild the backend from scratch given all live points.
+        Args: points (np.ndarray): (N, dim) float32 points. ids (np.ndarray): (N,) int64 ids.
+        """
+        raise NotImplementedError()
+
+    @property
+    def stale(self) -> bool:
+        """
+        Whether the backend should be rebuilt from the live points.
+        """
+        return False
+
+
+class FlatKNNIndex(KNNIndex):
+    # Exact brute-force search.
+
+    def __init__(self, dim: int) -> None:
+        super().__init__(dim)
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+    def add(self, points, ids):
+        self.index.add_with_ids(points, ids)
+
+    def remove(self, ids):
+        self.index.remove_ids(ids)
+
+    def search(self, queries, k):
+        return self.index.search(queries, k)
+
+    def rebuild(self, points, ids):
+        self.index.reset()
+        self.index.add_with_ids(points, ids)
+
+
+class IVFKNNIndex(KNNIndex):
+    # Inverted file over a coarse quantizer, retrained periodically as the buffer drifts.
+    # Exact search is used until enough points are available to train the quantizer.
+
+    def __init__(self, dim: int, nlist: int = 100, nprobe: int = 8, retrain_every: int = None) -> None:
+        super().__init__(dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.retrain_every = retrain_every if retrain_every is not None else 50 * nlist
+        self.min_train_size = 39 * nlist # faiss recommended minimum
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+        self.trained = False
+        self.n_added = 0 # since last training
+
+    def add(self, points, ids):
+        self.index.add_with_ids(points, ids)
+        self.n_added += points.shape[0]
+
+    def remove(self, ids):
+        self.index.remove_ids(ids)
+
+    def search(self, queries, k):
+        return self.index.search(queries, k)
+
+    def rebuild(self, points, ids):
+        if points.shape[0] < self.min_train_size:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dim))
+            self.trained = False
+        else:
+            quantizer = faiss.IndexFlatL2(self.dim)
+            self.index = faiss.IndexIVFFlat(quantizer, self.dim, self.nlist)
+            self.index.train(points)
+            self.index.nprobe = self.nprobe
+            self.trained = True
+        self.index.add_with_ids(points, ids)
+        self.n_added = 0
+
+    @property
+    def stale(self):
+        if not self.trained:
+            return self.index.ntotal >= self.min_train_size
+        return self.n_added >= self.retrain_every
+
+
+class HNSWKNNIndex(KNNIndex):
+    # Hierarchical navigable small world graph. HNSW does not support removal, so removed points are
+    # tombstoned, filtered out of search results, and the graph is rebuilt once too many accumulate.
+
+    def __init__(self, dim: int, M: int = 32, ef_search: int = 64, ef_construction: int = 40,
+                 max_tombstones: float = 0.1) -> None:
+        super().__init__(dim)
+        self.M = M
+        self.ef_search = ef_search
+        self.ef_construction = ef_construction
+        self.max_tombstones = max_tombstones
+        self._reset()
+
+    def _reset(self):
+        self.index = faiss.IndexHNSWFlat(self.dim, self.M)
+        self.index.hnsw.efConstruction = self.ef_construction
+        self.ids = np.zeros(0, dtype=np.int64) # internal -> id
+        self.alive = np.zeros(0, dtype=bool) # internal -> not tombstoned
+        self.internal = {} # id -> internal
+        self.n_tombstones = 0
+
+    def add(self, points, ids):
+        self.remove(ids) # re-added ids replace their previous point
+        start = self.index.ntotal
+        self.index.add(points)
+        self.ids = np.concatenate((self.ids, ids))
+        self.alive = np.concatenate((self.alive, np.ones(len(ids), dtype=bool)))
+        self.internal.update(zip(ids.tolist(), range(start, start + len(ids))))
+
+    def remove(self, ids):
+        for i in ids.tolist():
+            internal = self.internal.pop(i, None)
+            if internal is not None:
+                self.alive[internal] = False
+                self.n_tombstones += 1
+
+    def search(self, queries, k):
+        distances = np.full((queries.shape[0], k), np.finfo(np.float32).max, dtype=np.float32)
+        ids = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        rows = np.arange(queries.shape[0])
+        kk = 2 * k
+        while rows.size > 0:
+            kk = min(kk, self.index.ntotal)
+            self.index.hnsw.efSearch = max(self.ef_search, kk)
+            d, internal = self.index.search(queries[rows], kk) if kk > 0 else \
+                (np.zeros((rows.size, 0), dtype=np.float32), np.zeros((rows.size, 0), dtype=np.int64))
+            valid = (internal >= 0) & self.alive[np.maximum(internal, 0)]
+            order = np.argsort(~valid, kind='stable', axis=1)[:, :k] # valid neighbours first
+            n = order.shape[1]
+            picked = np.take_along_axis(valid, order, 1)
+            d = np.take_along_axis(d, order, 1)
+            internal = np.take_along_axis(np.maximum(internal, 0), order, 1)
+            distances[rows, :n] = np.where(picked, d, distances[rows, :n])
+            ids[rows, :n] = np.where(picked, self.ids[internal], -1)
+            complete = (picked.sum(axis=1) >= k) | (kk >= self.index.ntotal)
+            rows, kk = rows[~complete], 2 * kk # too many tombstones in the way, search wider
+        return distances, ids
+
+    def rebuild(self, points, ids):
+        self._reset()
+        self.add(points, ids)
+
+    @property
+    def stale(self):
+        return self.n_tombstones > self.max_tombstones * max(len(self.internal), 1)
+
+
+KNN_INDEXES = {
+    'flat': FlatKNNIndex,
+    'ivf': IVFKNNIndex,
+    'hnsw': HNSWKNNIndex,
+}
@@ -47,6 +47,8 @@ from . import walker
 from . import humanoid
 
 from .dmc2gym import GymnasiumWrapper
+from .vec_env import SharedMemoryVecEnv
+from .reset_cache import ResetCache
 
 # Find all domains imported.
 _DOMAINS = {name: module for name, module in locals().items()
@@ -98,7 +100,7 @@ TASKS_BY_DOMAIN = _get_tasks_by_domain(ALL_TASKS)
 
 
 def load(domain_name, task_name, task_kwargs=None, environment_kwargs=None,
-         visualize_reward=False):
+         visualize_reward=False, reset_cache=None, reset_cache_seed=None):
   """Returns an environment from a domain name, task name and optional settings.
 
   ```python
@@ -113,12 +115,24 @@ def load(domain_name, task_name, task_kwargs=None, environment_kwargs=None,
       environment.
     visualize_reward: Optional `bool`. If `True`, object colours in rendered
       frames are set to indicate the reward at each step. Default `False`.
+    reset_cache: Optional `int`. If given, episodes start from one of this
+      many cached initial states, see `ResetCache`. Snapshots are drawn with
+      the task's own random state.
+    reset_cache_seed: Optional `int` seeding the generation of the cached
+      states, and keying the cache. Defaults to the `random` task keyword
+      argument when it is an integer seed. Environments of a pool should share
+      it so that they share the cache.
 
   Returns:
     The requested environment.
   """
-  return build_environment(domain_name, task_name, task_kwargs,
-                           environment_kwargs, visualize_reward)
+  env = build_environment(domain_name, task_name, task_kwargs,
+                          environment_kwargs, visualize_reward)
+  if reset_cache is not None:
+    seed = reset_cache_seed if reset_cache_seed is not None else (task_kwargs or {}).get('random')
+    seed = seed if isinstance(seed, int) else 0
+    env = ResetCache(domain_name, task_name, reset_cache, seed).attach(env)
+  return env
 
 
 def build_environment(domain_name, task_name, task_kwargs=None,
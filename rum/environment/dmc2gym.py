@@ -25,14 +25,39 @@ def flatten_observation(observation):
 
     return _flatten_recursive(observation)
 
+def observation_layout(observation_spec):
+    """Slices of each observation in the flat observation, in the order of flatten_observation."""
+    layout = []
+    start = 0
+    for key, spec in observation_spec.items():
+        size = int(np.prod(spec.shape))
+        layout.append((key, slice(start, start + size)))
+        start += size
+    return layout
+
 class GymnasiumWrapper(gym.Env):
 
-    def __init__(self, env):
+    def __init__(self, env, dtype=np.float64, observation_buffer=None):
         self.env = env
         self.action_space = self._action_space_dmc2gym(env.action_spec())
-        self.observation_space = self._observation_space_dmc2gym(env.observation_spec())
+        self.observation_space = self._observation_space_dmc2gym(env.observation_spec(), dtype)
         self.metadata = {'render.modes': ['rgb_array']}
 
+        # Observations are written with one slice assignment per key into a preallocated buffer.
+        # A given buffer (e.g. in shared memory) is filled in place and views of it are returned,
+        # otherwise each observation is a copy of the internal one.
+        self.layout = observation_layout(env.observation_spec())
+        self.observation_buffer = np.zeros(self.observation_space.shape, dtype=dtype)
+        self.copy_observations = True
+        if observation_buffer is not None:
+            self.set_observation_buffer(observation_buffer)
+
+    def set_observation_buffer(self, buffer):
+        if buffer.shape != self.observation_space.shape:
+            raise ValueError("Observation buffer must be of shape {}".format(self.observation_space.shape))
+        self.observation_buffer = buffer
+        self.copy_observations = False
+
     def step(self, action):
         time_step = self.env.step(action)
         observation = self._observation_dmc2gym(time_step.observation)
@@ -43,6 +68,8 @@ class GymnasiumWrapper(gym.Env):
         return observation, reward, terminated, truncated, info
 
     def reset(self, seed=None):
+        if seed is not None: # Reseeds the task's random state in place, cached resets draw from it too.
+            self.env.task.random.seed(seed)
         time_step = self.env.reset()
         observation = self._observation_dmc2gym(time_step.observation)
         return observation, {}  # Added an empty info dictionary as per new standards
@@ -51,7 +78,7 @@ class GymnasiumWrapper(gym.Env):
         raise NotImplementedError
 
     @staticmethod
-    def _observation_space_dmc2gym(observation_spec):
+    def _observation_space_dmc2gym(observation_spec, dtype=np.float64):
         n_observations = 0
 
         for observation in observation_spec.values():
@@ -62,7 +89,7 @@ class GymnasiumWrapper(gym.Env):
         low = np.array([-np.inf] * n_observations)
         high = np.array([np.inf] * n_observations)
 
-        return gym.spaces.Box(low, high, dtype=np.float64)
+        return gym.spaces.Box(low, high, dtype=dtype)
 
     @staticmethod
     def _action_space_dmc2gym(action_spec):
@@ -71,7 +98,8 @@ class GymnasiumWrapper(gym.Env):
 
         return gym.spaces.Box(low, high, dtype=np.float64)
 
-    @staticmethod
-    def _observation_dmc2gym(observation):
-        flattened = flatten_observation(observation)
-        return np.array(flattened)
+    def _observation_dmc2gym(self, observation):
+        buffer = self.observation_buffer
+        for key, indices in self.layout:
+            buffer[indices] = np.ravel(observation[key])
+        return buffer.copy() if self.copy_observations else buffer
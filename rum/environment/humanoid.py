@@ -102,25 +102,36 @@ def run_pure_state(time_limit=_DEFAULT_TIME_LIMIT, random=None,
 class Physics(mujoco.Physics):
   """Physics simulation with additional features for the Walker domain."""
 
+  def _reload_from_data(self, data):
+    super()._reload_from_data(data)
+    # Indices into `physics.data` of the named fields read every step.
+    model = self.model
+    self._torso_id = model.name2id('torso', 'body')
+    self._head_id = model.name2id('head', 'body')
+    self._extremity_ids = np.array([model.name2id(side + limb, 'body')
+                                    for side in ('left_', 'right_')
+                                    for limb in ('hand', 'foot')])
+    self._com_velocity_slice = _sensor_slice(model, 'torso_subtreelinvel')
+
   def torso_upright(self):
     """Returns projection from z-axes of torso to the z-axes of world."""
-    return self.named.data.xmat['torso', 'zz']
+    return self.data.xmat[self._torso_id, 8]
 
   def head_height(self):
     """Returns the height of the torso."""
-    return self.named.data.xpos['head', 'z']
+    return self.data.xpos[self._head_id, 2]
 
   def center_of_mass_position(self):
     """Returns position of the center-of-mass."""
-    return self.named.data.subtree_com['torso'].copy()
+    return self.data.subtree_com[self._torso_id].copy()
 
   def center_of_mass_velocity(self):
     """Returns the velocity of the center-of-mass."""
-    return self.named.data.sensordata['torso_subtreelinvel'].copy()
+    return self.data.sensordata[self._com_velocity_slice].copy()
 
   def torso_vertical_orientation(self):
     """Returns the z-projection of the torso orientation matrix."""
-    return self.named.data.xmat['torso', ['zx', 'zy', 'zz']]
+    return self.data.xmat[self._torso_id, 6:9].copy()
 
   def joint_angles(self):
     """Returns the state without global orientation or position."""
@@ -128,14 +139,16 @@ class Physics(mujoco.Physics):
 
   def extremities(self):
     """Returns end effector positions in egocentric frame."""
-    torso_frame = self.named.data.xmat['torso'].reshape(3, 3)
-    torso_pos = self.named.data.xpos['torso']
-    positions = []
-    for side in ('left_', 'right_'):
-      for limb in ('hand', 'foot'):
-        torso_to_limb = self.named.data.xpos[side + limb] - torso_pos
-        positions.append(torso_to_limb.dot(torso_frame))
-    return np.hstack(positions)
+    torso_frame = self.data.xmat[self._torso_id].reshape(3, 3)
+    torso_to_limbs = self.data.xpos[self._extremity_ids] - self.data.xpos[self._torso_id]
+    return torso_to_limbs.dot(torso_frame).ravel()
+
+
+def _sensor_slice(model, name):
+  """Returns the slice of a sensor's readings in `physics.data.sensordata`."""
+  sensor_id = model.name2id(name, 'sensor')
+  start = model.sensor_adr[sensor_id]
+  return slice(start, start + model.sensor_dim[sensor_id])
 
 
 class Humanoid(base.Task):
@@ -159,104 +159,151 @@ class Physics(mujoco.Physics):
 
   def _reload_from_data(self, data):
     super()._reload_from_data(data)
-    # Clear cached sensor names when the physics is reloaded.
-    self._sensor_types_to_names = {}
-    self._hinge_names = []
-
-  def _get_sensor_names(self, *sensor_types):
-    try:
-      sensor_names = self._sensor_types_to_names[sensor_types]
-    except KeyError:
-      [sensor_ids] = np.where(np.in1d(self.model.sensor_type, sensor_types))
-      sensor_names = [self.model.id2name(s_id, 'sensor') for s_id in sensor_ids]
-      self._sensor_types_to_names[sensor_types] = sensor_names
-    return sensor_names
+    # Indices into `physics.data` of the named fields read every step. Names
+    # missing from the model of a task (e.g. the ball) get None, and the
+    # accessors reading them raise.
+    model = self.model
+    self._torso_id = model.name2id('torso', 'body')
+    self._toe_ids = np.array([model.name2id(toe, 'body') for toe in _TOES])
+    self._ball_id = _id_or_missing(model, 'ball', 'body')
+    self._workspace_id = _id_or_missing(model, 'workspace', 'site')
+    self._target_id = _id_or_missing(model, 'target', 'site')
+    self._root_dofs = _joint_dofs(model, 'root')
+    self._ball_root_dofs = _joint_dofs(model, 'ball_root')
+
+    [hinge_ids] = np.nonzero(model.jnt_type == enums.mjtJoint.mjJNT_HINGE)
+    self._hinge_qpos = model.jnt_qposadr[hinge_ids]
+    self._hinge_qvel = model.jnt_dofadr[hinge_ids]
+    self._velocimeter = _sensor_indices(
+        model, [model.name2id('velocimeter', 'sensor')])
+    self._force_torque = _sensor_indices(
+        model, _sensor_ids(model, enums.mjtSensor.mjSENS_FORCE,
+                           enums.mjtSensor.mjSENS_TORQUE))
+    self._imu = _sensor_indices(
+        model, _sensor_ids(model, enums.mjtSensor.mjSENS_GYRO,
+                           enums.mjtSensor.mjSENS_ACCELEROMETER))
+    self._rangefinder = _sensor_indices(
+        model, _sensor_ids(model, enums.mjtSensor.mjSENS_RANGEFINDER))
 
   def torso_upright(self):
     """Returns the dot-product of the torso z-axis and the global z-axis."""
-    return np.asarray(self.named.data.xmat['torso', 'zz'])
+    return np.asarray(self.data.xmat[self._torso_id, 8])
 
   def torso_velocity(self):
     """Returns the velocity of the torso, in the local frame."""
-    return self.named.data.sensordata['velocimeter'].copy()
+    return self.data.sensordata[self._velocimeter].copy()
 
   def egocentric_state(self):
     """Returns the state without global orientation or position."""
-    if not self._hinge_names:
-      [hinge_ids] = np.nonzero(self.model.jnt_type ==
-                               enums.mjtJoint.mjJNT_HINGE)
-      self._hinge_names = [self.model.id2name(j_id, 'joint')
-                           for j_id in hinge_ids]
-    return np.hstack((self.named.data.qpos[self._hinge_names],
-                      self.named.data.qvel[self._hinge_names],
+    return np.hstack((self.data.qpos[self._hinge_qpos],
+                      self.data.qvel[self._hinge_qvel],
                       self.data.act))
 
   def toe_positions(self):
     """Returns toe positions in egocentric frame."""
-    torso_frame = self.named.data.xmat['torso'].reshape(3, 3)
-    torso_pos = self.named.data.xpos['torso']
-    torso_to_toe = self.named.data.xpos[_TOES] - torso_pos
+    torso_frame = self.data.xmat[self._torso_id].reshape(3, 3)
+    torso_pos = self.data.xpos[self._torso_id]
+    torso_to_toe = self.data.xpos[self._toe_ids] - torso_pos
     return torso_to_toe.dot(torso_frame)
 
   def force_torque(self):
     """Returns scaled force/torque sensor readings at the toes."""
-    force_torque_sensors = self._get_sensor_names(enums.mjtSensor.mjSENS_FORCE,
-                                                  enums.mjtSensor.mjSENS_TORQUE)
-    return np.arcsinh(self.named.data.sensordata[force_torque_sensors])
+    return np.arcsinh(self.data.sensordata[self._force_torque])
 
   def imu(self):
     """Returns IMU-like sensor readings."""
-    imu_sensors = self._get_sensor_names(enums.mjtSensor.mjSENS_GYRO,
-                                         enums.mjtSensor.mjSENS_ACCELEROMETER)
-    return self.named.data.sensordata[imu_sensors]
+    return self.data.sensordata[self._imu]
 
   def rangefinder(self):
     """Returns scaled rangefinder sensor readings."""
-    rf_sensors = self._get_sensor_names(enums.mjtSensor.mjSENS_RANGEFINDER)
-    rf_readings = self.named.data.sensordata[rf_sensors]
+    rf_readings = self.data.sensordata[self._rangefinder]
     no_intersection = -1.0
     return np.where(rf_readings == no_intersection, 1.0, np.tanh(rf_readings))
 
   def origin_distance(self):
     """Returns the distance from the origin to the workspace."""
-    return np.asarray(np.linalg.norm(self.named.data.site_xpos['workspace']))
+    workspace_id = _require(self._workspace_id, 'workspace')
+    return np.asarray(np.linalg.norm(self.data.site_xpos[workspace_id]))
 
   def origin(self):
     """Returns origin position in the torso frame."""
-    torso_frame = self.named.data.xmat['torso'].reshape(3, 3)
-    torso_pos = self.named.data.xpos['torso']
+    torso_frame = self.data.xmat[self._torso_id].reshape(3, 3)
+    torso_pos = self.data.xpos[self._torso_id]
     return -torso_pos.dot(torso_frame)
 
   def ball_state(self):
     """Returns ball position and velocity relative to the torso frame."""
-    data = self.named.data
-    torso_frame = data.xmat['torso'].reshape(3, 3)
-    ball_rel_pos = data.xpos['ball'] - data.xpos['torso']
-    ball_rel_vel = data.qvel['ball_root'][:3] - data.qvel['root'][:3]
-    ball_rot_vel = data.qvel['ball_root'][3:]
+    data = self.data
+    ball_id = _require(self._ball_id, 'ball')
+    torso_frame = data.xmat[self._torso_id].reshape(3, 3)
+    ball_rel_pos = data.xpos[ball_id] - data.xpos[self._torso_id]
+    ball_qvel = data.qvel[self._ball_root_dofs]
+    ball_rel_vel = ball_qvel[:3] - data.qvel[self._root_dofs][:3]
+    ball_rot_vel = ball_qvel[3:]
     ball_state = np.vstack((ball_rel_pos, ball_rel_vel, ball_rot_vel))
     return ball_state.dot(torso_frame).ravel()
 
   def target_position(self):
     """Returns target position in torso frame."""
-    torso_frame = self.named.data.xmat['torso'].reshape(3, 3)
-    torso_pos = self.named.data.xpos['torso']
-    torso_to_target = self.named.data.site_xpos['target'] - torso_pos
+    torso_frame = self.data.xmat[self._torso_id].reshape(3, 3)
+    torso_pos = self.data.xpos[self._torso_id]
+    torso_to_target = (self.data.site_xpos[_require(self._target_id, 'target')]
+                       - torso_pos)
     return torso_to_target.dot(torso_frame)
 
   def ball_to_target_distance(self):
     """Returns horizontal distance from the ball to the target."""
-    ball_to_target = (self.named.data.site_xpos['target'] -
-                      self.named.data.xpos['ball'])
+    ball_to_target = (self.data.site_xpos[_require(self._target_id, 'target')] -
+                      self.data.xpos[_require(self._ball_id, 'ball')])
     return np.linalg.norm(ball_to_target[:2])
 
   def self_to_ball_distance(self):
     """Returns horizontal distance from the quadruped workspace to the ball."""
-    self_to_ball = (self.named.data.site_xpos['workspace']
-                    -self.named.data.xpos['ball'])
+    self_to_ball = (self.data.site_xpos[_require(self._workspace_id, 'workspace')]
+                    -self.data.xpos[_require(self._ball_id, 'ball')])
     return np.linalg.norm(self_to_ball[:2])
 
 
+def _id_or_missing(model, name, object_type):
+  """Returns the id of a named model element, or None if there is none."""
+  try:
+    return model.name2id(name, object_type)
+  except mujoco.wrapper.core.Error:
+    return None
+
+
+def _require(element_id, name):
+  """Returns the id of a model element read by an accessor, raises if missing."""
+  if element_id is None:
+    raise KeyError('The model has no element named {!r}.'.format(name))
+  return element_id
+
+
+def _joint_dofs(model, name):
+  """Returns the indices in `physics.data.qvel` of a joint's DoFs."""
+  joint_id = _id_or_missing(model, name, 'joint')
+  if joint_id is None:
+    return np.zeros(0, dtype=int)
+  start = model.jnt_dofadr[joint_id]
+  end = (model.jnt_dofadr[joint_id + 1] if joint_id + 1 < model.njnt
+         else model.nv)
+  return np.arange(start, end)
+
+
+def _sensor_ids(model, *sensor_types):
+  """Returns the ids of the sensors of the given types, in model order."""
+  [sensor_ids] = np.where(np.in1d(model.sensor_type, sensor_types))
+  return sensor_ids
+
+
+def _sensor_indices(model, sensor_ids):
+  """Returns the indices in `physics.data.sensordata` of sensors' readings."""
+  return np.concatenate(
+      [np.arange(model.sensor_adr[s_id],
+                 model.sensor_adr[s_id] + model.sensor_dim[s_id])
+       for s_id in sensor_ids] + [np.zeros(0, dtype=int)]).astype(int)
+
+
 def _find_non_contacting_height(physics, orientation, x_pos=0.0, y_pos=0.0):
   """Find a height with no contacts given a body orientation.
 
@@ -0,0 +1,102 @@
+"""Cached initial physics states for fast episode resets."""
+
+import fcntl
+import os
+
+from dm_control.suite import base
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'rum', 'resets')
+DEFAULT_SIZE = 1000
+
+# Tasks whose `initialize_episode` only sets the physics state, so that a
+# snapshot of the state replays the reset. Quadruped escape also generates
+# a new terrain in the model every episode.
+CACHEABLE_TASKS = {
+    'walker': ('stand', 'walk', 'run', 'run_sparse'),
+    'humanoid': ('stand', 'walk', 'run', 'run_sparse', 'run_pure_state'),
+    'quadruped': ('walk', 'run', 'run_sparse', 'fetch'),
+}
+
+# States already loaded in this process by cache path, shared by its environments.
+_LOADED = {}
+
+
+class ResetCache:
+  """Pool of randomized initial physics states of a task, stored on disk.
+
+  The states are generated once by the task's own `initialize_episode`, with
+  a random state seeded by `seed`. Attached to an environment, each episode
+  starts from a random snapshot copied into `physics.data` instead of running
+  the joint randomization and penetration resolving loops again. Environments
+  sharing a seed share the pool, each drawing snapshots with its task's own
+  random state. Concurrent environments wait for the one generating it.
+  """
+
+  def __init__(self, domain_name, task_name, size=DEFAULT_SIZE, seed=0,
+               cache_dir=DEFAULT_CACHE_DIR):
+    if task_name not in CACHEABLE_TASKS.get(domain_name, ()):
+      raise ValueError('Resets of {!r} in domain {!r} cannot be cached.'.format(
+          task_name, domain_name))
+    self.size = size
+    self.seed = seed
+    self.cache_path = os.path.join(cache_dir, '{}_{}_{}_{}.npy'.format(
+        domain_name, task_name, seed, size))
+    self.states = None
+
+  def generate(self, task, physics):
+    """Returns `size` initial states of the task, shape: (size, state size)."""
+    random = task._random
+    task._random = np.random.RandomState(self.seed)
+    states = []
+    try:
+      for _ in range(self.size):
+        with physics.reset_context():
+          task.initialize_episode(physics)
+        states.append(physics.get_state())
+    finally:
+      task._random = random
+    return np.stack(states)
+
+  def load(self, task, physics):
+    """Loads the states from disk, generating and storing them if missing."""
+    state_size = physics.get_state().shape[0]
+    states = _LOADED.get(self.cache_path)
+    if states is not None and states.shape == (self.size, state_size):
+      self.states = states
+      return self.states
+    # Locked so that a single process generates the states of environments created concurrently.
+    os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+    with open(self.cache_path + '.lock', 'w') as lock:
+      fcntl.flock(lock, fcntl.LOCK_EX)
+      self.states = None
+      if os.path.exists(self.cache_path):
+        self.states = np.load(self.cache_path)
+      if self.states is None or self.states.shape != (self.size, state_size):
+        self.states = self.generate(task, physics)
+        # Written under a temporary name, readers never see a partial file.
+        temporary_path = '{}.{}.npy'.format(self.cache_path[:-4], os.getpid())
+        np.save(temporary_path, self.states)
+        os.replace(temporary_path, self.cache_path)
+    _LOADED[self.cache_path] = self.states
+    return self.states
+
+  def attach(self, env):
+    """Replaces the episode initialization of the environment's task.
+
+    Args:
+      env: A `control.Environment` of the cached domain and task.
+
+    Returns:
+      The environment.
+    """
+    task = env.task
+    if self.states is None:
+      self.load(task, env.physics)
+
+    def initialize_episode(physics):
+      physics.set_state(self.states[task.random.randint(self.size)])
+      base.Task.initialize_episode(task, physics)
+
+    task.initialize_episode = initialize_episode
+    return env
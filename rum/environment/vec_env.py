@@ -0,0 +1,202 @@
+import os
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import gymnasium
+from .dmc2gym import GymnasiumWrapper
+
+# Commands from the pool to its workers.
+STEP, RESET, CLOSE, CALL = 0, 1, 2, 3
+
+# Seconds between checks that workers are still alive while waiting on them.
+WORKER_TIMEOUT = 1.0
+
+def _shared_array(shape, dtype):
+    # Named shared memory viewed as an array, without locks. Its name, shape and dtype are
+    # sent to workers already running, which attach to it.
+    dtype = np.dtype(dtype)
+    memory = SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    return memory, (memory.name, shape, dtype)
+
+def _attach(shared):
+    name, shape, dtype = shared
+    memory = SharedMemory(name=name)
+    return memory, _view(memory, shape, dtype)
+
+def _view(memory, shape, dtype):
+    return np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+def _call(envs, name, args, kwargs, indices, values):
+    # Calls a method, or gets an attribute, of some environments, or sets it if values are given.
+    # Returns results by environment index and the error raised if any, sent back to the pool.
+    results = {}
+    try:
+        for position, i in enumerate(indices):
+            if values is not None:
+                setattr(envs[i], name, values[position])
+                results[i] = None
+            else:
+                attribute = getattr(envs[i], name)
+                results[i] = attribute(*args, **kwargs) if callable(attribute) else attribute
+    except Exception as error:
+        return results, error
+    return results, None
+
+def _worker(env_fns, indices, command, start, finished, pipe):
+    envs = [env_fn() for env_fn in env_fns]
+    if 0 in indices: # Spaces of the pool, so that it does not build an environment of its own.
+        pipe.send((envs[0].observation_space, envs[0].action_space))
+    memories, arrays = zip(*[_attach(s) for s in pipe.recv()]) # memories outlive their views
+    observations, final_observations, actions, rewards, terminated, truncated, seeds = arrays
+    for env, i in zip(envs, indices):
+        if isinstance(env, GymnasiumWrapper): # Observations are written in shared memory directly.
+            env.set_observation_buffer(observations[i])
+
+    while True:
+        start.acquire()
+        if command.value == CLOSE:
+            break
+        if command.value == CALL: # Arguments and results go through the pipe, not shared memory.
+            pipe.send(_call(dict(zip(indices, envs)), *pipe.recv()))
+            continue
+        for env, i in zip(envs, indices):
+            if command.value == RESET:
+                observation, _ = env.reset(seed=None if seeds[i] < 0 else int(seeds[i]))
+            else:
+                observation, rewards[i], terminated[i], truncated[i], _ = env.step(actions[i])
+                if terminated[i] or truncated[i]: # Automatic reset, keeping the last observation.
+                    final_observations[i] = observation
+                    observation, _ = env.reset()
+            observations[i] = observation
+        finished.release()
+
+    for env in envs:
+        env.close()
+
+class SharedMemoryVecEnv(gymnasium.vector.VectorEnv):
+    # Environments stepped in worker processes, each worker owning a contiguous block of them.
+    # Observations, actions, rewards and done flags live in shared memory arrays that workers
+    # read and write in place, workers are only signalled with semaphores. Episodes are reset
+    # automatically and their last observations are returned in info['final_observation'].
+    # Method calls and attributes, rare, go through a pipe to each worker. Spaces are sent back
+    # by the worker of the first environment, shared memory is allocated once they are known.
+    def __init__(self, env_fns, n_workers=None, start_method=None):
+        n_workers = min(len(env_fns), os.cpu_count() if n_workers is None else n_workers)
+        ctx = mp.get_context(start_method)
+
+        self.command = ctx.RawValue('i', STEP)
+        self.starts = [ctx.Semaphore(0) for _ in range(n_workers)]
+        self.finished = ctx.Semaphore(0)
+        self.blocks = [indices.tolist() for indices in np.array_split(np.arange(len(env_fns)), n_workers)]
+        self.pipes, self.workers = [], []
+        for indices, start in zip(self.blocks, self.starts):
+            pipe, worker_pipe = ctx.Pipe()
+            worker = ctx.Process(target=_worker, daemon=True, args=(
+                [env_fns[i] for i in indices], indices, self.command, start, self.finished, worker_pipe))
+            worker.start()
+            self.pipes.append(pipe)
+            self.workers.append(worker)
+
+        while not self.pipes[0].poll(WORKER_TIMEOUT):
+            self._check_workers()
+        observation_space, action_space = self.pipes[0].recv()
+        super(SharedMemoryVecEnv, self).__init__(len(env_fns), observation_space, action_space)
+
+        observation_shape = (self.num_envs,) + self.single_observation_space.shape
+        action_shape = (self.num_envs,) + self.single_action_space.shape
+        specs = [
+            (observation_shape, self.single_observation_space.dtype), # observations
+            (observation_shape, self.single_observation_space.dtype), # final observations
+            (action_shape, self.single_action_space.dtype), # actions
+            ((self.num_envs,), np.float64), # rewards
+            ((self.num_envs,), bool), # terminated
+            ((self.num_envs,), bool), # truncated
+            ((self.num_envs,), np.int64), # reset seeds, negative for none
+        ]
+        self.memories, shared = zip(*[_shared_array(shape, dtype) for shape, dtype in specs])
+        self.observations, self.final_observations, self.actions, self.rewards, self.terminated, self.truncated, \
+            self.seeds = [_view(memory, shape, dtype) for memory, (shape, dtype) in zip(self.memories, specs)]
+        for pipe in self.pipes:
+            pipe.send(list(shared))
+
+    def _run(self, command):
+        self.command.value = command
+        for start in self.starts:
+            start.release()
+        for _ in self.workers:
+            while not self.finished.acquire(timeout=WORKER_TIMEOUT):
+                self._check_workers()
+
+    def _check_workers(self):
+        if not all(worker.is_alive() for worker in self.workers):
+            raise RuntimeError("Environment worker exited unexpectedly")
+
+    def _call(self, name, args, kwargs, indices, values=None):
+        # Calls a method, or sets an attribute if values are given, of the environments at indices in their workers.
+        indices = list(range(self.num_envs)) if indices is None else [int(i) for i in indices]
+        self.command.value = CALL
+        for start in self.starts:
+            start.release()
+        for pipe, block in zip(self.pipes, self.blocks): # Every worker answers, possibly for no environment.
+            selected = [position for position, i in enumerate(indices) if i in block]
+            pipe.send((name, args, kwargs, [indices[position] for position in selected],
+                       None if values is None else [values[position] for position in selected]))
+        results, errors = {}, []
+        for pipe in self.pipes:
+            while not pipe.poll(WORKER_TIMEOUT):
+                self._check_workers()
+            worker_results, error = pipe.recv()
+            results.update(worker_results)
+            if error is not None:
+                errors.append(error)
+        if errors:
+            raise errors[0]
+        return [results[i] for i in indices]
+
+    def reset_wait(self, seed=None, options=None):
+        if seed is None:
+            self.seeds[:] = -1
+        else: # One seed for the first environment, the others follow.
+            self.seeds[:] = np.arange(self.num_envs) + seed if np.isscalar(seed) else seed
+        self._run(RESET)
+        return self.observations.copy(), {}
+
+    def step_async(self, actions):
+        self.actions[:] = np.asarray(actions).reshape(self.actions.shape)
+
+    def step_wait(self, **kwargs):
+        self._run(STEP)
+        dones = self.terminated | self.truncated
+        infos = {}
+        if np.any(dones):
+            infos['final_observation'] = self.final_observations.copy()
+            infos['_final_observation'] = dones.copy()
+        return self.observations.copy(), self.rewards.copy(), self.terminated.copy(), self.truncated.copy(), infos
+
+    def call(self, name, *args, indices=None, **kwargs):
+        # Method results, or attribute values, of the environments of the workers, all of them or those at indices.
+        return tuple(self._call(name, args, kwargs, indices))
+
+    def get_attr(self, name):
+        return self.call(name)
+
+    def set_attr(self, name, values, indices=None):
+        # One value per environment at indices if values is a list or tuple, else the same value for all.
+        n = self.num_envs if indices is None else len(indices)
+        if not isinstance(values, (list, tuple)):
+            values = [values] * n
+        if len(values) != n:
+            raise ValueError("Values must be given for each environment")
+        self._call(name, (), {}, indices, values)
+
+    def close_extras(self, **kwargs):
+        self.command.value = CLOSE
+        for start in self.starts:
+            start.release()
+        for worker in self.workers:
+            worker.join()
+        del self.observations, self.final_observations, self.actions, self.rewards, self.terminated, \
+            self.truncated, self.seeds
+        for memory in self.memories:
+            memory.close()
+            memory.unlink()
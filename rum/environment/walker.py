@@ -92,21 +92,28 @@ def run_sparse(time_limit=_DEFAULT_TIME_LIMIT, random=None, environment_kwargs=N
 class Physics(mujoco.Physics):
   """Physics simulation with additional features for the Walker domain."""
 
+  def _reload_from_data(self, data):
+    super()._reload_from_data(data)
+    # Indices into `physics.data` of the named fields read every step.
+    self._torso_id = self.model.name2id('torso', 'body')
+    self._com_velocity_adr = self.model.sensor_adr[
+        self.model.name2id('torso_subtreelinvel', 'sensor')]
+
   def torso_upright(self):
     """Returns projection from z-axes of torso to the z-axes of world."""
-    return self.named.data.xmat['torso', 'zz']
+    return self.data.xmat[self._torso_id, 8]
 
   def torso_height(self):
     """Returns the height of the torso."""
-    return self.named.data.xpos['torso', 'z']
+    return self.data.xpos[self._torso_id, 2]
 
   def horizontal_velocity(self):
     """Returns the horizontal velocity of the center-of-mass."""
-    return self.named.data.sensordata['torso_subtreelinvel'][0]
+    return self.data.sensordata[self._com_velocity_adr]
 
   def orientations(self):
     """Returns planar orientations of all bodies."""
-    return self.named.data.xmat[1:, ['xx', 'xz']].ravel()
+    return self.data.xmat[1:, [0, 2]].ravel()
 
 
 class PlanarWalker(base.Task):
@@ -1,3 +1,5 @@
+from .learned_geometry import LearnedGeometry
 from .neural_geometry import NeuralGeometry
+from .metric_geometry import MetricGeometry
 from .euclidean_geometry import EuclideanGeometry
 from .geometry import Geometry
@@ -13,26 +13,67 @@ class EuclideanGeometry(Geometry):
             raise ValueError("Tensors must be 2D")
         if x.shape[1] != self.dim or y.shape[1] != self.dim:
             raise ValueError("Tensors must lie in ambient space")
-        return torch.norm(x - y, p=2, dim=1)
-
-        #if x.shape == y.shape or x.shape[0] == 1:
-        #    # (B, dim) x (B, dim) -> (B,)
-        #    # (1, dim) x (B, dim) -> (B,)
-        #    d = torch.norm(x - y, p=2, dim=1)
-        #
-        #else:
-        #    # (B1, dim) x (B2, dim) -> (B1, B2)
-        #    x_expanded = x[:, None, :]  # shape (B1, 1, embedding_dim)
-        #    y_expanded = y[None, :, :]  # shape (1, B2, embedding_dim)
-        #    d = torch.norm(x_expanded - y_expanded, p=2, dim=-1)
+
+        if x.shape == y.shape or x.shape[0] == 1 or y.shape[0] == 1:
+            # (B, dim) x (B, dim) -> (B,)
+            # (1, dim) x (B, dim) -> (B,)
+            d = torch.norm(x - y, p=2, dim=1)
+
+        else:
+            # (B1, dim) x (B2, dim) -> (B1, B2)
+            d = self.distance_matrix(x, y)
         return d # pairwise (B,) or matrix (B1, B2)
 
 
+    def distance_matrix(self, x: Tensor, y: Tensor) -> FloatTensor:
+        if len(x.shape) != 2 or len(y.shape) != 2:
+            raise ValueError("Tensors must be 2D")
+        if x.shape[1] != self.dim or y.shape[1] != self.dim:
+            raise ValueError("Tensors must lie in ambient space")
+        # Norms of differences, exact for close points far from the origin. No (B1, B2, dim) tensor.
+        return torch.cdist(x, y, compute_mode='donot_use_mm_for_euclid_dist') # (B1, B2)
+
+
+    def squared_distance_matrix(self, x: Tensor, y: Tensor) -> FloatTensor:
+        return EuclideanGeometry.distance_matrix(self, x, y).pow_(2) # (B1, B2)
+
+
+    def assignment_distance_matrix(self, x: Tensor, y: Tensor) -> FloatTensor:
+        return torch.sqrt(EuclideanGeometry.assignment_squared_distance_matrix(self, x, y)) # (B1, B2)
+
+
+    def assignment_squared_distance_matrix(self, x: Tensor, y: Tensor) -> FloatTensor:
+        if len(x.shape) != 2 or len(y.shape) != 2:
+            raise ValueError("Tensors must be 2D")
+        # ||x||^2 + ||y||^2 - 2 x.y cancels down to an absolute error of order eps * (||x||^2 + ||y||^2),
+        # fine to pick neighbours only. Centering on y bounds the norms by the spread of the points.
+        center = torch.mean(y, dim=0) if y.shape[0] > 0 else y.new_zeros(y.shape[1])
+        x, y = x - center, y - center
+        y_squared = torch.sum(y * y, dim=1) # (B2,)
+
+        def tile(x: Tensor, y: Tensor) -> Tensor:
+            # ||x||^2 + ||y||^2 - 2 x.y as a single GEMM
+            x_squared = torch.sum(x * x, dim=1, keepdim=True) # (rows, 1)
+            d = torch.addmm(x_squared + y_squared, x, y.T, alpha=-2)
+            return torch.clamp_(d, min=0) # (rows, B2)
+
+        return self._tiled_distance_matrix(tile, x, y) # (B1, B2)
+
+
     def interpolate(self, x: Tensor, y: Tensor, alpha: float) -> Tensor:
         if x.shape != (self.dim,) or y.shape != (self.dim,):
             raise ValueError("Tensors must lie in ambient space")
         return (1 - alpha) * x + alpha * y
 
 
-    def learn(self, states: Tensor = None) -> FloatTensor:
+    def interpolate_batch(self, x: Tensor, y: Tensor, alpha: Tensor) -> Tensor:
+        if x.dim() != 2 or x.shape != y.shape or alpha.shape != x.shape[:1]:
+            raise ValueError("Tensors must be of shape (B, dim), (B, dim) and (B,)")
+        if x.shape[1] != self.dim:
+            raise ValueError("Tensors must lie in ambient space")
+        a = alpha.unsqueeze(1) # (B, 1)
+        return (1 - a) * x + a * y
+
+
+    def learn(self, states: Tensor = None, dones: Tensor = None, n_envs: int = 1) -> FloatTensor:
         pass # No learning is required.
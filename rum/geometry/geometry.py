@@ -1,6 +1,10 @@
 from torch import Tensor, FloatTensor
+from typing import Callable
 import torch
 
+# Bound on the number of elements of intermediate (rows, B2) tiles in distance matrices.
+MAX_TILE_ELEMENTS = 2 ** 22
+
 class Geometry():
     """
     A base class representing a geometric structure on a space.
@@ -26,6 +30,48 @@ class Geometry():
         """
         raise NotImplementedError()
 
+    def distance_matrix(self, x: Tensor, y: Tensor) -> FloatTensor:
+        """
+        Compute the matrix of distances between every state of x and every state of y.
+        Falls back to one `distance_function` call per row of x; geometries should override it
+        with a batched implementation whenever they can.
+        Args:
+            x (torch.Tensor): First Tensor. (B1, dim)
+            y (torch.Tensor): Second Tensor. (B2, dim)
+        Returns: FloatTensor: (B1, B2) Matrix of pairwise distances.
+        """
+        if x.dim() != 2 or y.dim() != 2:
+            raise ValueError("Tensors must be 2D")
+        rows = [self.distance_function(xi.unsqueeze(0), y).reshape(-1) for xi in x]
+        return torch.stack(rows) if len(rows) > 0 else y.new_zeros((0, y.shape[0]))
+
+    def assignment_distance_matrix(self, x: Tensor, y: Tensor) -> FloatTensor:
+        """
+        Compute a distance matrix only used to select the closest states of y to each state of x,
+        e.g. by argmin or topk. Geometries may trade a small absolute error for speed there,
+        distances that are kept or summed must come from `distance_matrix`.
+        Args:
+            x (torch.Tensor): First Tensor. (B1, dim)
+            y (torch.Tensor): Second Tensor. (B2, dim)
+        Returns: FloatTensor: (B1, B2) Matrix of approximate pairwise distances.
+        """
+        return self.distance_matrix(x, y)
+
+    def _tiled_distance_matrix(self, tile: Callable[[Tensor, Tensor], Tensor], x: Tensor, y: Tensor) -> FloatTensor:
+        """
+        Compute a distance matrix tile by tile over the rows of x, so that intermediate
+        tensors of the computation stay within MAX_TILE_ELEMENTS.
+        Args:
+            tile (Callable): Computes the (rows, B2) distances of a tile of x to y.
+            x (torch.Tensor): First Tensor. (B1, dim)
+            y (torch.Tensor): Second Tensor. (B2, dim)
+        Returns: FloatTensor: (B1, B2) Matrix of pairwise distances.
+        """
+        rows = max(1, MAX_TILE_ELEMENTS // max(y.shape[0], 1))
+        if x.shape[0] <= rows:
+            return tile(x, y)
+        return torch.cat([tile(x[start:start + rows], y) for start in range(0, x.shape[0], rows)])
+
     def interpolate(self, x: Tensor, y: Tensor, alpha: float) -> Tensor:
         """
         Interpolate between states x and y, using a specified weight.
@@ -36,4 +82,20 @@ class Geometry():
         Returns: torch.Tensor: Interpolated state between x and y.
         """
         raise NotImplementedError()
+
+    def interpolate_batch(self, x: Tensor, y: Tensor, alpha: Tensor) -> Tensor:
+        """
+        Interpolate row-wise between states x and y, using a weight per row.
+        Falls back to one `interpolate` call per row; geometries should override it
+        with a batched implementation whenever they can.
+        Args:
+            x (torch.Tensor): Points from which to start interpolation. (B, dim)
+            y (torch.Tensor): Points towards which x are drifting. (B, dim)
+            alpha (torch.Tensor): Interpolation weights of y. (B,)
+        Returns: torch.Tensor: (B, dim) Interpolated states between x and y.
+        """
+        if x.dim() != 2 or x.shape != y.shape or alpha.shape != x.shape[:1]:
+            raise ValueError("Tensors must be of shape (B, dim), (B, dim) and (B,)")
+        rows = [self.interpolate(xi, yi, ai.item()) for xi, yi, ai in zip(x, y, alpha)]
+        return torch.stack(rows) if len(rows) > 0 else x.clone()
     
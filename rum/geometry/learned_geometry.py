@@ -0,0 +1,131 @@
+from ..learner import Learner
+from .geometry import Geometry
+from .euclidean_geometry import EuclideanGeometry
+from .neural_utils.trainer import ContrastiveTrainer
+from .neural_utils.dataset import *
+from typing import Union
+from torch import Tensor, FloatTensor
+from torch.optim.lr_scheduler import StepLR
+import numpy as np
+import torch
+
+
+LEARNING_RATE = 0.0001
+WEIGHT_DECAY = 0.01
+BATCH_SIZE = 128
+
+BATCHES_PER_LEARN = 2
+DATASET_SIZE = 100000
+NEGATIVE_SAMPLE_SCALING = 1.0
+NEGATIVE_MARGIN = 1.0
+
+
+class LearnedGeometry(Geometry, Learner):
+    """
+    Base class of geometries whose distance is that of an embedding network in a space with geometry d,
+    trained on the temporal contrastive objective by a ContrastiveTrainer.
+    Holds the optimizer, scheduler, pair samplers and trainer, and a version incremented whenever the
+    network learns. Subclasses build the network and provide the embedding and distance queries.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        network: torch.nn.Module,
+        d: Geometry,
+        # HYPERPARAMETERS
+        learning_rate: float = LEARNING_RATE,
+        weight_decay: float = WEIGHT_DECAY,
+        batch_size: int = BATCH_SIZE,
+        batches_per_learn: int = BATCHES_PER_LEARN,
+        negative_sample_scaling: float = NEGATIVE_SAMPLE_SCALING,
+        negative_margin: float = NEGATIVE_MARGIN,
+        # TORCH PARAMETERS
+        device: torch.device = torch.device('cpu'),
+        dtype: torch.dtype = torch.float32,
+        # LEARNER BUFFER
+        buffer_size: int = 1000,
+        dataset_size: int = DATASET_SIZE,
+        storage_dtype: str = 'float32',
+    ) -> None:
+
+        Geometry.__init__(self, dim)
+        Learner.__init__(self, dim, buffer_size)
+
+        self.device = device
+        self.dtype = dtype
+        self.network = network
+        self.d = d
+
+        self.learning_rate = learning_rate
+        self.weight_decay = weight_decay
+        self.batch_size = batch_size
+        self.batches_per_learn = batches_per_learn
+        self.negative_sample_scaling = negative_sample_scaling
+        self.negative_margin = negative_margin
+
+        # self.optimizer = torch.optim.Adam(self.network.parameters(), lr=LEARNING_RATE)
+        # self.optimizer = torch.optim.SGD(self.network.parameters(), lr=LEARNING_RATE)
+        # self.scheduler = CosineAnnealingLR(self.optimizer, T_max=100)
+
+        self.optimizer = torch.optim.AdamW(self.network.parameters(), lr=self.learning_rate, weight_decay=self.weight_decay)
+        self.scheduler = StepLR(self.optimizer, step_size=50, gamma=0.1)
+
+        # Incremented whenever the network learns, keys cached embeddings.
+        self.version = 0
+
+        self.positive_sampler = PositivePairSampler(dim, capacity=dataset_size, dtype=getattr(torch, storage_dtype))
+        self.negative_sampler = RandomPairSampler(dim)
+
+        self.trainer = ContrastiveTrainer(
+            self.network, self.optimizer, self.scheduler, self.d,
+            self.positive_sampler, self.negative_sampler,
+            batch_size=self.batch_size,
+            negative_sample_scaling=self.negative_sample_scaling,
+            negative_margin=self.negative_margin,
+            device=self.device,
+            dtype=self.dtype,
+        )
+
+
+    def __call__(self, x: Tensor, y: Tensor) -> FloatTensor:
+        return self.distance_function(x, y)
+
+
+    def embed(self, x: Tensor) -> Tensor:
+        raise NotImplementedError()
+
+
+    def embedded_distance_matrix(self, embedded_x: Tensor, embedded_y: Tensor) -> FloatTensor:
+        return self.d.distance_matrix(embedded_x, embedded_y) # (B1, B2)
+
+
+    def learn(self, states: Tensor = None, dones: Tensor = None, n_envs: int = 1) -> FloatTensor:
+        self.trainer.add(states, dones, n_envs)
+        if self.trainer.n_pairs == 0:
+            return -1.0
+
+        total_loss = self.trainer.step(self.batches_per_learn)
+        self.version += 1
+
+        return total_loss
+
+
+    def _port_to_tensor(self, input: Union[np.ndarray, Tensor]) -> Tensor:
+        if isinstance(input, torch.Tensor) and input.dtype == self.dtype and input.device == self.device:
+            return input
+        if isinstance(input, np.ndarray):
+            return torch.tensor(input, device=self.device, dtype=self.dtype)
+        elif isinstance(input, torch.Tensor):
+            return input.to(device=self.device, dtype=self.dtype)
+        else:
+            raise ValueError("Unsupported input type. Expected numpy.ndarray \
+                    or torch.Tensor, got: {}".format(type(input)))
+
+
+    def interpolate(self, p, q, alpha):
+        return EuclideanGeometry.interpolate(self, p, q, alpha)
+
+
+    def interpolate_batch(self, p, q, alpha):
+        return EuclideanGeometry.interpolate_batch(self, p, q, alpha)
@@ -0,0 +1,109 @@
+from .learned_geometry import LearnedGeometry, LEARNING_RATE, WEIGHT_DECAY, BATCH_SIZE, BATCHES_PER_LEARN, \
+    DATASET_SIZE, NEGATIVE_SAMPLE_SCALING, NEGATIVE_MARGIN
+from .euclidean_geometry import EuclideanGeometry
+from typing import Optional
+from torch import Tensor, FloatTensor
+import torch
+
+
+class MetricGeometry(LearnedGeometry):
+    """
+    A learned Mahalanobis geometry d(x, y) = ||L(x - y)|| with a low rank L of shape (rank, dim),
+    trained with the same temporal contrastive objective as NeuralGeometry.
+    Straight lines are geodesics of such a metric, so interpolation is exact, and distance
+    matrices are a single GEMM in the rank dimensional embedding space.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        rank: Optional[int] = None,
+        # HYPERPARAMETERS
+        learning_rate: float = LEARNING_RATE,
+        weight_decay: float = WEIGHT_DECAY,
+        batch_size: int = BATCH_SIZE,
+        batches_per_learn: int = BATCHES_PER_LEARN,
+        negative_sample_scaling: float = NEGATIVE_SAMPLE_SCALING,
+        negative_margin: float = NEGATIVE_MARGIN,
+        # TORCH PARAMETERS
+        device: torch.device = torch.device('cpu'),
+        dtype: torch.dtype = torch.float32,
+        # LEARNER BUFFER
+        buffer_size: int = 1000,
+        dataset_size: int = DATASET_SIZE,
+        storage_dtype: str = 'float32',
+    ) -> None:
+
+        rank = dim if rank is None else rank
+        if not isinstance(rank, int) or not 0 < rank <= dim:
+            raise ValueError("Rank must be an integer in the range (0, dim]")
+        self.rank = rank
+
+        # L as a linear layer, initialised to the Euclidean metric on the first rank coordinates.
+        network = torch.nn.Linear(dim, rank, bias=False).to(device=device, dtype=dtype)
+        with torch.no_grad():
+            network.weight.copy_(torch.eye(rank, dim))
+
+        LearnedGeometry.__init__(
+            self, dim, network, EuclideanGeometry(rank),
+            learning_rate=learning_rate,
+            weight_decay=weight_decay,
+            batch_size=batch_size,
+            batches_per_learn=batches_per_learn,
+            negative_sample_scaling=negative_sample_scaling,
+            negative_margin=negative_margin,
+            device=device,
+            dtype=dtype,
+            buffer_size=buffer_size,
+            dataset_size=dataset_size,
+            storage_dtype=storage_dtype,
+        )
+
+        self._LT: Optional[Tensor] = None # L^T for the queries, cached per version
+        self._LT_version = -1
+
+
+    @property
+    def L(self) -> Tensor:
+        # Current metric factor, shape: (rank, dim)
+        return self.network.weight.detach()
+
+
+    @property
+    def M(self) -> Tensor:
+        # Current PSD metric L^T L, shape: (dim, dim)
+        return self.L.T @ self.L
+
+
+    @property
+    def LT(self) -> Tensor:
+        # Contiguous L^T, rebuilt only once the metric has learned, shape: (dim, rank)
+        if self._LT_version != self.version:
+            self._LT = self.L.T.contiguous()
+            self._LT_version = self.version
+        return self._LT
+
+
+    def embed(self, x: Tensor) -> Tensor:
+        # Euclidean distances between embeddings are the metric distances, shape: (B, rank)
+        return self._port_to_tensor(x) @ self.LT
+
+
+    def distance_function(self, x: Tensor, y: Tensor) -> FloatTensor:
+        x, y = self._port_to_tensor(x), self._port_to_tensor(y)
+
+        assert x.dim() in [1, 2] and y.dim() in [1, 2] # (dim,) or (B, dim)
+        x, y = x.unsqueeze(0) if x.dim() == 1 else x, y.unsqueeze(0) if y.dim() == 1 else y # (B, dim)
+
+        if x.shape[0] != y.shape[0] and x.shape[0] != 1 and y.shape[0] != 1: # (B1, dim) vs (B2, dim)
+            return self.distance_matrix(x, y) # (B1, B2)
+
+        # (B, dim) vs (B, dim) or (1, dim) vs (B, dim)
+        return torch.linalg.vector_norm((x - y) @ self.LT, dim=1) # (B,)
+
+
+    def distance_matrix(self, x: Tensor, y: Tensor) -> FloatTensor:
+        x, y = self._port_to_tensor(x), self._port_to_tensor(y)
+        if x.dim() != 2 or y.dim() != 2:
+            raise ValueError("Tensors must be 2D")
+        return self.d.distance_matrix(self.embed(x), self.embed(y)) # (B1, B2)
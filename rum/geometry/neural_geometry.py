@@ -1,42 +1,28 @@
-from ..learner import Learner
-from .geometry import Geometry
+from .learned_geometry import LearnedGeometry, LEARNING_RATE, WEIGHT_DECAY, BATCH_SIZE, BATCHES_PER_LEARN, \
+    DATASET_SIZE, NEGATIVE_SAMPLE_SCALING, NEGATIVE_MARGIN
 from .euclidean_geometry import EuclideanGeometry
 from .neural_utils import MLP
-from .neural_utils.dataset import *
-from typing import Callable, Union
-import torch.utils.data as D
-from itertools import islice
+from .neural_utils.trainer import AsyncTrainer, PUBLISH_INTERVAL
+from typing import Callable, Optional
 from torch import Tensor, FloatTensor
-from torch.optim.lr_scheduler import StepLR
-from torch.optim.lr_scheduler import CosineAnnealingLR
-import numpy as np
 import torch
 
 def_device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
 def_dtype = torch.float32
 
 
-LEARNING_RATE = 0.0001
-WEIGHT_DECAY = 0.01
-BATCH_SIZE = 128
-
-BATCHES_PER_LEARN = 2
-NEGATIVE_SAMPLE_SCALING = 1.0
-NEGATIVE_MARGIN = 1.0
-
-
-class NeuralGeometry(Geometry, Learner):
+class NeuralGeometry(LearnedGeometry):
     
     def __init__(
         self,
-        # ARCHITECTURE MODEL
+        # ARCHITECTURE MODEL
         dim: int,
         hidden_dims: list[int],
         embedding_dim: int,
         activation: torch.nn.Module = torch.nn.ReLU(),
-        # HYPERPARAMETERS
+        # HYPERPARAMETERS
         learning_rate: float = LEARNING_RATE,
-        weight_decay: float = 0.01,
+        weight_decay: float = WEIGHT_DECAY,
         batch_size: int = BATCH_SIZE,
         batches_per_learn: int = BATCHES_PER_LEARN,
         negative_sample_scaling: float = NEGATIVE_SAMPLE_SCALING,
@@ -44,99 +30,137 @@ class NeuralGeometry(Geometry, Learner):
         # TORCH PARAMETERS
         device: torch.device = torch.device('cpu'),
         dtype: torch.dtype = torch.float32,
-        # AMBIENT DIM DISTANCE
+        # AMBIENT DIM DISTANCE
         d: Callable = None,
-        # LEARNER BUFFER
+        # LEARNER BUFFER
         buffer_size: int = 1000,
+        dataset_size: int = DATASET_SIZE,
+        storage_dtype: str = 'float32',
+        # INFERENCE NETWORK
+        compile_mode: Optional[str] = None,
+        # BACKGROUND TRAINING
+        asynchronous: bool = False,
+        publish_every: int = 1,
+        publish_interval: float = PUBLISH_INTERVAL,
     ) -> None:
 
-        Geometry.__init__(self, dim)
-        Learner.__init__(self, dim, buffer_size)
+        if compile_mode not in [None, 'script', 'compile']:
+            raise ValueError("Compile mode must be None, 'script' or 'compile'")
 
-        self.device = device
-        self.dtype = dtype
-
-        self.network = MLP(
+        network = MLP(
             input_dim=dim,
             output_dim=embedding_dim,
             hidden_dims=hidden_dims,
             activation=activation
-        ).to(self.device)
-
-        self.d = EuclideanGeometry(embedding_dim) if d is None else d
-
-        self.learning_rate = learning_rate
-        self.weight_decay = weight_decay
-        self.batch_size = batch_size
-        self.batches_per_learn = batches_per_learn
-        self.negative_sample_scaling = negative_sample_scaling
-        self.negative_margin = negative_margin
-
-        # self.optimizer = torch.optim.Adam(self.network.parameters(), lr=LEARNING_RATE)
-        # self.optimizer = torch.optim.SGD(self.network.parameters(), lr=LEARNING_RATE)
-        # self.scheduler = CosineAnnealingLR(self.optimizer, T_max=100)
-
-        self.optimizer = torch.optim.AdamW(self.network.parameters(), lr=self.learning_rate, weight_decay=self.weight_decay)
-        self.scheduler = StepLR(self.optimizer, step_size=50, gamma=0.1)
-
-        self.positive_batcher = D.DataLoader(PositiveDataset(dim), batch_size=self.batch_size)
-        self.negative_batcher = D.DataLoader(RandomDataset(dim), batch_size=self.batch_size)
-        self.loader = zip(self.positive_batcher, self.negative_batcher)
-
-    
-    def __call__(self, x: Tensor, y: Tensor) -> FloatTensor:
-        self.network.eval()
-        with torch.no_grad():
-            return self.distance_function(x, y)
+        ).to(device)
+
+        LearnedGeometry.__init__(
+            self, dim, network, EuclideanGeometry(embedding_dim) if d is None else d,
+            learning_rate=learning_rate,
+            weight_decay=weight_decay,
+            batch_size=batch_size,
+            batches_per_learn=batches_per_learn,
+            negative_sample_scaling=negative_sample_scaling,
+            negative_margin=negative_margin,
+            device=device,
+            dtype=dtype,
+            buffer_size=buffer_size,
+            dataset_size=dataset_size,
+            storage_dtype=storage_dtype,
+        )
+
+        # Fused copy of the network for distance queries, refreshed when the version changes.
+        self.compile_mode = compile_mode
+        self._inference_fused: Optional[torch.nn.Module] = None
+        self._inference_network: Optional[Callable] = None
+        self._inference_version = -1
+
+        # Optimizer steps in a background process, weights are pulled at the start of each learn call.
+        self.asynchronous = asynchronous
+        self.async_trainer = AsyncTrainer(self.trainer, self.batches_per_learn, publish_every, publish_interval) \
+            if asynchronous else None
+
+
+    def pull(self) -> int:
+        # Loads the weights last published by the background trainer, if newer, returns the version.
+        if self.async_trainer is not None:
+            self.version = self.async_trainer.pull(self.network, self.version)
+        return self.version
 
 
     def distance_function(self, x: Tensor, y: Tensor) -> FloatTensor:
+        # Inference path, see embed. Training goes through ContrastiveTrainer.distance.
         x, y = self._port_to_tensor(x), self._port_to_tensor(y)
-        
+
         assert x.dim() in [1, 2] and y.dim() in [1, 2] # (dim,) or (B, dim)
         x, y = x.unsqueeze(0) if x.dim() == 1 else x, y.unsqueeze(0) if y.dim() == 1 else y # (B, dim)
-        
-        if x.shape == y.shape: # (B, dim) vs (B, dim)
-            concatenated = torch.cat((x, y), dim=0) # (2B, dim)
-            embeddings = self.network(concatenated) # (2B, embedding_dim)
-            embedded_x, embedded_y = torch.chunk(embeddings, 2, dim=0) # (B, embedding_dim)
-        
-        else: # kmeans optim: (1, dim) vs (B, dim)
-            concatenated = torch.cat((x, y), dim=0) # (B+1, dim)
-            embeddings = self.network(concatenated) # (B+1, embedding_dim)
-            embedded_x, embedded_y = embeddings[:1], embeddings[1:] # (1, embedding_dim), (B, embedding_dim)
 
-        return self.d(embedded_x, embedded_y) # (B,)
-
-
-    def learn(self, states: Tensor = None) -> FloatTensor:
-        self.positive_batcher.dataset.add(states)
-        if len(self.positive_batcher.dataset.samples) < 2: 
-            return -1.0
-        
-        self.network.train()
-        total_loss = 0.0
-
-        for positive_batch, negative_batch in islice(self.loader, self.batches_per_learn):
-            self.optimizer.zero_grad()
-
-            positive_batch = positive_batch.to(self.device)
-            pos_difference = self.distance_function(positive_batch[:, 0, :], positive_batch[:, 1, :])
-            positive_loss = torch.sum(pos_difference)
-
-            negative_batch = negative_batch.to(self.device)
-            neg_difference = self.distance_function(negative_batch[:, 0, :], negative_batch[:, 1, :])
-            negative_loss = - self.negative_sample_scaling * torch.sum(torch.relu(neg_difference - self.negative_margin))
+        if x.shape[0] != y.shape[0] and x.shape[0] != 1 and y.shape[0] != 1: # (B1, dim) vs (B2, dim)
+            return self.distance_matrix(x, y) # (B1, B2)
 
-            loss = positive_loss + negative_loss
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(self.network.parameters(), max_norm=1.0)
-            self.optimizer.step()
-            total_loss += loss.item()
+        # (B, dim) vs (B, dim) or (1, dim) vs (B, dim)
+        embeddings = self.embed(torch.cat((x, y), dim=0)) # (B1+B2, embedding_dim)
+        embedded_x, embedded_y = embeddings[:x.shape[0]], embeddings[x.shape[0]:]
+        return self.d(embedded_x, embedded_y) # (B,)
 
-        self.scheduler.step()
 
-        return total_loss
+    def embed(self, x: Tensor) -> Tensor:
+        # Inference embeddings, BatchNorm uses its running statistics so that
+        # embeddings do not depend on the rest of the batch and can be cached.
+        network = self._refresh_inference()
+        with torch.inference_mode():
+            embeddings = network(self._port_to_tensor(x)) # (B, embedding_dim)
+        return embeddings.clone() # usable outside inference mode
+
+
+    def _refresh_inference(self) -> Callable:
+        # Fuses Linear+BatchNorm layers of the current network, compiled once, weights
+        # are copied in place afterwards so that compiled graphs are reused.
+        version = self.version
+        if self._inference_version != version:
+            fused = self.network.fused()
+            if self._inference_fused is None:
+                self._inference_fused = fused
+                if self.compile_mode == 'script':
+                    self._inference_network = torch.jit.script(fused)
+                elif self.compile_mode == 'compile':
+                    self._inference_network = torch.compile(fused)
+                else:
+                    self._inference_network = fused
+            else:
+                with torch.no_grad():
+                    for target, source in zip(self._inference_fused.parameters(), fused.parameters()):
+                        target.copy_(source)
+            self._inference_version = version
+        return self._inference_network
+
+
+    def distance_matrix(self, x: Tensor, y: Tensor) -> FloatTensor:
+        x, y = self._port_to_tensor(x), self._port_to_tensor(y)
+        if x.dim() != 2 or y.dim() != 2:
+            raise ValueError("Tensors must be 2D")
+        # Embed every state once, then a single distance matrix in embedding space.
+        embeddings = self.embed(torch.cat((x, y), dim=0)) # (B1+B2, embedding_dim)
+        embedded_x, embedded_y = embeddings[:x.shape[0]], embeddings[x.shape[0]:]
+        return self.d.distance_matrix(embedded_x, embedded_y) # (B1, B2)
+
+
+    def learn(self, states: Tensor = None, dones: Tensor = None, n_envs: int = 1) -> FloatTensor:
+        if self.async_trainer is not None:
+            # Weights only change here, between learning steps of the density, not within its queries.
+            self.pull()
+            # Streams states to the background trainer, returns its last loss.
+            if states is not None:
+                self.async_trainer.add(self._port_to_tensor(states).view(-1, self.dim), dones, n_envs)
+            return self.async_trainer.loss.value
+
+        return LearnedGeometry.learn(self, states, dones, n_envs)
+
+
+    def close(self) -> None:
+        # Stops the background trainer, if any.
+        if self.async_trainer is not None:
+            self.async_trainer.close()
     
     
     def euclidean(self, x: Tensor, y: Tensor) -> FloatTensor:
@@ -144,19 +168,6 @@ class NeuralGeometry(Geometry, Learner):
         return torch.norm(x - y, p=2, dim=1) # (B,)
 
 
-    def _port_to_tensor(self, input: Union[np.ndarray, Tensor]) -> Tensor:
-        if isinstance(input, np.ndarray):
-            return torch.tensor(input, device=self.device, dtype=self.dtype)
-        elif isinstance(input, torch.Tensor):
-            return input.to(device=self.device, dtype=self.dtype)
-        else:
-            raise ValueError("Unsupported input type. Expected numpy.ndarray \
-                    or torch.Tensor, got: {}".format(type(input)))
-
-    def interpolate(self, p, q, alpha):
-      return EuclideanGeometry.interpolate(self, p, q, alpha)
-
-
 if __name__ == '__main__':
     d = NeuralGeometry(3, [4, 8, 16], 32)
     x = torch.tensor([1, 2, 3], dtype=torch.float)
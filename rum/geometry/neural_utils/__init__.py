@@ -1,3 +1,4 @@
-from .trainer import Trainer
+from .trainer import Trainer, ContrastiveTrainer, AsyncTrainer
 from .dataset import *
-from .mlp import MLP
\ No newline at end of file
+from .mlp import MLP
+from .embedding_cache import EmbeddingCache
\ No newline at end of file
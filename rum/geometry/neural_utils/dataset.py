@@ -1,44 +1,100 @@
-import torch.utils.data as D
-from torch import Tensor
+from torch import Tensor, LongTensor
+from typing import Optional
+from rum.learner.state_store import RingStore
 import numpy as np
-import random
 import torch
 
 
-class PositiveDataset(D.IterableDataset):
-    
-    def __init__(self, dim: int):
-        super(PositiveDataset, self).__init__()
-        self.samples = []
+class PositivePairSampler():
+    """
+    Consecutive states of trajectories kept in a preallocated ring, sampled as positive pairs.
+    Episode ends are flagged per slot so that pairs never cross a reset, and whole batches
+    of pairs are drawn with a single indexing op.
+    """
+
+    def __init__(self, dim: int, capacity: int = 100000, dtype: torch.dtype = torch.float32):
+        # Most recent states in insertion order, the successor of a slot is the next slot.
+        self.samples = RingStore(capacity, dim, dtype=dtype)
+        self.ends = torch.ones(capacity, dtype=torch.bool) # (capacity,) last state of its episode
         self.dim = dim
+        self._starts: Optional[LongTensor] = None # slots starting a pair, cached until next add
+
+
+    @property
+    def size(self) -> int:
+        return self.samples.size
+
+
+    @property
+    def n_pairs(self) -> int:
+        return self.starts.numel()
+
 
-    
-    def __iter__(self):
-        while True:
-            idx = random.randrange(len(self.samples) - 1)
-            yield torch.stack([self.samples[idx], self.samples[idx + 1]])
+    @property
+    def starts(self) -> LongTensor:
+        if self._starts is None:
+            # The newest state has no successor yet, even when its trajectory carries on.
+            open_ = ~self.ends[:self.size]
+            if self.size > 0:
+                open_[(self.samples.head - 1) % self.samples.capacity] = False
+            self._starts = torch.nonzero(open_).view(-1)
+        return self._starts
 
-    
-    def add(self, data: Tensor):
+
+    def add(self, data: Tensor, dones: Optional[Tensor] = None, n_envs: int = 1):
+        """
+        Adds consecutive states of n_envs environments. Without dones the last state of each
+        environment ends an episode, with dones a trajectory carries on into the next add
+        Params: data: (T*n_envs, dim) or (dim,) states, step-major across environments
+                dones: (T*n_envs,) episode ends, same layout n_envs: number of environments
+        """
         if data is None: return
         if isinstance(data, np.ndarray):
             data = torch.tensor(data)
-        if len(data.shape) == 1:
-            self.samples.append(data)
-        elif len(data.shape) == 2:
-            self.samples.extend(data)
+        data = data.reshape(-1, self.dim)
+        if data.shape[0] % n_envs != 0:
+            raise ValueError("Number of states must be a multiple of n_envs.")
+        if data.shape[0] == 0: return
+        ends = torch.zeros(data.shape[0], dtype=torch.bool) if dones is None \
+            else torch.as_tensor(dones, dtype=torch.bool).reshape(-1).clone()
+        if ends.shape[0] != data.shape[0]:
+            raise ValueError("dones must have one entry per state.")
+        if n_envs > 1 or dones is None:
+            # Step-major (T, n_envs) to one trajectory per environment stored back to back.
+            # Each one ends its segment, the next slot holds another environment or call.
+            data = data.view(-1, n_envs, self.dim).transpose(0, 1).reshape(-1, self.dim)
+            ends = ends.view(-1, n_envs).t().contiguous()
+            ends[:, -1] = True
+            ends = ends.view(-1)
+
+        # Only the most recent states fit in the ring.
+        capacity = self.samples.capacity
+        data, ends = data[-capacity:], ends[-capacity:]
+        self.ends[(self.samples.head + torch.arange(data.shape[0])) % capacity] = ends
+        self.samples.insert(data)
+        self._starts = None
+
 
+    def sample(self, batch_size: int) -> Tensor:
+        """
+        Draws positive pairs uniformly among consecutive states of a same episode
+        Params: batch_size: number of pairs
+        Returns: (batch_size, 2, dim) pairs
+        """
+        starts = self.starts
+        if starts.numel() == 0:
+            raise ValueError("No consecutive states to sample pairs from.")
+        first = starts[torch.randint(starts.numel(), (batch_size,))] # (batch_size,)
+        idx = torch.stack((first, (first + 1) % self.samples.capacity), dim=1) # (batch_size, 2)
+        return self.samples.data[idx].float()
+
+
+class RandomPairSampler():
+    # Pairs of states uniform in [-1, 1]^dim, sampled as negative pairs.
 
-class RandomDataset(D.IterableDataset):
-    
     def __init__(self, dim: int):
-        super(RandomDataset, self).__init__()
         self.dim = dim
 
 
-    def __iter__(self):
-        while True:
-            r1 = torch.FloatTensor(self.dim).uniform_(-1.0, 1.0)
-            r2 = torch.FloatTensor(self.dim).uniform_(-1.0, 1.0)
-            yield torch.stack([r1, r2])
-
+    def sample(self, batch_size: int) -> Tensor:
+        return torch.rand((batch_size, 2, self.dim)) * 2.0 - 1.0 # (batch_size, 2, dim)
@@ -0,0 +1,47 @@
+from torch import Tensor, LongTensor
+from typing import Optional
+import torch
+
+
+class EmbeddingCache():
+    """
+    Embeddings of an indexed set of points (e.g. k-means centroids) under a neural geometry.
+    Entries are keyed by point index and network parameter version: points that moved are
+    re-embedded lazily on the next lookup, and the whole cache is dropped once the network learned.
+    """
+
+    def __init__(self, geometry, n: int) -> None:
+        self.geometry = geometry # NeuralGeometry
+        self.n = n
+        self.embeddings: Optional[Tensor] = None # (n, embedding_dim)
+        self.stale = torch.ones(n, dtype=torch.bool) # (n,)
+        self.version = -1
+
+        # Logging for experiments
+        self.n_embedded = 0
+
+    def invalidate(self, idx: Optional[LongTensor] = None) -> None:
+        # Marks moved points, all if idx is None.
+        if idx is None:
+            self.stale[:] = True
+        else:
+            self.stale[torch.as_tensor(idx, dtype=torch.long).view(-1).cpu()] = True
+
+    def get(self, points: Tensor) -> Tensor:
+        """
+        Embeddings of points, only stale ones go through the network
+        Params: points: (n, dim) current points
+        Returns: (n, embedding_dim) embeddings
+        """
+        if self.version != self.geometry.version:
+            self.stale[:] = True
+            self.version = self.geometry.version
+        if self.stale.any():
+            idx = torch.nonzero(self.stale).view(-1)
+            embeddings = self.geometry.embed(points[idx.to(points.device)]) # (S, embedding_dim)
+            if self.embeddings is None:
+                self.embeddings = embeddings.new_empty((self.n, embeddings.shape[1]))
+            self.embeddings[idx.to(embeddings.device)] = embeddings
+            self.stale[:] = False
+            self.n_embedded += idx.numel()
+        return self.embeddings
@@ -1,3 +1,5 @@
+from torch.nn.utils.fusion import fuse_linear_bn_eval
+import copy
 import torch
 
 class MLP(torch.nn.Module):
@@ -35,3 +37,26 @@ class MLP(torch.nn.Module):
         logits = self.model(x)
         f = self.activation if phi is None else phi
         return f(logits)
+
+
+    def fused(self) -> torch.nn.Sequential:
+        """
+        Inference copy of the network, each Linear followed by a BatchNorm1d is fused
+        into a single affine layer using the running statistics.
+        Returns: torch.nn.Sequential in eval mode, same output as forward(x) in eval mode
+        """
+        def flatten(module):
+            # Not modules(), which skips the activation shared across layers.
+            if isinstance(module, torch.nn.Sequential):
+                return [m for child in module for m in flatten(child)]
+            return [module]
+
+        layers = [copy.deepcopy(m).eval() for m in flatten(self.model)]
+        fused = []
+        for layer in layers:
+            if isinstance(layer, torch.nn.BatchNorm1d) and len(fused) > 0 and isinstance(fused[-1], torch.nn.Linear):
+                fused[-1] = fuse_linear_bn_eval(fused[-1], layer)
+            else:
+                fused.append(layer)
+        fused.append(copy.deepcopy(self.activation))
+        return torch.nn.Sequential(*fused).eval()
@@ -1,3 +1,16 @@
+from .dataset import PositivePairSampler, RandomPairSampler
+from torch import Tensor, FloatTensor
+from typing import Callable, Optional
+import torch.multiprocessing as mp
+import warnings
+import re
+import queue
+import copy
+import time
+import torch
+
+PUBLISH_INTERVAL = 1.0 # minimum seconds between weights published by the background trainer
+
 
 class Trainer():
 
@@ -5,7 +18,174 @@ class Trainer():
         self.model = model
         self.optim = optim
 
-    def step():
+    def step(self):
         raise NotImplementedError
-    
-    
+
+
+class ContrastiveTrainer(Trainer):
+    """
+    Optimizer steps of the contrastive loss of a neural geometry: embeddings of consecutive
+    states are pulled together, those of random pairs pushed beyond a margin.
+    Owns the training data, so it can run in the main process or in a background worker.
+    """
+
+    def __init__(
+        self,
+        model: torch.nn.Module,
+        optim: torch.optim.Optimizer,
+        scheduler,
+        d: Callable,
+        positive_sampler: PositivePairSampler,
+        negative_sampler: RandomPairSampler,
+        batch_size: int,
+        negative_sample_scaling: float,
+        negative_margin: float,
+        device: torch.device = torch.device('cpu'),
+        dtype: torch.dtype = torch.float32,
+    ) -> None:
+        super().__init__(model, optim)
+        self.scheduler = scheduler
+        self.d = d
+        self.positive_sampler = positive_sampler
+        self.negative_sampler = negative_sampler
+        self.batch_size = batch_size
+        self.negative_sample_scaling = negative_sample_scaling
+        self.negative_margin = negative_margin
+        self.device = device
+        self.dtype = dtype
+
+    @property
+    def n_pairs(self) -> int:
+        return self.positive_sampler.n_pairs
+
+    def add(self, states: Tensor, dones: Optional[Tensor] = None, n_envs: int = 1) -> None:
+        self.positive_sampler.add(states, dones, n_envs)
+
+    def distance(self, x: Tensor, y: Tensor) -> FloatTensor:
+        # Training forward, both batches embedded together. (B, dim) vs (B, dim)
+        embeddings = self.model(torch.cat((x, y), dim=0)) # (2B, embedding_dim)
+        embedded_x, embedded_y = torch.chunk(embeddings, 2, dim=0) # (B, embedding_dim)
+        return self.d(embedded_x, embedded_y) # (B,)
+
+    def step(self, n_batches: int = 1, schedule: bool = True) -> float:
+        # Runs n_batches optimizer steps then a scheduler step if schedule, returns the total loss.
+        self.model.train()
+        total_loss = 0.0
+
+        for _ in range(n_batches):
+            self.optim.zero_grad()
+            positive_batch = self.positive_sampler.sample(self.batch_size) # (batch_size, 2, dim)
+            negative_batch = self.negative_sampler.sample(self.batch_size) # (batch_size, 2, dim)
+
+            positive_batch = positive_batch.to(device=self.device, dtype=self.dtype)
+            pos_difference = self.distance(positive_batch[:, 0, :], positive_batch[:, 1, :])
+            positive_loss = torch.sum(pos_difference)
+
+            negative_batch = negative_batch.to(device=self.device, dtype=self.dtype)
+            neg_difference = self.distance(negative_batch[:, 0, :], negative_batch[:, 1, :])
+            negative_loss = - self.negative_sample_scaling * torch.sum(torch.relu(neg_difference - self.negative_margin))
+
+            loss = positive_loss + negative_loss
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=1.0)
+            self.optim.step()
+            total_loss += loss.item()
+
+        if schedule:
+            self.scheduler.step()
+        return total_loss
+
+
+class AsyncTrainer():
+    """
+    Runs a ContrastiveTrainer in a background process that owns the optimizer.
+    States are streamed to the worker through a queue. The worker sleeps until states arrive, then
+    runs batches_per_learn optimizer steps for everything it picked up, so at most as many as
+    synchronous learn calls would, and steps the scheduler once per streamed batch.
+    Weights are published into a shared memory copy of the model, with a version counter, at most
+    once every publish_interval seconds; the main process pulls them into its own model at defined
+    points, see NeuralGeometry.pull.
+    """
+
+    def __init__(self, trainer: ContrastiveTrainer, batches_per_learn: int, publish_every: int = 1,
+                 publish_interval: float = PUBLISH_INTERVAL, start_method: str = 'spawn') -> None:
+        if publish_every <= 0:
+            raise ValueError("Publishing frequency must be greater than 0")
+        if publish_interval < 0:
+            raise ValueError("Publishing interval must be non-negative")
+        context = mp.get_context(start_method)
+        self.shared = copy.deepcopy(trainer.model).cpu().share_memory() # published weights
+        self.version = context.Value('l', 0)
+        self.loss = context.Value('d', -1.0)
+        self.queue = context.Queue()
+        # The worker gets its own copy, sending tensors to a process moves them to shared memory
+        # in place, so the main model would otherwise be trained under the feet of distance queries.
+        self.process = context.Process(
+            target=_train_worker,
+            args=(copy.deepcopy(trainer), self.shared, self.version, self.loss, self.queue,
+                  batches_per_learn, publish_every, publish_interval),
+            daemon=True,
+        )
+        self.process.start()
+
+    def add(self, states: Tensor, dones: Optional[Tensor] = None, n_envs: int = 1) -> None:
+        # Non-blocking, the worker picks the states up between optimizer steps.
+        self.queue.put((states.detach().cpu(), None if dones is None else torch.as_tensor(dones).cpu(), n_envs))
+
+    def pull(self, model: torch.nn.Module, version: int) -> int:
+        # Copies the published weights into model if newer than version, returns the current version.
+        if self.version.value == version:
+            return version
+        with self.version.get_lock():
+            model.load_state_dict(self.shared.state_dict())
+            return self.version.value
+
+    def close(self) -> None:
+        if self.process.is_alive():
+            self.queue.put(None)
+            self.process.join()
+
+
+def _train_worker(trainer: ContrastiveTrainer, shared: torch.nn.Module, version, loss, states_queue,
+                  batches_per_learn: int, publish_every: int, publish_interval: float) -> None:
+    torch.set_num_threads(1) # leave the other cores to environment stepping
+    # The optimizer is unpickled without the step counter the scheduler wraps it with.
+    warnings.filterwarnings('ignore', message=re.escape('Seems like `optimizer.step()` has been overridden'))
+
+    def publish():
+        with version.get_lock():
+            shared.load_state_dict(trainer.model.state_dict())
+            version.value += 1
+        return time.monotonic()
+
+    n_cycles = 0
+    pending = False # trained weights not published yet
+    last_publish = time.monotonic()
+    while True:
+        # Sleep until states arrive, publishing pending weights once the interval has passed.
+        try:
+            timeout = max(0.0, last_publish + publish_interval - time.monotonic()) if pending else None
+            item = states_queue.get(timeout=timeout)
+        except queue.Empty:
+            last_publish, pending = publish(), False
+            continue
+        n_batches = 0 # streamed batches picked up in this cycle
+        try:
+            while True:
+                if item is None:
+                    return
+                trainer.add(*item)
+                n_batches += 1
+                item = states_queue.get_nowait()
+        except queue.Empty:
+            pass
+        if trainer.n_pairs == 0: # as a synchronous learn, no step without pairs
+            continue
+
+        loss.value = trainer.step(batches_per_learn, schedule=False)
+        for _ in range(n_batches):
+            trainer.scheduler.step()
+        n_cycles += 1
+        pending = pending or n_cycles % publish_every == 0
+        if pending and time.monotonic() - last_publish >= publish_interval:
+            last_publish, pending = publish(), False
@@ -1 +1,2 @@
-from .learner import Learner
\ No newline at end of file
+from .learner import Learner
+from .state_store import StateStore, RandomStore, RingStore, ReservoirStore, AgeStratifiedStore, STATE_STORES
\ No newline at end of file
@@ -1,23 +1,26 @@
-import torch
 from torch import Tensor
+from .state_store import RingStore
 
 
-class _Buffer():
+class _Buffer(RingStore):
+    # Accumulates states until full, flushed after each learning step.
 
     def __init__(self, dim_states: int, buffer_size: int):
-        self.B = torch.zeros((buffer_size, dim_states))
+        super().__init__(buffer_size, dim_states)
         self.dim_state = dim_states
         self.max_size = buffer_size
-        self.size = 0
+
+    @property
+    def B(self) -> Tensor:
+        return self.data[:self.size]
 
     def append(self, states):
-        num_states = states.size(0)
-        self.B[self.size:self.size+num_states] = states
-        self.size += num_states
+        if self.size + states.size(0) > self.max_size:
+            raise ValueError("Buffer overflow, flush before appending.")
+        self.insert(states)
 
     def flush(self):
-        self.B = torch.zeros((self.max_size, self.dim_state))
-        self.size = 0
+        self.clear()
 
 
 class Learner():
@@ -0,0 +1,245 @@
+import torch
+
+from torch import Tensor, LongTensor, BoolTensor
+from typing import Dict, Optional, Tuple
+
+
+class StateStore():
+    """
+    Preallocated storage for states with a fixed capacity and an eviction policy.
+    States are written in place and never reallocated; slots fill up from 0 until capacity,
+    so the stored states are always the first `size` rows. Insertion returns the slots written,
+    so that structures indexed by slot (e.g. neighbour indexes) can be updated incrementally.
+    """
+
+    def __init__(self, capacity: int, dim: int, dtype: torch.dtype = torch.float32,
+                 device: torch.device = torch.device('cpu')) -> None:
+        if capacity <= 0:
+            raise ValueError("Capacity must be greater than 0")
+        self.capacity = capacity
+        self.dim = dim
+        self.data = torch.zeros((capacity, dim), dtype=dtype, device=device)
+        self.size = 0
+        self._states: Optional[Tensor] = None # full precision copy of low precision storage, until next write
+
+        # Logging for memory budgets
+        self.n_seen = 0 # states inserted
+        self.n_evicted = 0 # states lost after being stored
+        self.n_dropped = 0 # states never stored
+
+    @property
+    def states(self) -> Tensor:
+        # Stored states in full precision, not to be modified: a view of float32 storage,
+        # else converted once and cached until the next write, shape: (size, dim)
+        if self.data.dtype == torch.float32:
+            return self.data[:self.size]
+        if self._states is None:
+            self._states = self.data[:self.size].float()
+        return self._states
+
+    @property
+    def occupancy(self) -> float:
+        return self.size / self.capacity
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.element_size() * self.data.nelement()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'size': self.size,
+            'capacity': self.capacity,
+            'occupancy': self.occupancy,
+            'nbytes': self.nbytes,
+            'n_seen': self.n_seen,
+            'n_evicted': self.n_evicted,
+            'n_dropped': self.n_dropped,
+        }
+
+    def insert(self, states: Tensor) -> Tuple[LongTensor, LongTensor]:
+        """
+        WARNING: Updates internal state of current object.
+        Inserts states following the eviction policy
+        Params: states: (B, dim)
+        Returns: slots: (M,) slots written evicted: (E,) written slots that held a state before
+        Time-complexity: O(B * dim)
+        """
+        if not isinstance(states, Tensor) or states.dim() != 2 or states.size(1) != self.dim:
+            raise ValueError("States must be of shape (B, dim)")
+        self._states = None
+        slots, order = self._last_writes(self._assign(states.size(0)))
+        evicted = slots[slots < self.size]
+        self.data[slots] = states[order].to(self.data)
+        self.size = max(self.size, int(slots.max()) + 1) if slots.numel() > 0 else self.size
+        self.n_seen += states.size(0)
+        self.n_evicted += evicted.numel()
+        self.n_dropped += states.size(0) - slots.numel()
+        return slots, evicted
+
+    def simulate_insert(self, n: int) -> Tuple[LongTensor, BoolTensor]:
+        """
+        Draws the outcome of n independent single state insertions, without inserting
+        Params: n: number of insertions to simulate
+        Returns: lost: (n,) slot whose state would be lost, -1 if none stored: (n,) whether the state would be stored
+        Time-complexity: O(n)
+        """
+        if self.size < self.capacity:
+            return torch.full((n,), -1, dtype=torch.long), torch.ones(n, dtype=torch.bool)
+        return self._simulate_full(n)
+
+    def clear(self) -> None:
+        # Forget stored states, memory is kept.
+        self.size = 0
+        self._states = None
+
+    def _assign(self, n: int) -> LongTensor:
+        # Slot for each of n incoming states in order, -1 if dropped, shape: (n,)
+        raise NotImplementedError()
+
+    def _simulate_full(self, n: int) -> Tuple[LongTensor, BoolTensor]:
+        raise NotImplementedError()
+
+    def _fill(self, n: int) -> LongTensor:
+        # Free slots taken first, shape: (min(n, capacity - size),)
+        return torch.arange(self.size, min(self.size + n, self.capacity))
+
+    @staticmethod
+    def _last_writes(slots: LongTensor) -> Tuple[LongTensor, LongTensor]:
+        # Only the last state written to a slot survives, returns slots and state indices.
+        order = torch.arange(slots.size(0))
+        kept = slots >= 0
+        slots, order = slots[kept], order[kept]
+        unique, inverse = torch.unique(slots, return_inverse=True)
+        last = torch.full_like(unique, -1).scatter_reduce_(0, inverse, order, reduce='amax')
+        return unique, last
+
+
+class RandomStore(StateStore):
+    # Overflowing states overwrite uniformly random slots.
+
+    def _assign(self, n):
+        slots = self._fill(n)
+        overflow = n - slots.size(0)
+        return torch.cat((slots, torch.randint(0, self.capacity, (overflow,))))
+
+    def _simulate_full(self, n):
+        return torch.randint(0, self.capacity, (n,)), torch.ones(n, dtype=torch.bool)
+
+
+class RingStore(StateStore):
+    # First in first out, overflowing states overwrite the oldest ones.
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.head = 0 # oldest slot once full
+
+    def _assign(self, n):
+        slots = (self.head + torch.arange(n)) % self.capacity
+        self.head = (self.head + n) % self.capacity
+        return slots
+
+    def _simulate_full(self, n):
+        return torch.full((n,), self.head, dtype=torch.long), torch.ones(n, dtype=torch.bool)
+
+    def ordered(self, positions: Optional[LongTensor] = None) -> LongTensor:
+        # Slots of given positions from oldest to newest, all by default, shape: (size,)
+        start = self.head if self.size == self.capacity else 0
+        positions = torch.arange(self.size) if positions is None else positions
+        return (start + positions) % self.capacity
+
+    def clear(self):
+        super().clear()
+        self.head = 0
+
+
+class ReservoirStore(StateStore):
+    # Uniform sample of all states seen so far (Vitter's algorithm R).
+
+    def _assign(self, n):
+        slots = self._fill(n)
+        t = self.n_seen + torch.arange(slots.size(0), n) # number of states seen before each
+        j = torch.floor(torch.rand(t.shape) * (t + 1)).long()
+        return torch.cat((slots, torch.where(j < self.capacity, j, -1)))
+
+    def _simulate_full(self, n):
+        j = torch.floor(torch.rand(n) * (self.n_seen + 1)).long()
+        stored = j < self.capacity
+        return torch.where(stored, j, -1), stored
+
+
+class AgeStratifiedStore(StateStore):
+    """
+    Slots are split in strata of equal size, each a ring. New states enter the first stratum,
+    states pushed out of a stratum are promoted to the next one with some probability and lost
+    otherwise, so that each stratum holds a sparser sample of an older part of the history.
+    """
+
+    def __init__(self, capacity: int, dim: int, n_strata: int = 4, promote: float = 0.5, **kwargs) -> None:
+        super().__init__(capacity, dim, **kwargs)
+        if not 0 < n_strata <= capacity:
+            raise ValueError("Number of strata must be in the range (0, capacity]")
+        if not 0 <= promote <= 1:
+            raise ValueError("Promotion probability must be in the range [0, 1]")
+        self.n_strata = n_strata
+        self.promote = promote
+        self.bounds = torch.linspace(0, capacity, n_strata + 1).long().tolist()
+        self.heads = self.bounds[:-1].copy() # oldest slot of each stratum once full
+
+    def insert(self, states):
+        if not isinstance(states, Tensor) or states.dim() != 2 or states.size(1) != self.dim:
+            raise ValueError("States must be of shape (B, dim)")
+        self._states = None
+        if self.size < self.capacity:
+            # Fill free slots first, strata only apply once full.
+            slots = self._fill(states.size(0))
+            self.data[slots] = states[:slots.size(0)].to(self.data)
+            self.size += slots.size(0)
+            self.n_seen += slots.size(0)
+            states = states[slots.size(0):]
+            if states.size(0) == 0:
+                return slots, slots[:0]
+        else:
+            slots = torch.zeros(0, dtype=torch.long)
+
+        written = [slots]
+        incoming = states.to(self.data)
+        self.n_seen += states.size(0)
+        for s in range(self.n_strata):
+            if incoming.size(0) == 0:
+                break
+            start, end = self.bounds[s], self.bounds[s + 1]
+            m = end - start
+            # Incoming states beyond the stratum size are pushed out right away, oldest first.
+            overflow, incoming = incoming[:max(incoming.size(0) - m, 0)], incoming[-m:]
+            ring = start + (self.heads[s] - start + torch.arange(incoming.size(0))) % m
+            pushed = torch.cat((overflow, self.data[ring]))
+            self.data[ring] = incoming
+            self.heads[s] = start + (self.heads[s] - start + incoming.size(0)) % m
+            written.append(ring)
+            promoted = pushed[torch.rand(pushed.size(0)) < self.promote] if s + 1 < self.n_strata else pushed[:0]
+            self.n_evicted += pushed.size(0) - promoted.size(0)
+            incoming = promoted
+
+        slots = torch.unique(torch.cat(written))
+        return slots, slots[~torch.isin(slots, written[0])]
+
+    def _simulate_full(self, n):
+        # A state pushed out is promoted depth times before one is lost for good.
+        depth = torch.zeros(n, dtype=torch.long)
+        promoted = torch.ones(n, dtype=torch.bool)
+        for _ in range(self.n_strata - 1):
+            promoted &= torch.rand(n) < self.promote
+            depth += promoted.long()
+        return torch.tensor(self.heads)[depth], torch.ones(n, dtype=torch.bool)
+
+    def clear(self):
+        super().clear()
+        self.heads = self.bounds[:-1].copy()
+
+
+STATE_STORES = {
+    'random': RandomStore,
+    'ring': RingStore,
+    'reservoir': ReservoirStore,
+    'stratified': AgeStratifiedStore,
+}
@@ -1,4 +1,6 @@
-from .manifold import Manifold, GeodesicManifold
+from .manifold import Manifold, GeodesicManifold, batched
+from .geodesic import GeodesicEngine
+from .vec_env import ManifoldVecEnv
 from .euclidean import EuclideanManifold
 from .sphere import SphereManifold
 from .torus import TorusManifold
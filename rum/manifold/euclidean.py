@@ -1,5 +1,4 @@
 import numpy as np
-import itertools
 from .manifold import Manifold, GlobalChartAtlas
 from rum.geometry import EuclideanGeometry 
 
@@ -15,19 +14,18 @@ class EuclideanManifold(Manifold):
     return self.step_within_ball(p, v)
 
   def norm(self, p, v):
-    return np.linalg.norm(v)
+    return np.linalg.norm(v, axis=-1)
 
-  def starting_state(self):
+  def starting_state(self, rng=None):
     return np.zeros(self.dim)
 
   def pdf(self, p):
+    p = np.asarray(p)
     if self.sampler['name'] == 'uniform':
-      if np.linalg.norm(p) <= 1.0:
-        return 1.0 / np.prod(self.sampler['high'] - self.sampler['low'])
-      else:
-        return 0.0
+      inside = np.linalg.norm(p, axis=-1) <= 1.0
+      return np.where(inside, 1.0 / np.prod(self.sampler['high'] - self.sampler['low']), 0.0)
     elif self.sampler['name'] == 'gaussian': # Isotropic Gaussian.
-      return np.exp(-np.sum((p - self.sampler['mean']) ** 2) / (2 * self.sampler['std'] ** 2)) / ((2 * np.pi) ** (self.dim / 2.0) * self.sampler['std'])
+      return np.exp(-np.sum((p - self.sampler['mean']) ** 2, axis=-1) / (2 * self.sampler['std'] ** 2)) / ((2 * np.pi) ** (self.dim / 2.0) * self.sampler['std'])
     else:
       raise ValueError(f'Unknown sampler: {self.sampler["name"]}')
 
@@ -40,15 +38,10 @@ class EuclideanManifold(Manifold):
       raise ValueError(f'Unknown sampler: {self.sampler["name"]}')
 
   def grid(self, n):
-    # TODO: Could be more efficient.
     n_per_dim = int(np.power(n, 1.0 / self.dim))
-    points = [] #= np.zeros([self.dim, n_per_dim])
-    for point in itertools.product(np.linspace(-1.0, 1.0, n_per_dim), repeat=self.dim):
-      norm = np.linalg.norm(point)
-      if norm <= 1.0:
-        points.append(point)
-    points = np.array(points)
-    return points
+    linspace = np.linspace(-1.0, 1.0, n_per_dim)
+    points = np.stack(np.meshgrid(*([linspace] * self.dim), indexing='ij'), axis=-1).reshape(-1, self.dim)
+    return points[np.linalg.norm(points, axis=-1) <= 1.0]
 
   def implicit_function(self, p):
     if self.dim >= 3:
@@ -59,5 +52,14 @@ class EuclideanManifold(Manifold):
   def distance_function(self, p, q):
     return EuclideanGeometry.distance_function(self, p, q)
 
+  def distance_matrix(self, p, q):
+    return EuclideanGeometry.distance_matrix(self, p, q)
+
+  def assignment_distance_matrix(self, p, q):
+    return EuclideanGeometry.assignment_distance_matrix(self, p, q)
+
   def interpolate(self, p, q, alpha):
     return EuclideanGeometry.interpolate(self, p, q, alpha)
+
+  def interpolate_batch(self, p, q, alpha):
+    return EuclideanGeometry.interpolate_batch(self, p, q, alpha)
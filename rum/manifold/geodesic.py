@@ -0,0 +1,197 @@
+import os
+import hashlib
+import numpy as np
+import torch
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import shortest_path
+from ..geometry import Geometry
+from ..geometry.geometry import MAX_TILE_ELEMENTS
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'rum', 'geodesics')
+
+# Mesh edges to the 16-neighbourhood of a vertex, each undirected edge once. Knight moves
+# reduce the metrication error of shortest paths on a grid.
+NEIGHBOUR_OFFSETS = [(1, 0), (0, 1), (1, 1), (1, -1), (1, 2), (2, 1), (1, -2), (2, -1)]
+
+
+class GeodesicEngine(Geometry):
+  """
+  Geodesic distances on a 2d surface given by a global chart, for surfaces without closed form.
+  The chart domain is meshed with a regular grid, edges weighted by the length of the embedded
+  chords, and all-pairs shortest paths are computed once and cached on disk. Queries are answered
+  by barycentric interpolation of the distance table over the mesh triangles containing each point,
+  except for points in the same or adjacent mesh cells, whose distance is the length of the chart
+  segment between them under the local metric. In particular d(p, p) = 0.
+  """
+
+  def __init__(self, name, map_, inverse_map, domain, periodic, params=None, resolution=64, cache_dir=DEFAULT_CACHE_DIR):
+    super(GeodesicEngine, self).__init__(dim=3)
+    self.map = map_ # (B, 3) -> (B, 2)
+    self.inverse_map = inverse_map # (B, 2) -> (B, 3)
+    self.low = np.array([d[0] for d in domain], dtype=np.float64)
+    self.high = np.array([d[1] for d in domain], dtype=np.float64)
+    self.periodic = np.array(periodic, dtype=bool)
+    self.resolution = resolution
+    # Periodic dimensions do not repeat the last vertex.
+    self.step = (self.high - self.low) / np.where(self.periodic, resolution, resolution - 1)
+
+    key = repr((name, domain, periodic, sorted((params or {}).items()), resolution, NEIGHBOUR_OFFSETS))
+    self.cache_path = os.path.join(cache_dir, '{}_{}.npy'.format(name, hashlib.sha1(key.encode()).hexdigest()[:16]))
+    self._distances = None
+
+  @property
+  def distances(self):
+    # All-pairs geodesic distances between mesh vertices, shape: (resolution ** 2, resolution ** 2)
+    if self._distances is None:
+      if os.path.exists(self.cache_path):
+        self._distances = torch.from_numpy(np.load(self.cache_path))
+      else:
+        self._distances = torch.from_numpy(self.build())
+        # Written under a temporary name, environments may be created concurrently.
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        temporary_path = '{}.{}.npy'.format(self.cache_path[:-4], os.getpid())
+        np.save(temporary_path, self._distances.numpy())
+        os.replace(temporary_path, self.cache_path)
+    return self._distances
+
+  def vertices(self):
+    # Chart coordinates of mesh vertices, vertex i * resolution + j at (i, j), shape: (resolution ** 2, 2)
+    n = self.resolution
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    return self.low + self.step * np.stack((i.ravel(), j.ravel()), axis=-1)
+
+  def build(self):
+    # Dijkstra from every vertex over the mesh, float32 table.
+    n = self.resolution
+    points = self.inverse_map(self.vertices()) # (n * n, 3)
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+    i, j = i.ravel(), j.ravel()
+    sources, targets = [], []
+    for di, dj in NEIGHBOUR_OFFSETS:
+      ni, nj = i + di, j + dj
+      valid = np.ones_like(ni, dtype=bool)
+      for axis, index in enumerate((ni, nj)):
+        if self.periodic[axis]:
+          index %= n
+        else:
+          valid &= (index >= 0) & (index < n)
+      sources.append((i * n + j)[valid])
+      targets.append((ni * n + nj)[valid])
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    lengths = np.linalg.norm(points[sources] - points[targets], axis=1)
+    graph = coo_matrix((lengths, (sources, targets)), shape=(n * n, n * n)).tocsr()
+    return shortest_path(graph, method='D', directed=False).astype(np.float32)
+
+  def chart(self, p):
+    return self.map(np.asarray(p, dtype=np.float64)) # (B, 2)
+
+  def cells(self, xi):
+    # Mesh cell of each point given by its lowest vertex, and the position within it, shapes: (B, 2), (B, 2)
+    n = self.resolution
+    s = (xi - self.low) / self.step
+    base = np.floor(s).astype(np.int64)
+    base = np.where(self.periodic, base % n, np.clip(base, 0, n - 2))
+    f = np.clip(np.where(self.periodic, (s - np.floor(s)), s - base), 0.0, 1.0)
+    return base, f
+
+  def adjacent(self, base_p, base_q):
+    # Whether cells are the same or adjacent, shapes: (..., 2) -> (...)
+    gap = np.abs(base_p - base_q)
+    gap = np.where(self.periodic, np.minimum(gap, self.resolution - gap), gap)
+    return np.all(gap <= 1, axis=-1)
+
+  def local_distances(self, xi_p, xi_q, t=1e-4):
+    # Length of the chart segments under the metric at their midpoint, i.e. the norm of the
+    # differential of the embedding applied to the segment, by central difference. Shapes: (B, 2) -> (B,)
+    period = self.high - self.low
+    delta = xi_q - xi_p
+    delta = np.where(self.periodic, (delta + period / 2) % period - period / 2, delta)
+    middle = xi_p + delta / 2
+    tangent = self.inverse_map(middle + t * delta) - self.inverse_map(middle - t * delta) # (B, 3)
+    return np.linalg.norm(tangent, axis=-1) / (2 * t)
+
+  def locate(self, xi):
+    # Mesh triangle containing each point and its barycentric weights, shapes: (B, 3), (B, 3)
+    n = self.resolution
+    base, f = self.cells(xi)
+    nxt = np.where(self.periodic, (base + 1) % n, base + 1)
+
+    v00 = base[:, 0] * n + base[:, 1]
+    v10 = nxt[:, 0] * n + base[:, 1]
+    v01 = base[:, 0] * n + nxt[:, 1]
+    v11 = nxt[:, 0] * n + nxt[:, 1]
+    fx, fy = f[:, 0], f[:, 1]
+    lower = fx + fy <= 1.0
+    vertices = np.where(lower[:, None], np.stack((v00, v10, v01), 1), np.stack((v11, v01, v10), 1))
+    weights = np.where(lower[:, None], np.stack((1.0 - fx - fy, fx, fy), 1), np.stack((fx + fy - 1.0, 1.0 - fx, 1.0 - fy), 1))
+    return torch.from_numpy(vertices), torch.from_numpy(weights).float()
+
+  @staticmethod
+  def numpy(p):
+    return p.detach().cpu().numpy() if isinstance(p, torch.Tensor) else np.asarray(p)
+
+  @staticmethod
+  def output_options(p):
+    # Results take the floating dtype and the device of the input, the table stays float32.
+    if isinstance(p, torch.Tensor):
+      return (p.dtype if p.is_floating_point() else torch.get_default_dtype()), p.device
+    p = np.asarray(p)
+    return (torch.from_numpy(np.zeros(0, p.dtype)).dtype if np.issubdtype(p.dtype, np.floating) else torch.get_default_dtype()), torch.device('cpu')
+
+  def distance_function(self, p, q):
+    dtype, device = self.output_options(p)
+    p, q = self.numpy(p), self.numpy(q)
+    if p.ndim == 1 and q.ndim == 1:
+      return self.distance_function(p[None], q[None])[0] # scalar
+    p, q = np.atleast_2d(p), np.atleast_2d(q)
+    if p.shape[0] != q.shape[0] and 1 not in (p.shape[0], q.shape[0]):
+      return self.distance_matrix(p, q) # (B1, B2)
+    # Row-wise (B,) for (B, dim) x (B, dim) or (1, dim) x (B, dim).
+    xi_p, xi_q = np.broadcast_arrays(self.chart(p), self.chart(q))
+    vp, wp = self.locate(xi_p)
+    vq, wq = self.locate(xi_q)
+    d = self.distances[vp[:, :, None], vq[:, None, :]] # (B, 3, 3)
+    d = torch.einsum('bi,bij,bj->b', wp, d, wq).to(dtype)
+    near = np.flatnonzero(self.adjacent(self.cells(xi_p)[0], self.cells(xi_q)[0]))
+    d[near] = torch.from_numpy(self.local_distances(xi_p[near], xi_q[near])).to(dtype)
+    return d.to(device)
+
+  def distance_matrix(self, p, q):
+    dtype, device = self.output_options(p)
+    p, q = self.numpy(p), self.numpy(q)
+    if p.ndim != 2 or q.ndim != 2:
+      raise ValueError("Tensors must be 2D")
+    xi_p, xi_q = self.chart(p), self.chart(q)
+    vp, wp = self.locate(xi_p)
+    vq, wq = self.locate(xi_q)
+    cells_p, cells_q = self.cells(xi_p)[0], self.cells(xi_q)[0]
+
+    def tile(start, end):
+      d = self.distances[vp[start:end, :, None, None], vq[None, None, :, :]] # (rows, 3, B2, 3)
+      d = torch.einsum('ai,aibj,bj->ab', wp[start:end], d, wq).to(dtype)
+      rows, cols = np.nonzero(self.adjacent(cells_p[start:end, None], cells_q[None]))
+      d[rows, cols] = torch.from_numpy(self.local_distances(xi_p[start + rows], xi_q[cols])).to(dtype)
+      return d
+
+    # Gathered tables are 9 times larger than the tiles of the distance matrix.
+    rows = max(1, MAX_TILE_ELEMENTS // max(9 * q.shape[0], 1))
+    tiles = [tile(start, start + rows) for start in range(0, p.shape[0], rows)]
+    d = torch.cat(tiles) if len(tiles) > 0 else torch.zeros((0, q.shape[0]), dtype=dtype)
+    return d.to(device) # (B1, B2)
+
+  def interpolate(self, p, q, alpha):
+    dtype, device = self.output_options(p)
+    p = torch.as_tensor(self.numpy(p)[None], dtype=dtype, device=device)
+    return self.interpolate_batch(p, self.numpy(q)[None], np.array([float(alpha)]))[0]
+
+  def interpolate_batch(self, p, q, alpha):
+    # Straight lines in the chart, periodic coordinates along the shortest way around.
+    # Not geodesics in general, but they join p and q in the correct homotopy class.
+    dtype, device = self.output_options(p)
+    xi_p = self.map(self.numpy(p).astype(np.float64)) # (B, 2)
+    xi_q = self.map(self.numpy(q).astype(np.float64))
+    period = self.high - self.low
+    delta = xi_q - xi_p
+    delta = np.where(self.periodic, (delta + period / 2) % period - period / 2, delta)
+    xi = xi_p + self.numpy(alpha).astype(np.float64).reshape(-1, 1) * delta
+    return torch.tensor(self.inverse_map(xi), dtype=dtype, device=device)
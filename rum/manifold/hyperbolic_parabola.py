@@ -1,11 +1,12 @@
 import numpy as np
-import itertools
 from .manifold import Manifold, GlobalChartAtlas
+from .geodesic import GeodesicEngine
 
 class HyperbolicParabolaManifold(Manifold):
   def __init__(self, dim, sampler=None):
     assert dim == 3 
     super(HyperbolicParabolaManifold, self).__init__(dim - 1, dim)
+    self.sampler = sampler if sampler is not None else {'name': 'uniform'} # Uniform in the chart.
 
     self.atlas = GlobalChartAtlas(
       self.map,
@@ -15,6 +16,12 @@ class HyperbolicParabolaManifold(Manifold):
       None # TODO
     )
 
+    self.geodesics = GeodesicEngine(
+      'hyperbolic_parabola', self.map, self.inverse_map,
+      domain=[(-1.0, 1.0), (-1.0, 1.0)],
+      periodic=[False, False]
+    )
+
   def retraction(self, p, v):
     v = self.normalize(p, v)
     xi = self.map(p)
@@ -22,44 +29,53 @@ class HyperbolicParabolaManifold(Manifold):
     return self.inverse_map(xi)
 
   def metric_tensor(self, p):
-    return np.array([
-      [1.0 + 4.0 * p[0] ** 2, - 4.0 * p[0] * p[1]],
-      [- 4.0 * p[0] * p[1], 1.0 + 4.0 * p[1] ** 2]
-    ])
+    p = np.asarray(p)
+    metric = np.empty(p.shape[:-1] + (2, 2))
+    metric[..., 0, 0] = 1.0 + 4.0 * p[..., 0] ** 2
+    metric[..., 0, 1] = metric[..., 1, 0] = - 4.0 * p[..., 0] * p[..., 1]
+    metric[..., 1, 1] = 1.0 + 4.0 * p[..., 1] ** 2
+    return metric
 
-  def starting_state(self):
+  def starting_state(self, rng=None):
     return self.inverse_map([0.0, 0.0])
 
   def pdf(self, p):
     raise NotImplementedError
 
   def sample(self, n):
-    if n > 1:
-      return np.array([self.sample(1) for _ in range(n)])
-    u, v = np.random.uniform(-1.0, 1.0, 2)
-    return self.inverse_map([u, v])
+    return self.inverse_map(np.random.uniform(-1.0, 1.0, (n, 2)))
 
   def grid(self, n):
     m = int(np.sqrt(n))
-    points = []
     linspace = np.linspace(-1.0, 1.0, m)
-    for i, j in itertools.product(linspace, repeat=2):
-      if np.linalg.norm([i, j]) < 1.0:
-        points.append(self.inverse_map([i, j]))
-      #points.append(self.inverse_map([i, j]))
-    points = np.array(points)
-    return points
+    local_mesh = np.stack(np.meshgrid(linspace, linspace, indexing='ij'), axis=-1).reshape(-1, 2)
+    return self.inverse_map(local_mesh[np.linalg.norm(local_mesh, axis=-1) < 1.0])
+
+  def distance_function(self, p, q):
+    return self.geodesics.distance_function(p, q)
+
+  def distance_matrix(self, p, q):
+    return self.geodesics.distance_matrix(p, q)
+
+  def interpolate(self, p, q, alpha):
+    return self.geodesics.interpolate(p, q, alpha)
+
+  def interpolate_batch(self, p, q, alpha):
+    return self.geodesics.interpolate_batch(p, q, alpha)
 
   def implicit_function(self, p):
     return p[0]**2 - p[1]**2
 
+  # Maps take (3,) or (N, 3) points and (2,) or (N, 2) local coordinates.
   def map(self, p):
-    u = p[0]
-    v = p[1]
-    return np.array([u, v])
+    p = np.asarray(p)
+    u = p[..., 0]
+    v = p[..., 1]
+    return np.stack([u, v], axis=-1)
 
   def inverse_map(self, xi):
-    x = xi[0]
-    y = xi[1]
-    z = xi[0] ** 2 - xi[1] ** 2
-    return np.array([x, y, z])
+    xi = np.asarray(xi)
+    x = xi[..., 0]
+    y = xi[..., 1]
+    z = xi[..., 0] ** 2 - xi[..., 1] ** 2
+    return np.stack([x, y, z], axis=-1)
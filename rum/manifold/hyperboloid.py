@@ -1,45 +1,65 @@
 import numpy as np
-import itertools
 from .manifold import Manifold
+from .geodesic import GeodesicEngine
 
 class HyperboloidManifold(Manifold):
   def __init__(self, dim, sampler=None):
     assert dim == 3 # TODO.
     super(HyperboloidManifold, self).__init__(dim - 1, dim)
+    self.sampler = sampler if sampler is not None else {'name': 'uniform'} # Uniform in the chart.
     self.a = 2**-0.5
     self.c = 1.0
 
-  def starting_state(self):
+    self.geodesics = GeodesicEngine(
+      'hyperboloid', self.map, self.inverse_map,
+      domain=[(-1.0, 1.0), (-np.pi, np.pi)],
+      periodic=[False, True],
+      params={'a': self.a, 'c': self.c}
+    )
+
+  def starting_state(self, rng=None):
     return np.zeros(self.ambient_dim)
 
   def pdf(self, p):
     raise NotImplementedError
 
   def sample(self, n):
-    if n > 1:
-      return np.array([self.sample(1) for _ in range(n)])
-    u = np.random.uniform(-1.0, 1.0)
-    v = np.random.uniform(-np.pi, np.pi)
-    return self.inverse_map([u, v])
+    u = np.random.uniform(-1.0, 1.0, n)
+    v = np.random.uniform(-np.pi, np.pi, n)
+    return self.inverse_map(np.stack([u, v], axis=-1))
 
   def grid(self, n):
     m = int(np.sqrt(n))
-    points = []
     linspace_1 = np.linspace(-1.0, 1.0, m)
     linspace_2 = np.linspace(-np.pi, np.pi, m)
-    for i, j in itertools.product(linspace_1, linspace_2):
-      points.append(self.inverse_map([i, j]))
-    points = np.array(points)
-    return points
+    local_mesh = np.stack(np.meshgrid(linspace_1, linspace_2, indexing='ij'), axis=-1).reshape(-1, 2)
+    return self.inverse_map(local_mesh)
+
+  def distance_function(self, p, q):
+    return self.geodesics.distance_function(p, q)
+
+  def distance_matrix(self, p, q):
+    return self.geodesics.distance_matrix(p, q)
+
+  def interpolate(self, p, q, alpha):
+    return self.geodesics.interpolate(p, q, alpha)
+
+  def interpolate_batch(self, p, q, alpha):
+    return self.geodesics.interpolate_batch(p, q, alpha)
 
   def implicit_function(self, p):
     return self.p[0]**2 + self.p[1]**2
 
+  # Maps take (3,) or (N, 3) points and (2,) or (N, 2) local coordinates.
   def map(self, p):
-    raise NotImplementedError
+    p = np.asarray(p)
+    u = p[..., 2] / self.c
+    v = np.arctan2(p[..., 1], p[..., 0])
+    return np.stack([u, v], axis=-1)
 
   def inverse_map(self, xi):
-    x = self.a * np.sqrt(1 + xi[0]**2) * np.xios(xi[1])
-    y = self.a * np.sqrt(1 + xi[0]**2) * np.sin(xi[1])
-    z = self.c * xi[0]
-    return np.array([x, y, z])
+    xi = np.asarray(xi)
+    x = self.a * np.sqrt(1 + xi[..., 0]**2) * np.cos(xi[..., 1])
+    y = self.a * np.sqrt(1 + xi[..., 0]**2) * np.sin(xi[..., 1])
+    z = self.c * xi[..., 0]
+    return np.stack([x, y, z], axis=-1)
@@ -1,5 +1,6 @@
 import numpy as np
 import itertools
+import functools
 import scipy
 import gymnasium
 from ..density import Density
@@ -7,6 +8,21 @@ from ..geometry import Geometry
 from ..geometry import EuclideanGeometry
 from .util import sphere_sample_uniform
 
+# Consecutive rejected proposals after which a random walk chain stays in place for a step.
+MAX_REJECTIONS = 100
+
+def batched(f):
+  # Lifts a method on single points to (N, dim) batches by looping, the fallback for manifolds
+  # without array implementations. Every argument is split along its first axis with the points.
+  @functools.wraps(f)
+  def wrapper(self, p, *args):
+    p = np.asarray(p)
+    if p.ndim <= 1:
+      return f(self, p, *args)
+    args = [np.asarray(a) for a in args]
+    return np.stack([f(self, p_i, *[a[i] for a in args]) for i, p_i in enumerate(p)])
+  return wrapper
+
 class Chart():
   def __init__(self, map_, inverse_map, norm, differential_map=None, differential_inverse_map=None):
     self.map = map_
@@ -19,6 +35,10 @@ class Atlas():
   def get_chart(self, p):
     raise NotImplementedError
 
+  def get_chart_indices(self, p):
+    # Index in self.charts of the chart of each of (N, dim) points, looked up point by point.
+    return np.array([self.charts.index(self.get_chart(p_i)) for p_i in p], dtype=np.int64)
+
 class GlobalChartAtlas(Atlas):
   def __init__(self, _map, inverse_map, norm, differential_map=None, differential_inverse_map=None):
     self.chart = Chart(_map, inverse_map, norm, differential_map, differential_inverse_map)
@@ -26,6 +46,9 @@ class GlobalChartAtlas(Atlas):
   def get_chart(self, p):
     return self.chart
 
+  def get_chart_indices(self, p):
+    return np.zeros(len(p), dtype=np.int64)
+
 class GeodesicManifold():
   # Wrapper for manifold object.
   def __init__(self, base_object, *args, **kwargs):
@@ -105,28 +128,42 @@ class Manifold(gymnasium.Env, Density, Geometry):
     info = {}
     return self.state.copy(), reward, terminated, truncated, info
 
-  def random_walk(self, n, starting_state=None, step_size=None):
-    state = starting_state if starting_state is not None else self.starting_state() 
-    samples = []
+  def random_walk(self, n, starting_state=None, step_size=None, max_rejections=MAX_REJECTIONS):
+    starting_states = None if starting_state is None else np.asarray(starting_state)[None]
+    return self.random_walks(n, 1, starting_states, step_size, max_rejections)[0]
+
+  def random_walks(self, n, n_chains, starting_states=None, step_size=None, max_rejections=MAX_REJECTIONS):
+    # Metropolis random walks of n_chains independent chains advanced in lockstep, shape: (n_chains, n, dim)
+    # Each step proposes moves in random directions until accepted, for the chains still
+    # rejected only. A chain rejected max_rejections times in a row stays where it is.
+    step_size = step_size if step_size is not None else self.max_step_size
+    states = np.asarray(starting_states, dtype=np.float64) if starting_states is not None \
+      else np.stack([self.starting_state() for _ in range(n_chains)])
+    probs = np.asarray(self.pdf(states), dtype=np.float64).reshape(n_chains) # pdf of current states
+    samples = np.zeros((n_chains, n, states.shape[-1]))
     for i in range(n):
-      prob_state = self.pdf(state)
-      accepted = False
-      while not accepted:
-        change_state = sphere_sample_uniform(self.manifold_dim - 1)[0]
-        updated_state = self.manifold_step(state, change_state, step_size if step_size is not None else self.max_step_size)
-        prob_updated_state = self.pdf(updated_state)
-        if np.random.uniform() < prob_updated_state / prob_state:
-          state = updated_state 
-          accepted = True
-      samples.append(state)
-    return np.array(samples)
+      pending = np.arange(n_chains) # chains without an accepted move yet
+      for _ in range(max_rejections if max_rejections is not None else np.iinfo(np.int64).max):
+        change_states = sphere_sample_uniform(self.manifold_dim - 1, pending.size)
+        updated_states = self.manifold_step(states[pending], change_states, step_size)
+        updated_probs = np.asarray(self.pdf(updated_states), dtype=np.float64).reshape(pending.size)
+        # u < p' / p, without dividing by a zero density
+        accepted = np.random.uniform(size=pending.size) * probs[pending] < updated_probs
+        moved = pending[accepted]
+        states[moved], probs[moved] = updated_states[accepted], updated_probs[accepted]
+        pending = pending[~accepted]
+        if pending.size == 0:
+          break
+      samples[:, i] = states
+    return samples
 
   def manifold_step(self, state, action, step_size):
     return self.retraction(state, step_size * action)
 
+  @batched
   def retraction(self, p, v):
     # Warning: Relies on self.atlas being defined.
-    # Can be overriden for efficiency.
+    # Can be overriden for efficiency, charts are looked up point by point.
     if self.atlas is not None:
       chart = self.atlas.get_chart(p) 
       local = chart.map(p)
@@ -137,27 +174,37 @@ class Manifold(gymnasium.Env, Density, Geometry):
       raise NotImplementedError("Must define retraction or atlas.")
 
   def norm(self, p, v): # Riemannian norm.
-    # Warning: Relies on self.metric_tensor() being implemented. 
+    # Warning: Relies on self.metric_tensor() being implemented for (N, dim) points, see batched.
     # Can be overridden for efficiency.
-    return np.sqrt(np.matmul(v, np.matmul(self.metric_tensor(p), v.T)))
+    return np.sqrt(np.einsum('...i,...ij,...j->...', v, self.metric_tensor(p), v))
 
   def normalize(self, p, v, norm=None):
     # Normalize according to direction and position using Riemannian norm.
     norm = self.norm if norm is None else norm # Use norm from metric if not provided.
-    if np.any(v != 0.0):
-      return v * np.linalg.norm(v) / norm(p, v) 
-    else:
-      return v 
+    v = np.asarray(v, dtype=np.float64)
+    moving = np.any(v != 0.0, axis=-1, keepdims=True)
+    if not np.any(moving):
+      return v
+    with np.errstate(divide='ignore', invalid='ignore'):
+      scale = np.linalg.norm(v, axis=-1, keepdims=True) / np.expand_dims(norm(p, v), -1)
+    return np.where(moving, v * scale, v)
 
   def step_within_ball(self, p, v):
+    p, v = np.asarray(p, dtype=np.float64), np.asarray(v, dtype=np.float64)
     updated_p = p + v
-    norm = np.linalg.norm(updated_p)
-    if norm > 1.0: # Take maximal step such that we remain within boundary.
-      #updated_p = (p + v) / norm
-      step_size = np.roots([np.dot(v, v), 2 * np.dot(p, v), np.dot(p, p) - 1]) # Roots of equation ||p + step_size * v|| = 1.
-      step_size = step_size[np.argmin(np.abs(step_size))] # One root will be close to 1, the other will have large magnitude.
-      updated_p = p + step_size * v
-    return updated_p 
+    outside = np.linalg.norm(updated_p, axis=-1, keepdims=True) > 1.0
+    if not np.any(outside):
+      return updated_p
+    # Take maximal step such that we remain within boundary.
+    # Roots of equation ||p + step_size * v|| = 1, one will be close to 1, the other will have large magnitude.
+    a = np.sum(v * v, axis=-1, keepdims=True)
+    b = 2 * np.sum(p * v, axis=-1, keepdims=True)
+    c = np.sum(p * p, axis=-1, keepdims=True) - 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+      sqrt_discriminant = np.sqrt(np.maximum(b ** 2 - 4 * a * c, 0.0))
+      roots = np.concatenate(((-b + sqrt_discriminant) / (2 * a), (-b - sqrt_discriminant) / (2 * a)), axis=-1)
+    step_size = np.take_along_axis(roots, np.argmin(np.abs(roots), axis=-1)[..., None], axis=-1)
+    return np.where(outside & (a > 0), p + step_size * v, updated_p)
 
   def grid(self, n):
     raise NotImplementedError
@@ -169,5 +216,5 @@ class Manifold(gymnasium.Env, Density, Geometry):
     # Terence Tao does not know how to do this for surfaces with non-constant curvature: https://mathoverflow.net/questions/37651/riemannian-surfaces-with-an-explicit-distance-function
     raise NotImplementedError
 
-  def learn(self, _):
-    pass
+  def learn(self, states, dones=None, n_envs=1):
+    pass # The natural geometry is fixed.
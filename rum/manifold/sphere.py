@@ -1,6 +1,4 @@
 import numpy as np
-import itertools
-from scipy.spatial import geometric_slerp
 from scipy.stats import vonmises_fisher
 import torch
 from .manifold import Manifold, Atlas, Chart
@@ -8,27 +6,32 @@ from .util import sphere_sample_uniform
 
 class SphereAtlas(Atlas):
   # Atlas for n-sphere using stereographic projections.
+  # Maps take (n + 1,) or (N, n + 1) points and (n,) or (N, n) local coordinates.
   def map_0(self, p):
-    return np.array([p[i] / (1.0 + p[self.n]) for i in range(self.n)])
+    p = np.asarray(p)
+    return p[..., :self.n] / (1.0 + p[..., self.n:])
 
   def map_1(self, p):
-    return np.array([p[i] / (1.0 - p[self.n]) for i in range(self.n)])
+    p = np.asarray(p)
+    return p[..., :self.n] / (1.0 - p[..., self.n:])
 
   def inverse_map_0(self, xi):
-    a = np.sum(xi ** 2)
-    return (1.0 / (a + 1.0)) * np.concatenate((2 * xi, [1.0 - a]))
+    xi = np.asarray(xi)
+    a = np.sum(xi ** 2, axis=-1, keepdims=True)
+    return (1.0 / (a + 1.0)) * np.concatenate((2 * xi, 1.0 - a), axis=-1)
 
   def inverse_map_1(self, xi):
-    a = np.sum(xi ** 2)
-    return (1.0 / (a + 1.0)) * np.concatenate((2 * xi, [a - 1.0]))
+    xi = np.asarray(xi)
+    a = np.sum(xi ** 2, axis=-1, keepdims=True)
+    return (1.0 / (a + 1.0)) * np.concatenate((2 * xi, a - 1.0), axis=-1)
 
   def norm_0(self, p, v):
     # TODO. Can optimize by not computing Euclidean norm.
-    return (1.0 + p[self.n]) * np.linalg.norm(v)
+    return (1.0 + np.asarray(p)[..., self.n]) * np.linalg.norm(v, axis=-1)
 
   def norm_1(self, p, v):
     # TODO. Can optimize by not computing Euclidean norm.
-    return (1.0 - p[self.n]) * np.linalg.norm(v)
+    return (1.0 - np.asarray(p)[..., self.n]) * np.linalg.norm(v, axis=-1)
 
   def differential_map_0(self, p):
     raise NotImplementedError
@@ -100,6 +103,9 @@ class SphereAtlas(Atlas):
     else:
       return self.charts[1]
 
+  def get_chart_indices(self, p):
+    return np.where(np.asarray(p)[..., self.n] >= 0, 0, 1)
+
 class SphereManifold(Manifold):
   # We assume unit radius.
   def __init__(self, dim, sampler):
@@ -107,15 +113,21 @@ class SphereManifold(Manifold):
     self.sampler = sampler
     self.atlas = SphereAtlas(dim - 1)
 
-  def starting_state(self):
-    return sphere_sample_uniform(self.manifold_dim)[0]
+  def starting_state(self, rng=None):
+    return sphere_sample_uniform(self.manifold_dim, rng=rng)[0]
+
+  def retraction(self, p, v):
+    # Steps in both stereographic charts, each point keeps the chart of its hemisphere.
+    p, v = np.asarray(p, dtype=np.float64), np.asarray(v, dtype=np.float64)
+    north = p[..., self.manifold_dim:] >= 0
+    with np.errstate(divide='ignore', invalid='ignore'): # in the chart of the other hemisphere
+      updated = [chart.inverse_map(chart.map(p) + self.normalize(p, v, chart.norm)) for chart in self.atlas.charts]
+    return np.where(north, *updated)
 
   def pdf(self, p):
     if self.sampler['name'] == 'uniform':
-      if np.linalg.norm(p) == 1: 
-        return 1.0 / (2.0 * np.pi) ** (self.manifold_dim / 2.0) 
-      else:
-        return 0.0
+      on_sphere = np.isclose(np.linalg.norm(p, axis=-1), 1.0) # not exactly 1 after rounding
+      return np.where(on_sphere, 1.0 / (2.0 * np.pi) ** (self.manifold_dim / 2.0), 0.0)
     elif self.sampler['name'] == 'vonmises_fisher':
       return vonmises_fisher.pdf(p, self.sampler['mu'], self.sampler['kappa'])
     else:
@@ -131,22 +143,66 @@ class SphereManifold(Manifold):
 
   def grid(self, n):
     m = int(np.power(n, 1.0 / 3.0))
-    points = []
     linspace = np.linspace(-1, 1, m)
-    for i, j, k in itertools.product(*([linspace] * 3)):
-      points.append(np.array([i,j,k]))
-      if np.linalg.norm(points[-1]) > 1:
-        points[-1] /= np.linalg.norm(points[-1])
-    points = np.array(points)
-    return points
+    points = np.stack(np.meshgrid(*([linspace] * 3), indexing='ij'), axis=-1).reshape(-1, 3)
+    norm = np.linalg.norm(points, axis=-1, keepdims=True)
+    return np.where(norm > 1, points / np.maximum(norm, 1), points)
 
   def implicit_function(self, p):
     return 1.0 - p[0] ** 2 - p[1] ** 2
 
   def distance_function(self, p, q):
-    return torch.acos(torch.inner(p, q).squeeze(0))
+    p, q = torch.as_tensor(p), torch.as_tensor(q)
+    if p.dim() == 2 and q.dim() == 2 and p.shape[0] != q.shape[0] and 1 not in (p.shape[0], q.shape[0]):
+      return self.distance_matrix(p, q) # (B1, B2)
+    # Row-wise (B,) for (B, dim) x (B, dim) or (1, dim) x (B, dim), scalar for (dim,) x (dim,).
+    return torch.acos(torch.clamp(torch.sum(p * q, dim=-1), -1.0, 1.0))
+
+  def distance_matrix(self, p, q):
+    if p.dim() != 2 or q.dim() != 2:
+      raise ValueError("Tensors must be 2D")
+    # Great circle distances from a single GEMM of inner products.
+    tile = lambda p, q: torch.acos(torch.clamp(torch.matmul(p, q.T), -1.0, 1.0))
+    return self._tiled_distance_matrix(tile, p, q) # (B1, B2)
+
+  def log_map(self, p, q):
+    # Tangent vectors at p pointing to q along great circles, of norm the distance. (B, dim) x (B, dim) -> (B, dim)
+    cos = torch.sum(p * q, dim=-1, keepdim=True)
+    w = q - cos * p # component of q orthogonal to p, of norm sin(theta)
+    sin = torch.norm(w, dim=-1, keepdim=True)
+    theta = torch.atan2(sin, cos) # accurate near 0 and pi, unlike acos
+    eps = torch.finfo(p.dtype).eps
+    # theta / sin(theta) -> 1 for identical points.
+    v = w * torch.where(sin > eps, theta / torch.clamp(sin, min=eps), torch.ones_like(sin))
+    # Every great circle joins antipodes, pick the one towards the axis least aligned with p.
+    antipodal = (sin <= eps) & (cos < 0)
+    if antipodal.any():
+      axis = torch.nn.functional.one_hot(torch.argmin(torch.abs(p), dim=-1), p.shape[-1]).to(p)
+      u = axis - torch.sum(axis * p, dim=-1, keepdim=True) * p
+      v = torch.where(antipodal, np.pi * u / torch.norm(u, dim=-1, keepdim=True), v)
+    return v
+
+  def exp_map(self, p, v):
+    # Points reached from p along great circles of tangent vectors v. (B, dim) x (B, dim) -> (B, dim)
+    n = torch.norm(v, dim=-1, keepdim=True)
+    eps = torch.finfo(p.dtype).eps
+    sinc = torch.where(n > eps, torch.sin(n) / torch.clamp(n, min=eps), torch.ones_like(n))
+    q = torch.cos(n) * p + sinc * v
+    return q / torch.norm(q, dim=-1, keepdim=True) # no drift off the sphere over repeated updates
+
+  def slerp(self, p, q, alpha):
+    # Great circle interpolation with weights alpha of q. (B, dim) x (B, dim) x (B,) -> (B, dim)
+    # https://en.wikipedia.org/wiki/Slerp#Geometric_Slerp
+    return self.exp_map(p, alpha.unsqueeze(-1) * self.log_map(p, q))
 
   def interpolate(self, p, q, alpha):
-    # Computer graphics people already solved this to interpolate rotatations.
-    # https://en.wikipedia.org/wiki/Slerp#Geometric_Slerp
-    return torch.tensor(geometric_slerp(p, q, alpha), dtype=torch.float32)
+    # Keeps the precision of p, q is promoted to it. Integer points fall back to the default float.
+    p = torch.as_tensor(p)
+    p = p if p.is_floating_point() else p.to(torch.get_default_dtype())
+    q = torch.as_tensor(q, dtype=p.dtype)
+    return self.slerp(p.unsqueeze(0), q.unsqueeze(0), torch.tensor([alpha], dtype=p.dtype))[0]
+
+  def interpolate_batch(self, p, q, alpha):
+    if p.dim() != 2 or p.shape != q.shape or alpha.shape != p.shape[:1]:
+      raise ValueError("Tensors must be of shape (B, dim), (B, dim) and (B,)")
+    return self.slerp(p, q, alpha.to(p))
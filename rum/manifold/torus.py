@@ -2,6 +2,7 @@ import numpy as np
 from scipy.stats import vonmises
 from scipy.stats.sampling import SimpleRatioUniforms
 from .manifold import Manifold, GlobalChartAtlas
+from .geodesic import GeodesicEngine
 
 def torus_uniform_outer_angle_pdf(x, R, r):
   return (R + r * (1.0 + np.cos(x))) / (2.0 * np.pi * (R + r))
@@ -34,6 +35,13 @@ class TorusManifold(Manifold):
       None # TODO.
     )
 
+    self.geodesics = GeodesicEngine(
+      'torus', self.map, self.inverse_map,
+      domain=[(-np.pi, np.pi), (-np.pi, np.pi)],
+      periodic=[True, True],
+      params={'R': self.R, 'r': self.r}
+    )
+
   def retraction(self, p, v):
     v = self.normalize(p, v)
     xi = self.map(p)
@@ -42,28 +50,26 @@ class TorusManifold(Manifold):
     xi = standardize(xi) 
     return self.inverse_map(xi)
 
-  def starting_state(self):
+  def starting_state(self, rng=None):
     #local = np.zeros(self.manifold_dim) 
-    local = [np.random.uniform(-np.pi, np.pi), 0]
+    rng = np.random if rng is None else rng
+    local = [rng.uniform(-np.pi, np.pi), 0]
     return self.inverse_map(local)
 
   def pdf(self, p):
     # Uniform.
     if self.sampler['name'] == 'uniform':
-      point_is_on_manifold = True # TODO. Implement.
-      if point_is_on_manifold:
-        # Points on "inside" of circle around 1-d hole are less likely.
-        xi = self.map(p)         
-        pdf_0 = 1.0 / (2.0 * np.pi)
-        pdf_1 = torus_uniform_outer_angle_pdf(xi[1], self.R, self.r)
-        return pdf_0 * pdf_1
-      else:
-        return 0.0
+      # TODO. Points are assumed to be on the manifold.
+      # Points on "inside" of circle around 1-d hole are less likely.
+      xi = self.map(p)
+      pdf_0 = 1.0 / (2.0 * np.pi)
+      pdf_1 = torus_uniform_outer_angle_pdf(xi[..., 1], self.R, self.r)
+      return pdf_0 * pdf_1
     elif self.sampler['name'] == 'bivariate_vonmises':
       # We use the cosine variant with no correlation between the two angles.
       xi = self.map(p)
-      pdf_0 = vonmises.pdf(loc=self.sampler['mu'][0], kappa=self.sampler['kappa'][0], x=xi[0])
-      pdf_1 = vonmises.pdf(loc=self.sampler['mu'][1], kappa=self.sampler['kappa'][1], x=xi[1])
+      pdf_0 = vonmises.pdf(loc=self.sampler['mu'][0], kappa=self.sampler['kappa'][0], x=xi[..., 0])
+      pdf_1 = vonmises.pdf(loc=self.sampler['mu'][1], kappa=self.sampler['kappa'][1], x=xi[..., 1])
       return pdf_0 * pdf_1
     else:
       raise ValueError(f'Unknown sampler: {self.sampler["name"]}')
@@ -75,12 +81,12 @@ class TorusManifold(Manifold):
       dist = TorusUniformOuterAngleDist(self.R, self.r) 
       uniform = SimpleRatioUniforms(dist, mode=0.0, domain=[-np.pi, np.pi])
       xi[:, 1] = uniform.rvs(n)
-      return np.apply_along_axis(self.inverse_map, 1, xi)
+      return self.inverse_map(xi)
     elif self.sampler['name'] == 'bivariate_vonmises':
       xi = np.zeros([n, self.manifold_dim])
       xi[:, 0] = vonmises(loc=self.sampler['mu'][0], kappa=self.sampler['kappa'][0]).rvs(n)
       xi[:, 1] = vonmises(loc=self.sampler['mu'][1], kappa=self.sampler['kappa'][1]).rvs(n)
-      return np.apply_along_axis(self.inverse_map, 1, xi)
+      return self.inverse_map(xi)
     else: 
       raise ValueError(f'Unknown sampler: {self.sampler["name"]}')
 
@@ -92,26 +98,40 @@ class TorusManifold(Manifold):
     local_points[1] = np.linspace(-np.pi, np.pi, n_per_dim)
     local_mesh = np.meshgrid(*local_points)
     local_mesh = np.reshape(local_mesh, [self.manifold_dim, -1]).T
-    mesh = np.stack([self.inverse_map(local_point) for local_point in local_mesh])
-    return mesh 
+    return self.inverse_map(local_mesh)
 
   def metric_tensor(self, p):
     xi = self.map(p)
-    return np.array([
-      [(self.R + self.r * np.cos(xi[1])) ** 2, 0.0],
-      [0.0, self.r ** 2]
-    ])
+    metric = np.zeros(xi.shape[:-1] + (2, 2))
+    metric[..., 0, 0] = (self.R + self.r * np.cos(xi[..., 1])) ** 2
+    metric[..., 1, 1] = self.r ** 2
+    return metric
+
+  def distance_function(self, p, q):
+    return self.geodesics.distance_function(p, q)
+
+  def distance_matrix(self, p, q):
+    return self.geodesics.distance_matrix(p, q)
+
+  def interpolate(self, p, q, alpha):
+    return self.geodesics.interpolate(p, q, alpha)
+
+  def interpolate_batch(self, p, q, alpha):
+    return self.geodesics.interpolate_batch(p, q, alpha)
 
   def implicit_function(self, p):
     return np.sqrt(self.r ** 2 - (np.sqrt(p[0] ** 2 + p[1] ** 2) - self.R) ** 2)
 
+  # Maps take (3,) or (N, 3) points and (2,) or (N, 2) angles.
   def map(self, p):
-    xi_0 = np.arctan2(p[1], p[0])
-    xi_1 = np.arctan2(p[2], np.sqrt(p[0] ** 2 + p[1] ** 2) - self.R)
-    return np.array([xi_0, xi_1])
+    p = np.asarray(p)
+    xi_0 = np.arctan2(p[..., 1], p[..., 0])
+    xi_1 = np.arctan2(p[..., 2], np.sqrt(p[..., 0] ** 2 + p[..., 1] ** 2) - self.R)
+    return np.stack([xi_0, xi_1], axis=-1)
 
   def inverse_map(self, xi):
-    p_0 = (self.R + self.r * np.cos(xi[1])) * np.cos(xi[0])
-    p_1 = (self.R + self.r * np.cos(xi[1])) * np.sin(xi[0])
-    p_2 = self.r * np.sin(xi[1])
-    return np.array([p_0, p_1, p_2])
+    xi = np.asarray(xi)
+    p_0 = (self.R + self.r * np.cos(xi[..., 1])) * np.cos(xi[..., 0])
+    p_1 = (self.R + self.r * np.cos(xi[..., 1])) * np.sin(xi[..., 0])
+    p_2 = self.r * np.sin(xi[..., 1])
+    return np.stack([p_0, p_1, p_2], axis=-1)
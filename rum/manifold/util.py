@@ -1,8 +1,9 @@
 import numpy as np
 
-def sphere_sample_uniform(dim, n=1):
+def sphere_sample_uniform(dim, n=1, rng=None):
   # Here, dim is the dimension of the sphere, not the ambient space.
-  x = np.random.normal(0, 1, (n, dim + 1))
+  rng = np.random if rng is None else rng
+  x = rng.normal(0, 1, (n, dim + 1))
   norm = np.linalg.norm(x, axis=1)
   x /= norm[:, None]
   return x
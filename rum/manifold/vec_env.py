@@ -0,0 +1,78 @@
+import warnings
+import numpy as np
+import gymnasium
+from .manifold import GeodesicManifold
+from .util import sphere_sample_uniform
+
+class ManifoldVecEnv(gymnasium.vector.VectorEnv):
+  # Copies of a manifold environment stepped in batch in the current process, states held in one
+  # (num_envs, dim) array. Wraps a Manifold, or a GeodesicManifold whose velocities are rotated
+  # and parallel transported in batch as well. Episodes never end, as for a single manifold.
+  def __init__(self, manifold, num_envs):
+    super(ManifoldVecEnv, self).__init__(num_envs, manifold.observation_space, manifold.action_space)
+    self.env = manifold
+    self.geodesic = isinstance(manifold, GeodesicManifold)
+    self.manifold = manifold.base_object if self.geodesic else manifold
+    self.rng = np.random.default_rng()
+    self.states = np.zeros((num_envs, self.manifold.dim))
+    self.velocities = sphere_sample_uniform(self.manifold.manifold_dim - 1, num_envs, self.rng) if self.geodesic else None
+    self.actions = None
+
+  def reset_wait(self, seed=None, options=None):
+    # Seeds the vec env's own generator, from all seeds if one is given per environment,
+    # the global NumPy random state is left untouched.
+    if seed is not None:
+      self.rng = np.random.default_rng(seed if np.isscalar(seed) else [int(s) for s in seed])
+    self.states = np.stack([self.manifold.starting_state(self.rng) for _ in range(self.num_envs)]).astype(np.float64)
+    return self.states.copy(), {}
+
+  def step_async(self, actions):
+    self.actions = np.asarray(actions, dtype=np.float64)
+
+  def step_wait(self, **kwargs):
+    previous_states = self.states
+    if self.geodesic: # Action is rotation and thrust, see GeodesicManifold.step.
+      self.velocities = self.rotate(self.velocities, self.actions[:, 1])
+      moves = self.velocities * self.actions[:, :1]
+    else:
+      moves = self.actions
+    states = self.manifold.manifold_step(previous_states, moves, self.manifold.max_step_size)
+    self.states = np.clip(states, self.single_observation_space.low, self.single_observation_space.high)
+    if self.geodesic:
+      self.velocities = self.parallel_transport(previous_states, self.states, self.velocities)
+
+    rewards = np.zeros(self.num_envs)
+    terminated = np.zeros(self.num_envs, dtype=bool)
+    truncated = np.zeros(self.num_envs, dtype=bool)
+    return self.states.copy(), rewards, terminated, truncated, {}
+
+  def rotate(self, vectors, angles):
+    # Batched GeodesicManifold.rotate, (N, 2) vectors by (N,) angles.
+    cos, sin = np.cos(angles), np.sin(angles)
+    return np.stack([cos * vectors[:, 0] - sin * vectors[:, 1], sin * vectors[:, 0] + cos * vectors[:, 1]], axis=-1)
+
+  def parallel_transport(self, previous_states, states, vectors):
+    # Identity in coordinate bases within a chart, only environments that changed chart are transported.
+    atlas = self.manifold.atlas
+    changed = atlas.get_chart_indices(previous_states) != atlas.get_chart_indices(states)
+    changed &= np.any(vectors != 0, axis=-1)
+    vectors = vectors.copy()
+    for i in np.flatnonzero(changed):
+      vectors[i] = self.env.parallel_transport(previous_states[i], states[i], vectors[i])
+    return vectors
+
+  def call(self, name, *args, indices=None, **kwargs):
+    # The environments share one manifold, called once per environment at indices.
+    indices = range(self.num_envs) if indices is None else indices
+    attribute = getattr(self.env, name)
+    return tuple(attribute(*args, **kwargs) if callable(attribute) else attribute for _ in indices)
+
+  def get_attr(self, name, indices=None):
+    indices = range(self.num_envs) if indices is None else indices
+    return tuple(getattr(self.env, name) for _ in indices)
+
+  def set_attr(self, name, values, indices=None):
+    # The environments share one manifold, setting an attribute for some of them sets it for all.
+    if indices is not None and sorted(set(int(i) for i in indices)) != list(range(self.num_envs)):
+      warnings.warn("Environments share one manifold, attribute {!r} is set for all of them".format(name))
+    setattr(self.env, name, values[0] if isinstance(values, (list, tuple)) else values)
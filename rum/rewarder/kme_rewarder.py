@@ -44,25 +44,25 @@ class KMERewarder(Rewarder):
         if not isinstance(states, Tensor):
             raise ValueError("States must be of shape (B, dim_states)")
 
-        def reward_entropy(state: Tensor) -> FloatTensor:
-            diameters = self.kmeans.simulate_step(state)
-            entropy_lb = self.kmeans.entropy_lb(diameters)
+        def reward_entropy(states: Tensor) -> FloatTensor:
+            # Batched counterfactual steps, only changed diameters are evaluated.
+            entropy_lb_delta = self.kmeans.simulate_entropy_delta(states)
             if self.differential:
-                entropy_lb_before = self.kmeans.entropy_lb(self.kmeans.diameters)
-                return entropy_lb - entropy_lb_before
-            return entropy_lb
+                return entropy_lb_delta
+            return entropy_lb_delta + self.kmeans.entropy()
 
         def reward_information(state: Tensor) -> FloatTensor:
             diameters = self.kmeans.diameters
             information = self.kmeans.information(state, diameters)
             return information
 
+        if form == "entropy":
+            return reward_entropy(states)  # shape: (B,)
+
         rewards = torch.zeros(states.size(0))  # shape: (B,)
 
         for i, state in enumerate(states):
-            if form == "entropy":
-                rewards[i] = reward_entropy(state)
-            elif form == "information":
+            if form == "information":
                 rewards[i] = reward_information(state)
             else:
                 raise ValueError("form must be either 'entropy' or 'information'")
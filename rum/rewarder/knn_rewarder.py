@@ -53,24 +53,24 @@ class KNNRewarder(Rewarder):
         if not isinstance(states, Tensor):
             raise ValueError("States must be of shape (B, dim_states)")
         
-        def reward_entropy(state: Tensor) -> FloatTensor:
-            distances = self.knn.simulate_step(state)
-            entropy_approx = self.knn.entropy_approx(distances)
+        def reward_entropy(states: Tensor) -> FloatTensor:
+            # Batched counterfactual insertions, only changed neighbour lists are evaluated.
+            entropy_approx_delta = self.knn.simulate_entropy_delta(states)
             if self.rewarder_params.differential:
-                entropy_approx_before = self.knn.entropy_approx()
-                return entropy_approx - entropy_approx_before
-            return entropy_approx            
+                return entropy_approx_delta
+            return entropy_approx_delta + self.knn.entropy_approx()
         
         def reward_information(state: Tensor) -> FloatTensor:
             information = self.knn.information(state)
             return information
 
+        if form == 'entropy':
+            return reward_entropy(states) # shape: (B,)
+
         rewards = torch.zeros(states.size(0)) # shape: (B,)
 
         for i, state in enumerate(states):
-            if form == 'entropy':
-                rewards[i] = reward_entropy(state)
-            elif form == 'information':
+            if form == 'information':
                 rewards[i] = reward_information(state)
             else:
                 raise ValueError("form must be either 'entropy' or 'information'")